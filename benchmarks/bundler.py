@@ -0,0 +1,397 @@
+"""
+Benchmark the bundler on synthetic AutoML datasets.
+
+Every dataset is benchmarked in its own process, so the peak memory reported is
+the one of that dataset only. A challenge is made of the dataset, then the stages
+of `bundler.tasks' run one by one on it: split (generate_task_data), zip
+(gen_input_data and gen_reference_data), scoring (gen_scoring_program) and
+bundle_zip (save_archive). This needs the database of DJANGO_SETTINGS_MODULE.
+With --end-to-end, `bundler.tasks.bundle' also runs as a whole.
+
+Each stage reports its wall and CPU time, the peak memory of the process once
+it is over (the stages run one after the other, so it includes the earlier ones) and
+the peak disk usage of its temporary directory. The results are compared to
+the stored baseline, the command fails when one got worse than the tolerance.
+
+The baseline only holds for the Python version it was recorded with, the one
+stored in baseline.json. The timings are not compared on another version: record
+the baseline again with --save on the runtime of the deployment.
+
+Usage:
+    python -m benchmarks.bundler [--rows 1e3 1e5] [--cols 10 1000] [--kind dense sparse]
+                                 [--end-to-end] [--save] [--tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from benchmarks import datasets
+from bundler.instrument import measure
+from chalab.tools import archives, fs
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+DEFAULT_ROWS = [10 ** 3, 10 ** 4, 10 ** 5]
+DEFAULT_COLS = [10, 100]
+DEFAULT_KINDS = ['dense', 'sparse']
+
+# Measures compared to the baseline, and the difference under which they are noise.
+COMPARED = {'wall': 0.05, 'process_peak_rss': 16 * 1024 * 1024, 'tmp_disk': 1024 * 1024}
+
+Metric = namedtuple('Metric', ['name', 'description', 'code'])
+METRIC = Metric('benchmark', 'Benchmark metric',
+                'def benchmark_metric(solution, prediction, task):\n    return 0\n')
+
+
+class Stats(object):
+    """Collects the measures of `bundler.instrument.measure', like a bundle task."""
+
+    def __init__(self):
+        self.stats = {}
+
+    def record_stats(self, name, values):
+        self.stats[name] = values
+
+
+class DiskSampler(threading.Thread):
+    """Sample the size of `root' in the background, keep the largest."""
+
+    def __init__(self, root, interval=0.05):
+        super().__init__(daemon=True)
+        self.root = root
+        self.interval = interval
+        self.peak = 0
+        self._done = threading.Event()
+
+    def sample(self):
+        try:
+            self.peak = max(self.peak, archives.dir_size(self.root))
+        except FileNotFoundError:
+            pass  # a file went away during the walk, next sample will do.
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.sample()
+
+
+@contextmanager
+def measured(stats, name, tmp):
+    """`measure' the block, adding the peak disk usage of `tmp' while it ran."""
+    sampler = DiskSampler(tmp)
+    sampler.start()
+
+    try:
+        with measure(stats, name) as m:
+            yield m
+    finally:
+        sampler.stop()
+
+    stats.stats[name]['tmp_disk'] = sampler.peak
+
+
+@contextmanager
+def bundler_env(work, workers=1):
+    """
+    Set up django, the bundler writes its files under `work': the media in
+    `work'/media, its temporary directories in `work'/tmp. The cache is off
+    to measure the work done from scratch.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'instances.local')
+
+    import django
+    django.setup()
+
+    from django.test.utils import override_settings
+
+    media, tmp = os.path.join(work, 'media'), os.path.join(work, 'tmp')
+    fs.mkdir(media)
+    fs.mkdir(tmp)
+
+    with override_settings(MEDIA_ROOT=media, BUNDLER_CACHE_DIR=None, BUNDLER_WORKERS=workers):
+        tempfile.tempdir = tmp
+        try:
+            yield
+        finally:
+            tempfile.tempdir = None
+
+
+def run_stages(data_dir, work):
+    """Run the stages of `bundler.tasks' one by one, on a challenge made of `data_dir'."""
+    stats = Stats()
+
+    with bundler_env(work):
+        from bundler import tasks
+        from bundler.models import BundleTaskModel
+        from bundler.progress import Progress
+
+        c = make_challenge(data_dir)
+        try:
+            bt, progress = BundleTaskModel.create(c), Progress()
+
+            bundle_dir = os.path.join(work, 'bundle')
+            fs.mkdir(bundle_dir)
+
+            with measured(stats, 'split', work) as m:
+                tasks.generate_task_data(bt, c, progress)
+                m['bytes_in'] = archives.dir_size(data_dir)
+
+            task = c.task
+            with measured(stats, 'zip', work) as m:
+                tasks.gen_input_data(bt, bundle_dir, task, progress)
+                tasks.gen_reference_data(bt, bundle_dir, task, task.target_valid,
+                                         '_valid.solution', 1, progress)
+                tasks.gen_reference_data(bt, bundle_dir, task, task.target_test,
+                                         '_test.solution', 2, progress)
+                m['bytes_out'] = archives.dir_size(bundle_dir)
+
+            with measured(stats, 'scoring', work) as m:
+                a = tasks.gen_scoring_program(bt, bundle_dir, c.metric)
+                m['bytes_out'] = os.path.getsize(os.path.join(bundle_dir, a))
+
+            with measured(stats, 'bundle_zip', work) as m:
+                m['bytes_in'] = archives.dir_size(bundle_dir)
+                tasks.save_archive(bt, bundle_dir, c, bt, progress)
+                m['bytes_out'] = bt.output.size
+        finally:
+            delete_challenge(c)
+
+    return stats.stats
+
+
+def make_challenge(data_dir):
+    from datetime import date
+
+    from django.contrib.auth.models import User
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    from wizard import models
+
+    name = os.path.basename(data_dir)
+    user = User.objects.create_user(username='benchmark_%s_%s' % (name, os.getpid()),
+                                    password='benchmark')
+
+    # The dataset has to be more recent than the challenge, or the split is skipped.
+    c = models.ChallengeModel.objects.create(created_by=user, title='benchmark %s' % name,
+                                             description=name, organization_name='benchmark')
+    c.documentation = models.DocumentationModel.create(render_for=c)
+    c.dataset = models.DatasetModel.create_from_chalearn(data_dir, name, is_public=False)
+    c.create_initial_task()
+
+    c.metric = models.MetricModel.objects.create(owner=None, is_public=False,
+                                                 name=METRIC.name, code=METRIC.code,
+                                                 description=METRIC.description,
+                                                 is_ready=True, classification=True)
+    c.protocol = models.ProtocolModel.objects.create(is_ready=True,
+                                                     dev_start_date=date.today(),
+                                                     final_start_date=date.today())
+    c.baseline = models.BaselineModel.objects.create(
+        submission=SimpleUploadedFile(name='baseline', content=b'0000'))
+    c.save()
+
+    assert c.is_ready, 'benchmark challenge is missing: %s' % c.missings
+    return c
+
+
+def delete_challenge(c):
+    user, dataset, task = c.created_by, c.dataset, c.task
+    others = [c.metric, c.protocol, c.baseline, c.documentation]
+
+    c.delete()
+    task.delete()
+    dataset.delete()
+    for x in others:
+        x.delete()
+    user.delete()
+
+
+def run_end_to_end(data_dir, work, workers):
+    stats = Stats()
+
+    with bundler_env(work, workers):
+        from bundler import tasks
+        from bundler.models import BundleTaskModel
+
+        with measured(stats, 'ingest', work) as m:
+            c = make_challenge(data_dir)
+            m['bytes_in'] = archives.dir_size(data_dir)
+
+        try:
+            bt = BundleTaskModel.create(c)
+
+            with measured(stats, 'bundle', work) as m:
+                tasks.bundle(bt)
+
+            bt.refresh_from_db()
+            assert bt.state == bt.FINISHED, 'bundle ended %s' % bt.state
+
+            m['bytes_out'] = bt.output.size
+            for stage, values in bt.stats_dict.items():
+                stats.stats['bundle/%s' % stage] = values
+        finally:
+            delete_challenge(c)
+
+    return stats.stats
+
+
+def run_case(case):
+    """Run a benchmark case in the current process, return its stats by stage."""
+    with fs.tmp_dir() as d:
+        data_dir = datasets.generate(d, case['rows'], case['cols'],
+                                     sparse=case['sparse'], density=case['density'])
+
+        work = os.path.join(d, 'work')
+        fs.mkdir(work)
+        r = run_stages(data_dir, work)
+
+        if case['end_to_end']:
+            work = os.path.join(d, 'end_to_end')
+            fs.mkdir(work)
+            r.update(run_end_to_end(data_dir, work, case['workers']))
+
+    return r
+
+
+def spawn_case(case):
+    """Run a benchmark case in a fresh process."""
+    out = subprocess.check_output([sys.executable, '-m', 'benchmarks.bundler',
+                                   '--case', json.dumps(case)])
+    return json.loads(out.decode('utf-8').splitlines()[-1])
+
+
+def same_python(version):
+    return version.split('.')[:2] == platform.python_version_tuple()[:2]
+
+
+def load_baseline(path):
+    """Return the baseline results, none if they were recorded on another Python."""
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, 'r') as f:
+        data = json.load(f)
+
+    if not same_python(data['python']):
+        print('The baseline was recorded on Python %s, not compared on Python %s'
+              % (data['python'], platform.python_version()), file=sys.stderr)
+        return {}
+
+    return data['results']
+
+
+def rounded(results):
+    return {case: {stage: {k: round(v, 4) if isinstance(v, float) else v
+                           for k, v in values.items()}
+                   for stage, values in stages.items()}
+            for case, stages in results.items()}
+
+
+def save_baseline(path, results):
+    data = {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': dict(load_baseline(path), **rounded(results))}
+
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def regressions(results, baseline, tolerance):
+    """Return the (case, stage, measure, baseline value, value) that got worse."""
+    r = []
+
+    for case, stages in sorted(results.items()):
+        for stage, values in sorted(stages.items()):
+            base = baseline.get(case, {}).get(stage)
+            if base is None:
+                continue
+
+            for k, noise in sorted(COMPARED.items()):
+                if k not in values or k not in base:
+                    continue
+                if values[k] > base[k] * (1 + tolerance) and values[k] - base[k] > noise:
+                    r.append((case, stage, k, base[k], values[k]))
+
+    return r
+
+
+def mb(n):
+    return n / (1024.0 * 1024.0)
+
+
+def print_case(case, stages, baseline):
+    for stage in stages:
+        v = stages[stage]
+        base = baseline.get(case, {}).get(stage, {}).get('wall')
+        ratio = '%7.2fx' % (v['wall'] / base) if base else '%8s' % '-'
+
+        print('%-24s %-36s %9.3f %9.3f %9.1f %9.1f %s'
+              % (case, stage, v['wall'], v['cpu'], mb(v['process_peak_rss']),
+                 mb(v.get('tmp_disk', 0)), ratio))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bundler')
+    parser.add_argument('--rows', nargs='+', type=float, default=DEFAULT_ROWS)
+    parser.add_argument('--cols', nargs='+', type=int, default=DEFAULT_COLS)
+    parser.add_argument('--kind', nargs='+', choices=DEFAULT_KINDS, default=DEFAULT_KINDS)
+    parser.add_argument('--density', type=float, default=0.01,
+                        help='ratio of non-zero values in the sparse datasets')
+    parser.add_argument('--end-to-end', action='store_true',
+                        help='also run bundler.tasks.bundle, needs a database')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='BUNDLER_WORKERS for the end to end runs')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='slowdown ratio over the baseline reported as a regression')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+
+    print('%-24s %-36s %9s %9s %9s %9s %8s'
+          % ('case', 'stage', 'wall (s)', 'cpu (s)', 'rss (MB)', 'tmp (MB)', 'baseline'))
+
+    for kind in args.kind:
+        for cols in args.cols:
+            for rows in args.rows:
+                case = {'rows': int(rows), 'cols': cols, 'sparse': kind == 'sparse',
+                        'density': args.density, 'end_to_end': args.end_to_end,
+                        'workers': args.workers}
+                name = datasets.name_of(case['rows'], cols, case['sparse'])
+
+                results[name] = spawn_case(case)
+                print_case(name, results[name], baseline)
+
+    if args.save:
+        save_baseline(args.baseline, results)
+        print('Saved the baseline to: %s' % args.baseline)
+        return 0
+
+    worse = regressions(results, baseline, args.tolerance)
+    for case, stage, k, before, after in worse:
+        print('REGRESSION %s %s %s: %.3f -> %.3f' % (case, stage, k, before, after))
+
+    return 1 if worse else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,60 @@
+"""
+Generate synthetic datasets in the AutoML format: `name.data', `name.solution'
+and `name_public.info' in a directory called `name'.
+
+The rows are drawn from a pool of random lines, seeded so the same arguments
+always produce the same files.
+"""
+import os
+import random
+
+POOL_SIZE = 1024
+CHUNK_ROWS = 10000
+
+
+def name_of(rows, cols, sparse):
+    return '%s_%dx%d' % ('sparse' if sparse else 'dense', rows, cols)
+
+
+def dense_line(rand, cols):
+    return ' '.join('%.4f' % rand.random() for _ in range(cols)) + '\n'
+
+
+def sparse_line(rand, cols, density):
+    nnz = max(1, int(cols * density))
+    indices = sorted(rand.sample(range(1, cols + 1), nnz))
+    return ' '.join('%d:%.4f' % (i, rand.random()) for i in indices) + '\n'
+
+
+def write_rows(path, rows, pool, rand):
+    pool = [x.encode('ascii') for x in pool]
+
+    with open(path, 'wb') as f:
+        for start in range(0, rows, CHUNK_ROWS):
+            f.writelines(rand.choices(pool, k=min(CHUNK_ROWS, rows - start)))
+
+
+def generate(root, rows, cols, sparse=False, density=0.01, seed=0):
+    """Write the dataset to `root', return its directory."""
+    rand = random.Random(seed)
+    name = name_of(rows, cols, sparse)
+
+    d = os.path.join(root, name)
+    os.makedirs(d, exist_ok=True)
+
+    if sparse:
+        pool = [sparse_line(rand, cols, density) for _ in range(POOL_SIZE)]
+    else:
+        pool = [dense_line(rand, cols) for _ in range(POOL_SIZE)]
+
+    write_rows(os.path.join(d, name + '.data'), rows, pool, rand)
+    write_rows(os.path.join(d, name + '.solution'), rows, ['0\n', '1\n'], rand)
+
+    with open(os.path.join(d, name + '_public.info'), 'w') as f:
+        f.write("name = '%s'\n" % name)
+        f.write("task = 'binary.classification'\n")
+        f.write("metric = 'auc_metric'\n")
+        f.write("feat_num = %d\n" % cols)
+        f.write("is_sparse = %d\n" % sparse)
+
+    return d
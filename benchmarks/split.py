@@ -0,0 +1,58 @@
+"""
+Time the train/valid/test split used by the bundler on synthetic files.
+
+Usage: python -m benchmarks.split [rows ...]
+"""
+import os
+import sys
+import time
+
+from chalab.tools import fs, split
+
+DEFAULT_ROWS = [10 ** 4, 10 ** 6, 10 ** 7]
+
+
+def make_file(path, rows, line):
+    with open(path, 'wb') as f:
+        block = line * 10000
+        for _ in range(rows // 10000):
+            f.write(block)
+        f.write(line * (rows % 10000))
+
+
+def run(rows):
+    with fs.tmp_dir() as d:
+        input, target = os.path.join(d, 'x.data'), os.path.join(d, 'x.solution')
+        make_file(input, rows, b'0.1 0.2 0.3 0.4 0.5 0.6 0.7 0.8\n')
+        make_file(target, rows, b'1\n')
+
+        start = time.perf_counter()
+        labels = split.assignment(rows, int(rows * 0.6), int(rows * 0.2))
+        assigned = time.perf_counter()
+
+        names = ['train', 'valid', 'test']
+        with open(input, 'rb') as fi, open(target, 'rb') as ft:
+            outputs = [(open(os.path.join(d, n + '.data'), 'wb'),
+                        open(os.path.join(d, n + '.solution'), 'wb'))
+                       for n in names]
+            try:
+                split.split_lines(labels, fi, ft, outputs)
+            finally:
+                for o in outputs:
+                    o[0].close(), o[1].close()
+        done = time.perf_counter()
+
+    return assigned - start, done - assigned
+
+
+def main(argv):
+    rows = [int(float(x)) for x in argv] or DEFAULT_ROWS
+
+    print('%12s %12s %12s %14s' % ('rows', 'assign (s)', 'split (s)', 'rows/s'))
+    for r in rows:
+        a, s = run(r)
+        print('%12d %12.3f %12.3f %14.0f' % (r, a, s, r / (a + s)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import shutil
+import threading
+from tempfile import NamedTemporaryFile
+
+
+def digest(*parts):
+    """Return the sha256 of the given strings or bytes, in order."""
+    h = hashlib.sha256()
+
+    for p in parts:
+        if isinstance(p, str):
+            p = p.encode('utf-8')
+        h.update(hashlib.sha256(p).digest())
+
+    return h.hexdigest()
+
+
+def _link_or_copy(src, dest):
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+class ArtifactCache(object):
+    """
+    A directory of generated files, stored under the digest of their inputs.
+
+    Files used recently are kept first: once the cache grows over `budget' bytes,
+    the least recently used ones are removed.
+    """
+
+    def __init__(self, root, budget):
+        self.root = root
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key, dest):
+        """Copy the file cached for `key' to `dest', return whether it was found."""
+        p = self.path(key)
+
+        try:
+            _link_or_copy(p, dest)
+            os.utime(p)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key, src):
+        """Store a copy of the file `src' for `key'."""
+        with NamedTemporaryFile(dir=self.root, prefix='.tmp', delete=False) as f:
+            tmp = f.name
+
+        try:
+            os.remove(tmp)
+            _link_or_copy(src, tmp)
+            os.replace(tmp, self.path(key))
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        self.evict()
+
+    def entries(self):
+        r = []
+
+        for name in os.listdir(self.root):
+            if name.startswith('.tmp'):
+                continue
+            try:
+                st = os.stat(self.path(name))
+            except FileNotFoundError:
+                continue  # evicted concurrently
+            r.append((st.st_mtime, st.st_size, name))
+
+        return r
+
+    def evict(self):
+        """Remove the least recently used files until the cache fits in its budget."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, name in entries:
+            if total <= self.budget:
+                break
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def __str__(self):
+        return '%s hits, %s misses' % (self.hits, self.misses)
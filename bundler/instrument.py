@@ -0,0 +1,59 @@
+import math
+import os
+import resource
+import time
+from contextlib import contextmanager
+
+
+def cpu_time():
+    """CPU time of the current thread when the platform tells, of the process otherwise."""
+    if hasattr(time, 'thread_time'):
+        return time.thread_time()
+    if hasattr(resource, 'RUSAGE_THREAD'):
+        r = resource.getrusage(resource.RUSAGE_THREAD)
+        return r.ru_utime + r.ru_stime
+    return time.process_time()
+
+
+def process_peak_rss():
+    """Peak resident memory of the process since it started, in bytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def file_size(*paths):
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+
+@contextmanager
+def measure(bt, name):
+    """
+    Measure the wall and CPU time of the block, then record them on the bundle task
+    under `name' along with the memory.
+
+    The memory is the peak of the process, which the block only raises: `peak_rss_increase'
+    is how much it did, 0 when the block stayed under an earlier peak. `process_peak_rss'
+    is the peak of the whole process once the block is over.
+
+    The block can fill in the `bytes_in' and `bytes_out' it processed in the yielded dict.
+    """
+    m = {'bytes_in': 0, 'bytes_out': 0}
+    wall, cpu, peak = time.monotonic(), cpu_time(), process_peak_rss()
+
+    yield m
+
+    m['wall'] = time.monotonic() - wall
+    m['cpu'] = cpu_time() - cpu
+    m['process_peak_rss'] = process_peak_rss()
+    m['peak_rss_increase'] = m['process_peak_rss'] - peak
+
+    bt.record_stats(name, m)
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of `values', `p' in [0, 100]."""
+    values = sorted(values)
+    if not values:
+        return None
+
+    k = max(math.ceil(p / 100.0 * len(values)) - 1, 0)
+    return values[min(k, len(values) - 1)]
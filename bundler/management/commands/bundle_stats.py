@@ -0,0 +1,50 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from bundler.instrument import percentile
+from bundler.models import BundleTaskModel
+
+PERCENTILES = (50, 90, 99)
+MEASURES = ('wall', 'cpu', 'bytes_in', 'bytes_out', 'peak_rss_increase', 'process_peak_rss')
+
+
+def aggregate(bundle_tasks):
+    """Return {stage: {measure: [values, ...]}} over the given bundle tasks."""
+    r = defaultdict(lambda: defaultdict(list))
+
+    for b in bundle_tasks:
+        for stage, values in b.stats_dict.items():
+            for k in MEASURES:
+                if values.get(k) is not None:
+                    r[stage][k].append(values[k])
+
+    return r
+
+
+class Command(BaseCommand):
+    help = 'Report the percentile timings of each stage over the recent bundle builds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--last', type=int, default=100,
+                            help='number of recent finished builds to look at')
+        parser.add_argument('--measure', choices=MEASURES, default='wall')
+
+    def handle(self, *args, **options):
+        builds = BundleTaskModel.objects.filter(state=BundleTaskModel.FINISHED)
+        builds = builds.order_by('-created')[:options['last']]
+        stats = aggregate(builds)
+        measure = options['measure']
+
+        header = ['stage', 'count'] + ['p%s' % p for p in PERCENTILES] + ['max']
+        self.stdout.write('%-32s %6s' % tuple(header[:2]) +
+                          ''.join(' %12s' % x for x in header[2:]))
+
+        for stage in sorted(stats):
+            values = stats[stage][measure]
+            if not values:
+                continue
+
+            row = [percentile(values, p) for p in PERCENTILES] + [max(values)]
+            self.stdout.write('%-32s %6d' % (stage, len(values)) +
+                              ''.join(' %12.3f' % x for x in row))
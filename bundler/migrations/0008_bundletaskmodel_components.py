@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 09:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bundler', '0007_auto_20170615_1936'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bundletaskmodel',
+            name='components',
+            field=models.TextField(default='{}'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 09:47
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bundler', '0008_bundletaskmodel_components'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bundletaskmodel',
+            name='progress_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bundletaskmodel',
+            name='progress_eta',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='bundletaskmodel',
+            name='progress_rate',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='bundletaskmodel',
+            name='progress_stage',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 10:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bundler', '0009_auto_20261018_0947'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='logmodel',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 10:58
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bundler', '0010_auto_20261018_1021'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bundletaskmodel',
+            name='stats',
+            field=models.TextField(default='{}'),
+        ),
+    ]
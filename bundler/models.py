@@ -1,7 +1,11 @@
+import json
+import threading
+import time
 from time import gmtime, strftime
 
 from django.core.files.storage import DefaultStorage
 from django.db import models
+from django.utils import timezone
 from django.utils.deconstruct import deconstructible
 
 from chalab.tools.storage import *
@@ -9,6 +13,9 @@ from wizard.models import ChallengeModel
 
 storage = DefaultStorage()
 
+# Buffered logs are written at least this often (seconds).
+LOG_FLUSH_INTERVAL = 2.0
+
 
 @deconstructible
 class StorageNameFactory(object):
@@ -44,7 +51,8 @@ class LogModel(models.Model):
 
     task = models.ForeignKey('BundleTaskModel', null=False, related_name='log_set')
 
-    created = models.DateTimeField(auto_now_add=True)
+    # Set when the message is logged, not when the buffered logs are written.
+    created = models.DateTimeField(default=timezone.now)
     level = models.IntegerField()
     message = models.TextField()
 
@@ -67,18 +75,85 @@ class BundleTaskModel(models.Model):
     challenge = models.ForeignKey(ChallengeModel, null=False)
     state = models.CharField(max_length=10, choices=STATE_CHOICES)
     progress_perc = models.IntegerField(default=0, null=False)
+    progress_stage = models.CharField(max_length=32, default='', blank=True)
+    progress_bytes = models.BigIntegerField(default=0, null=False)
+    progress_rate = models.FloatField(null=True)  # bytes per second
+    progress_eta = models.FloatField(null=True)  # seconds left
 
     created = models.DateTimeField(auto_now_add=True)
     closed = models.DateTimeField(null=True)
 
     output = models.FileField(null=True, storage=OverwriteStorage(), upload_to=save_to_bundle)
 
+    # JSON: the fingerprint of the inputs and the result of each bundle stage.
+    components = models.TextField(default='{}')
+    # JSON: the time, bytes processed and memory used by each bundle stage.
+    stats = models.TextField(default='{}')
+
     def __str__(self):
         return "<%s: challenge=%s, state=%s>" \
                % (type(self).__name__, self.challenge.title, self.get_state_display())
 
     def add_log(self, message, level=LogModel.INFO):
-        return LogModel.objects.create(task=self, level=level, message=message)
+        """
+        Buffer a log message, the buffer is written to the database
+        by `flush_logs', or once it is older than LOG_FLUSH_INTERVAL.
+        """
+        log = LogModel(task=self, level=level, message=message, created=timezone.now())
+
+        with self._lock:
+            buffer = self.__dict__.setdefault('_logs_buffer', [])
+            buffer.append(log)
+            flushed_at = self.__dict__.setdefault('_logs_flushed_at', time.monotonic())
+
+        if time.monotonic() - flushed_at >= LOG_FLUSH_INTERVAL:
+            self.flush_logs()
+
+        return log
+
+    def flush_logs(self):
+        """Write the buffered log messages, in a single query."""
+        with self._lock:
+            buffer = self.__dict__.get('_logs_buffer')
+            self._logs_buffer = []
+            self._logs_flushed_at = time.monotonic()
+
+        # Written out of the lock, the logs are ordered by their creation time.
+        if buffer:
+            LogModel.objects.bulk_create(buffer)
+
+    @property
+    def _lock(self):
+        """Guards the in-memory state shared by the bundler threads: logs buffer, stats."""
+        return self.__dict__.setdefault('_state_lock', threading.Lock())
+
+    def __reduce__(self):
+        # Tasks are pickled to go to celery, the lock stays in this process.
+        unpickle, args, data = super().__reduce__()
+        return unpickle, args, {k: v for k, v in data.items() if k != '_state_lock'}
+
+    @property
+    def components_dict(self):
+        return json.loads(self.components)
+
+    def record_stats(self, name, values):
+        """Store the measures of a stage, they are saved with the task."""
+        with self._lock:
+            stats = self.stats_dict
+            stats[name] = values
+            self.stats = json.dumps(stats)
+
+    @property
+    def stats_dict(self):
+        return json.loads(self.stats)
+
+    @property
+    def progress(self):
+        return {'perc': self.progress_perc,
+                'stage': self.progress_stage,
+                'bytes': self.progress_bytes,
+                'rate': self.progress_rate,
+                'eta': self.progress_eta}
 
     @property
     def is_download_ready(self):
@@ -91,13 +166,35 @@ class BundleTaskModel(models.Model):
                                   closed=None,
                                   output=None)
 
+    def cancel(self):
+        """
+        Mark the build as cancelled if it is still scheduled or running,
+        the bundler stops at its next progress report. Return whether it was.
+        """
+        cancelled = (type(self).objects
+                     .filter(pk=self.pk, state__in=[self.SCHEDULED, self.STARTED])
+                     .update(state=self.CANCELLED, closed=timezone.now()))
+
+        if cancelled:
+            self.refresh_from_db(fields=['state', 'closed'])
+        return bool(cancelled)
+
+    def save_unless_cancelled(self, *fields):
+        """
+        Write `fields' unless the build was cancelled meanwhile, return whether
+        they were. A full `save' would bring a cancelled build back.
+        """
+        running = type(self).objects.filter(pk=self.pk).exclude(state=self.CANCELLED)
+        return bool(running.update(**{f: getattr(self, f) for f in fields}))
+
     @property
     def done(self):
         return self.state in {self.FAILED, self.CANCELLED, self.FINISHED}
 
     @property
     def logs(self):
-        return self.log_set.order_by('created').all()
+        self.flush_logs()
+        return self.log_set.order_by('created', 'pk').all()
 
     class Meta:
         ordering = ['-created']
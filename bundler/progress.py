@@ -0,0 +1,135 @@
+import threading
+import time
+
+SAVE_INTERVAL = 2.0  # seconds
+
+
+class BuildCancelledException(Exception):
+    def __init__(self, msg):
+        self.message = msg
+
+
+class Progress(object):
+    """
+    Track how far a bundle build has got.
+
+    Each stage is weighted by the number of bytes it is expected to process, then
+    reports the bytes actually processed against its own total once it starts.
+    The state is saved on the bundle task at most every `interval' seconds.
+
+    Saving is also when a cancelled build is noticed: the long loops of the build
+    report their progress, they stop with a BuildCancelledException.
+    """
+
+    def __init__(self, bundle_task=None, interval=SAVE_INTERVAL, clock=time.monotonic):
+        self.bundle_task = bundle_task
+        self.interval = interval
+        self.clock = clock
+
+        self.weights = {}
+        self.totals = {}
+        self.processed = {}
+        self.stage = None
+
+        self._lock = threading.RLock()
+        self._started = clock()
+        self._saved = None
+
+    def plan(self, stage, expected_bytes):
+        with self._lock:
+            self.weights[stage] = max(expected_bytes, 1)
+
+    def start(self, stage, total_bytes):
+        with self._lock:
+            self.stage = stage
+            self.totals[stage] = max(total_bytes, 1)
+            self.processed.setdefault(stage, 0)
+        self.save()
+
+    def advance(self, stage, n):
+        with self._lock:
+            self.processed[stage] = self.processed.get(stage, 0) + n
+        self.save()
+
+    def update(self, stage, processed_bytes):
+        with self._lock:
+            self.processed[stage] = processed_bytes
+        self.save()
+
+    def finish(self, stage):
+        with self._lock:
+            self.totals.setdefault(stage, 1)
+            self.processed[stage] = self.totals[stage]
+        self.save(force=True)
+
+    def fraction(self, stage):
+        if stage not in self.totals:
+            return 0.0
+        return min(self.processed.get(stage, 0) / self.totals[stage], 1.0)
+
+    @property
+    def percent(self):
+        with self._lock:
+            total = sum(self.weights.values())
+            if not total:
+                return 0
+            done = sum(w * self.fraction(s) for s, w in self.weights.items())
+            return int(100 * done / total)
+
+    @property
+    def bytes(self):
+        with self._lock:
+            return sum(self.processed.values())
+
+    @property
+    def rate(self):
+        """Bytes processed per second, since the build started."""
+        elapsed = self.clock() - self._started
+        return self.bytes / elapsed if elapsed > 0 else None
+
+    @property
+    def eta(self):
+        """Estimated seconds left, assuming the remaining work goes at the same pace."""
+        p = self.percent
+        if p <= 0:
+            return None
+        elapsed = self.clock() - self._started
+        return elapsed * (100 - p) / p
+
+    def as_dict(self):
+        return {'perc': self.percent,
+                'stage': self.stage,
+                'bytes': self.bytes,
+                'rate': self.rate,
+                'eta': self.eta}
+
+    def check(self):
+        """Save right away, raise if the build was cancelled."""
+        self.save(force=True)
+
+    def save(self, force=False):
+        if self.bundle_task is None:
+            return
+
+        now = self.clock()
+        if not force and self._saved is not None and now - self._saved < self.interval:
+            return
+        self._saved = now
+
+        bt = self.bundle_task
+        bt.progress_perc = self.percent
+        bt.progress_stage = self.stage or ''
+        bt.progress_bytes = self.bytes
+        bt.progress_rate = self.rate
+        bt.progress_eta = self.eta
+
+        # Only touch the progress columns: the task itself is saved by the bundler.
+        running = type(bt).objects.filter(pk=bt.pk).exclude(state=bt.CANCELLED)
+        updated = running.update(progress_perc=bt.progress_perc,
+                                 progress_stage=bt.progress_stage,
+                                 progress_bytes=bt.progress_bytes,
+                                 progress_rate=bt.progress_rate,
+                                 progress_eta=bt.progress_eta)
+
+        if not updated:
+            raise BuildCancelledException('The build was cancelled during: %s' % self.stage)
@@ -0,0 +1,111 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from django.db import connection
+
+
+class InvalidStagesException(Exception):
+    def __init__(self, msg):
+        self.message = msg
+
+
+class Stage(object):
+    """
+    A step of the bundle build.
+
+    The stage only runs once all the stages it `requires' are done,
+    their results are given to `fn' as arguments, in the order of `requires'.
+    """
+
+    def __init__(self, name, fn, requires=()):
+        self.name = name
+        self.fn = fn
+        self.requires = tuple(requires)
+
+    def __call__(self, results):
+        return self.fn(*[results[r] for r in self.requires])
+
+    def __repr__(self):
+        return "<%s: %s, requires=%s>" % (type(self).__name__, self.name, self.requires)
+
+
+def ordered(stages):
+    """
+    Return the stages sorted so that each one comes after the stages it requires.
+    Keeps the given order otherwise.
+    """
+    names = set(s.name for s in stages)
+    done, r = set(), []
+    pending = list(stages)
+
+    for s in pending:
+        unknown = set(s.requires) - names
+        if unknown:
+            raise InvalidStagesException("Stage %s requires unknown stages: %s"
+                                         % (s.name, unknown))
+
+    while pending:
+        ready = [s for s in pending if done.issuperset(s.requires)]
+
+        if not ready:
+            raise InvalidStagesException("Cycle between the stages: %s" % pending)
+
+        for s in ready:
+            pending.remove(s)
+            done.add(s.name)
+            r.append(s)
+
+    return r
+
+
+def _threaded(stage, results):
+    try:
+        return stage(results)
+    finally:
+        # Each thread gets its own database connection, don't leak it.
+        connection.close()
+
+
+def run_stages(stages, workers=1, on_done=None):
+    """
+    Run the stages and return their results, by stage name.
+
+    With a single worker, stages run one after the other in the current thread.
+    Otherwise they run in a pool of `workers' threads as soon as their requirements
+    are available. The first failure is re-raised once the running stages are done,
+    stages that didn't start yet are dropped.
+
+    `on_done' is called with each stage name once it succeeded, from the current thread.
+    """
+    stages = ordered(stages)
+    results = {}
+
+    if workers <= 1:
+        for s in stages:
+            results[s.name] = s(results)
+            if on_done is not None:
+                on_done(s.name)
+        return results
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = list(stages)
+        running = {}
+
+        try:
+            while pending or running:
+                for s in [s for s in pending if all(x in results for x in s.requires)]:
+                    pending.remove(s)
+                    running[pool.submit(_threaded, s, dict(results))] = s
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for f in done:
+                    s = running.pop(f)
+                    results[s.name] = f.result()
+                    if on_done is not None:
+                        on_done(s.name)
+        except:
+            for f in running:
+                f.cancel()
+            raise
+
+    return results
@@ -1,17 +1,24 @@
+import json
 import os
-import random
 import shutil
 import traceback
 from contextlib import contextmanager
+from functools import partial
 from os import path
 from tempfile import TemporaryDirectory
+from zipfile import ZipFile, ZIP_DEFLATED
 
 import yaml
 from celery import shared_task
-from django.core.files import File
+from django.conf import settings
 from django.utils import timezone
 
-from chalab.tools import fs
+from bundler.cache import ArtifactCache, digest
+from bundler.instrument import file_size, measure
+from bundler.progress import BuildCancelledException, Progress
+from bundler.stages import Stage, run_stages
+from chalab.tools import archives, compressed, fs, split
+from chalab.tools.storage import file_field_digest, open_for_write
 from wizard import resources
 from wizard.models import challenge_to_mappings
 
@@ -37,6 +44,27 @@ def copy_file_field(file_desc, dest_path):
         shutil.copyfileobj(file_desc, f)
 
 
+def write_file_field(zf, file_field, name, callback=None):
+    """
+    Stream the content of a FileField straight into the archive `zf',
+    files compressed at rest are copied without being decompressed.
+    """
+    if compressed.is_compressed(file_field.name):
+        i = compressed.info(file_field.path)
+
+        with open(file_field.path, 'rb') as f:
+            f.seek(i.data_offset)
+            archives.write_deflated(zf, name, f, i.data_size, i.size, i.crc,
+                                    callback=callback)
+        return
+
+    try:
+        file_field.open()
+        archives.write_fileobj(zf, name, file_field, callback=callback)
+    finally:
+        file_field.close()
+
+
 def gen_documentation(bt, output_dir, challenge):
     bt.add_log('Generate the documentation')
     doc = challenge.documentation
@@ -47,22 +75,84 @@ def gen_documentation(bt, output_dir, challenge):
     pages = doc.pages
     r = {}
 
-    for p in pages:
-        bt.add_log('Export page: %s' % p.name)
-        r[p.name] = p.name + '.html'
-        p.render(mapping)
+    with measure(bt, 'gen_documentation') as m:
+        for p in pages:
+            bt.add_log('Export page: %s' % p.name)
+            r[p.name] = p.name + '.html'
+            p.render(mapping)
 
-        with open(path.join(output_dir, p.name + '.html'), 'w') as f:
-            f.write(p.rendered)
+            with open(path.join(output_dir, p.name + '.html'), 'w') as f:
+                f.write(p.rendered)
+
+        m['bytes_out'] = file_size(*[path.join(output_dir, x) for x in r.values()])
 
     return r
 
 
-def gen_reference(output_dir, dataset, phase_id):
-    pass
+def gen_reference_data(bt, output_dir, task, matrix, suffix, number, progress):
+    ref_data = 'reference_data_%s.zip' % number
+    stage = 'reference_data_%s' % number
+
+    bt.add_log('Creating archive: %s' % ref_data)
+    progress.start(stage, matrix.raw_content.size)
+
+    with measure(bt, 'gen_%s' % stage) as m:
+        a = path.join(output_dir, ref_data)
+
+        with ZipFile(a, 'w', allowZip64=True) as zf:
+            write_file_field(zf, matrix.raw_content, '%s%s' % (task.name, suffix),
+                             callback=partial(progress.advance, stage))
+
+        m['bytes_in'], m['bytes_out'] = matrix.raw_content.size, file_size(a)
+
+    return ref_data
+
+
+def gen_input_data(bt, output_dir, task, progress):
+    # Input data is used by both phases
+    input_data = 'input_data_1_2.zip'
+    name = task.name
+
+    files = [(task.input_train, '%s_train.data' % name),
+             (task.input_valid, '%s_valid.data' % name),
+             (task.input_test, '%s_test.data' % name),
+             (task.target_train, '%s_train.solution' % name)]
+
+    size = sum(x.raw_content.size for x, _ in files)
+
+    bt.add_log('Creating archive: %s' % input_data)
+    progress.start('input_data', size)
+
+    with measure(bt, 'gen_input_data') as m:
+        a = path.join(output_dir, input_data)
+
+        with ZipFile(a, 'w', allowZip64=True) as zf:
+            for x, entry in files:
+                write_file_field(zf, x.raw_content, entry,
+                                 callback=partial(progress.advance, 'input_data'))
+
+        m['bytes_in'], m['bytes_out'] = size, file_size(a)
+
+    return input_data
+
+
+def gen_scoring_program(bt, output_dir, metric):
+    # Scoring program is used by both phases
+    scoring_program = 'scoring_program_1_2'
+
+    with fs.tmp_dir() as d:
+        scoring_dir = os.path.join(d, scoring_program)
+
+        with measure(bt, 'build_default_scoring') as m:
+            resources.build_default_scoring(metric, scoring_dir)
+            m['bytes_out'] = archives.dir_size(scoring_dir)
+
+        archive_path = zipdir(bt, output_dir, scoring_program, scoring_dir)
+
+    return os.path.basename(archive_path)
 
 
-def gen_dev_phase(bt, output_dir, challenge, task, protocol, metric):
+def gen_dev_phase(bt, challenge, protocol, archives):
     number = 1
 
     bt.add_log('Create phase %s' % number)
@@ -77,57 +167,9 @@ def gen_dev_phase(bt, output_dir, challenge, task, protocol, metric):
          'max_submissions': PROTOCOL_MAX_SUBMISSIONS,
          'max_submissions_per_day': PROTOCOL_MAX_SUBMISSIONS_PER_DAY}
 
-    ref_data = 'reference_data_%s' % number
-
-    name = task.name
-
-    # Input data is generated here, used by both phases
-    input_data = 'input_data_1_2'
-    # Scoring program is fixed too
-    scoring_program = 'scoring_program_1_2'
-
-    with TemporaryDirectory() as d:
-        try:
-            task.target_valid.raw_content.open()
-            copy_file_field(task.target_valid.raw_content, path.join(d, '%s_valid.solution' % name))
-
-            zipdir(bt, output_dir, ref_data, d)
-            p['reference_data'] = ref_data + '.zip'
-        finally:
-            task.target_valid.raw_content.close()
-
-    with TemporaryDirectory() as d:
-        try:
-            task.input_train.raw_content.open()
-            copy_file_field(task.input_train.raw_content,
-                            path.join(d, '%s_train.data' % name))
-
-            task.input_valid.raw_content.open()
-            copy_file_field(task.input_valid.raw_content,
-                            path.join(d, '%s_valid.data' % name))
-
-            task.input_test.raw_content.open()
-            copy_file_field(task.input_test.raw_content,
-                            path.join(d, '%s_test.data' % name))
-
-            task.target_train.raw_content.open()
-            copy_file_field(task.target_train.raw_content,
-                            path.join(d, '%s_train.solution' % name))
-
-            zipdir(bt, output_dir, input_data, d)
-            p['input_data'] = input_data + '.zip'
-        finally:
-            task.input_train.raw_content.close()
-            task.input_valid.raw_content.close()
-            task.input_test.raw_content.close()
-            task.target_train.raw_content.close()
-
-    with fs.tmp_dir() as d:
-        scoring_dir = os.path.join(d, scoring_program)
-        resources.build_default_scoring(metric, scoring_dir)
-
-        archive_path = zipdir(bt, output_dir, scoring_program, scoring_dir)
-        p['scoring_program'] = os.path.basename(archive_path)
+    p['reference_data'] = archives['reference_data_1']
+    p['input_data'] = archives['input_data']
+    p['scoring_program'] = archives['scoring_program']
 
     p['datasets'] = {
         1: {
@@ -156,7 +198,7 @@ def gen_info_file(path, content):
         f.writelines(lines)
 
 
-def gen_final_phase(bt, output_dir, challenge, task, protocol, metric):
+def gen_final_phase(bt, challenge, protocol, archives):
     number = 2
 
     bt.add_log('Create phase %s' % number)
@@ -172,40 +214,22 @@ def gen_final_phase(bt, output_dir, challenge, task, protocol, metric):
          'max_submissions': PROTOCOL_MAX_SUBMISSIONS,
          'max_submissions_per_day': 0}
 
-    ref_data = 'reference_data_%s' % number
-    name = task.name
-
-    # Input data is generated in dev phase
-    input_data = 'input_data_1_2.zip'
-    # Scoring program is fixed too
-    scoring_program = 'scoring_program_1_2.zip'
-
-    p['input_data'] = input_data
-    p['scoring_program'] = scoring_program
-
-    with TemporaryDirectory() as d:
-        try:
-            task.target_test.raw_content.open()
-            copy_file_field(task.target_test.raw_content, path.join(d, '%s_test.solution' % name))
+    # Input data and scoring program are shared with the dev phase
+    p['input_data'] = archives['input_data']
+    p['scoring_program'] = archives['scoring_program']
 
-            # gen_info_file(path.join(d, '%s_public.info' % name),
-            #               {'metric': metric.name,
-            #                'task': 'classification' if metric.classification else 'regression'})
+    # gen_info_file(path.join(d, '%s_public.info' % name),
+    #               {'metric': metric.name,
+    #                'task': 'classification' if metric.classification else 'regression'})
 
-            zipdir(bt, output_dir, ref_data, d)
-            p['reference_data'] = ref_data + '.zip'
-        finally:
-            task.target_test.raw_content.close()
+    p['reference_data'] = archives['reference_data_2']
 
     return p
 
 
-def gen_phases(bt, output_dir, challenge):
-    dev_p = gen_dev_phase(bt, output_dir, challenge, challenge.task,
-                          challenge.protocol, challenge.metric)
-
-    final_p = gen_final_phase(bt, output_dir, challenge, challenge.task,
-                              challenge.protocol, challenge.metric)
+def gen_phases(bt, challenge, archives):
+    dev_p = gen_dev_phase(bt, challenge, challenge.protocol, archives)
+    final_p = gen_final_phase(bt, challenge, challenge.protocol, archives)
 
     return {1: dev_p, 2: final_p}
 
@@ -219,7 +243,10 @@ def gen_logo(bt, output_dir, challenge):
     try:
         bt.add_log('Load the challenge logo')
         logo.open()
-        copy_file_field(logo.file, path.join(output_dir, name))
+
+        with measure(bt, 'gen_logo') as m:
+            copy_file_field(logo.file, path.join(output_dir, name))
+            m['bytes_in'] = m['bytes_out'] = file_size(path.join(output_dir, name))
     finally:
         logo.close()
 
@@ -249,16 +276,262 @@ def gen_leaderboard(challenge):
     return leaderboard
 
 
-def create_bundle(bt, output_dir, challenge):
-    html = gen_documentation(bt, output_dir, challenge)
-    phases = gen_phases(bt, output_dir, challenge)
+ARCHIVE_STAGES = ('input_data', 'reference_data_1', 'reference_data_2', 'scoring_program')
+
+
+def artifact_cache():
+    if settings.BUNDLER_CACHE_DIR is None:
+        return None
+    return ArtifactCache(settings.BUNDLER_CACHE_DIR, settings.BUNDLER_CACHE_BUDGET)
+
+
+def input_data_key(task):
+    matrices = (task.input_train, task.input_valid, task.input_test, task.target_train)
+    return digest('input_data', task.name,
+                  *[file_field_digest(m.raw_content) for m in matrices])
+
+
+def reference_data_key(task, matrix, suffix, number):
+    return digest('reference_data', task.name, suffix, str(number),
+                  file_field_digest(matrix.raw_content))
+
+
+def scoring_program_key(metric):
+    return digest('scoring_program', metric.name, metric.description, metric.code,
+                  resources.scoring_version())
+
+
+def cached_archive(bt, cache, output_dir, name, key, build):
+    """
+    Generate the archive `name' with `build', unless the cache holds an archive
+    built from the same inputs. `key' computes the digest of these inputs.
+    """
+    if cache is None:
+        return build()
+
+    k = key()
+    if cache.get(k, path.join(output_dir, name)):
+        bt.add_log('Reuse cached archive: %s' % name)
+        return name
+
+    r = build()
+    cache.put(k, path.join(output_dir, r))
+    return r
+
+
+def documentation_fingerprint(challenge):
+    doc = challenge.documentation
+    if doc is None:
+        return digest('documentation')
+
+    mapping = challenge_to_mappings(challenge)
+    pages = ['%s\n%s' % (p.name, p.content) for p in doc.pages]
+    values = ['%s=%s' % (k, mapping[k]) for k in sorted(mapping)]
+
+    return digest('documentation', *(pages + values))
+
+
+def fingerprints(challenge):
+    """
+    Return a digest of the inputs of each bundle stage that writes files.
+
+    They only look at the models, not at the files content: the split files
+    get a new name every time they are generated.
+    """
+    task, metric = challenge.task, challenge.metric
+
+    def names(*matrices):
+        return [m.raw_content.name for m in matrices]
+
+    r = {
+        'documentation': documentation_fingerprint(challenge),
+        'input_data': digest('input_data', task.name,
+                             *names(task.input_train, task.input_valid,
+                                    task.input_test, task.target_train)),
+        'reference_data_1': digest('reference_data', task.name,
+                                   *names(task.target_valid)),
+        'reference_data_2': digest('reference_data', task.name,
+                                   *names(task.target_test)),
+        'scoring_program': scoring_program_key(metric),
+    }
+
+    if challenge.logo:
+        r['logo'] = digest('logo', challenge.logo.name)
+
+    return r
+
+
+def stage_files(name, result):
+    if name == 'documentation':
+        return list(result.values())
+    else:
+        return [result]
+
+
+class PreviousBundle(object):
+    """
+    The last bundle successfully built for a challenge,
+    the stages whose inputs didn't change since then reuse its files.
+    """
+
+    def __init__(self, bundle_task):
+        self.path = bundle_task.output.path
+        self.components = bundle_task.components_dict
+
+    @classmethod
+    def find(cls, bundle_task):
+        b = (type(bundle_task).objects
+             .filter(challenge=bundle_task.challenge, state=bundle_task.FINISHED)
+             .exclude(pk=bundle_task.pk)
+             .first())
+
+        if b is None or not b.output or not b.output.storage.exists(b.output.name):
+            return None
+        return cls(b)
+
+    def reuse(self, name, fingerprint, output_dir):
+        """
+        Extract the files of the stage `name' to `output_dir' if its `fingerprint'
+        didn't change, return whether they were and the stage result.
+        """
+        c = self.components.get(name)
+
+        if c is None or c['fingerprint'] != fingerprint:
+            return False, None
+
+        with ZipFile(self.path, 'r') as zf:
+            files = stage_files(name, c['result'])
+            if not set(files).issubset(zf.namelist()):
+                return False, None
+
+            for f in files:
+                zf.extract(f, path=output_dir)
+
+        return True, c['result']
+
+
+def reusable(bt, previous, output_dir, name, fingerprint, build):
+    found, result = previous.reuse(name, fingerprint, output_dir)
+
+    if found:
+        bt.add_log('Reuse from the previous bundle: %s' % name)
+        return result
+
+    return build()
+
+
+def tracked(progress, name, fn):
+    r = fn()
+    progress.finish(name)
+    return r
+
+
+def plan_progress(progress, challenge):
+    """
+    Weight the stages of a build by the bytes they should go through,
+    estimated from the dataset size and the task ratios.
+    """
+    data, task = challenge.dataset, challenge.task
+    input_size, target_size = data.input.raw_content.size, data.target.raw_content.size
+    size = input_size + target_size
+
+    progress.plan('split', size)
+    progress.plan('input_data', input_size + target_size * task.train_ratio / 100.0)
+    progress.plan('reference_data_1', target_size * task.valid_ratio / 100.0)
+    progress.plan('reference_data_2', target_size * task.test_ratio / 100.0)
+    progress.plan('upload', size)
+
+
+def bundle_stages(bt, output_dir, challenge, cache=None, previous=None, fingerprints=None,
+                  progress=None):
+    """
+    Return the stages producing the bundle content in `output_dir'.
+
+    The archives and the documentation do not depend on each other,
+    the phases only describe the archives so they come last.
+
+    Given the `previous' bundle and the current stages `fingerprints',
+    stages with unchanged inputs reuse the previous files instead.
+    """
+    if progress is None:
+        progress = Progress()
+
+    task, metric = challenge.task, challenge.metric
+
+    def archive(name, key, build):
+        return partial(cached_archive, bt, cache, output_dir, name, key, build)
+
+    stages = [
+        Stage('documentation', partial(gen_documentation, bt, output_dir, challenge)),
+        Stage('input_data', archive(
+            'input_data_1_2.zip',
+            partial(input_data_key, task),
+            partial(gen_input_data, bt, output_dir, task, progress))),
+        Stage('reference_data_1', archive(
+            'reference_data_1.zip',
+            partial(reference_data_key, task, task.target_valid, '_valid.solution', 1),
+            partial(gen_reference_data, bt, output_dir, task,
+                    task.target_valid, '_valid.solution', 1, progress))),
+        Stage('reference_data_2', archive(
+            'reference_data_2.zip',
+            partial(reference_data_key, task, task.target_test, '_test.solution', 2),
+            partial(gen_reference_data, bt, output_dir, task,
+                    task.target_test, '_test.solution', 2, progress))),
+        Stage('scoring_program', archive(
+            'scoring_program_1_2.zip',
+            partial(scoring_program_key, metric),
+            partial(gen_scoring_program, bt, output_dir, metric))),
+        Stage('phases',
+              lambda *archives: gen_phases(bt, challenge, dict(zip(ARCHIVE_STAGES, archives))),
+              requires=ARCHIVE_STAGES),
+    ]
+
+    if challenge.logo:
+        stages.append(Stage('logo', partial(gen_logo, bt, output_dir, challenge)))
+
+    if previous is not None:
+        for stage in stages:
+            if stage.name in fingerprints:
+                stage.fn = partial(reusable, bt, previous, output_dir,
+                                   stage.name, fingerprints[stage.name], stage.fn)
+
+    for stage in stages:
+        if stage.name in progress.weights:
+            stage.fn = partial(tracked, progress, stage.name, stage.fn)
+
+    return stages
+
+
+def create_bundle(bt, output_dir, challenge, workers=None, previous=None, progress=None):
+    if workers is None:
+        workers = settings.BUNDLER_WORKERS
+    if progress is None:
+        progress = Progress()
+
+    def on_done(_):
+        # Stage boundaries are a good time to write the logs,
+        # and to stop there if the build was cancelled.
+        bt.flush_logs()
+        progress.check()
+
+    cache = artifact_cache()
+    fps = fingerprints(challenge)
+    stages = bundle_stages(bt, output_dir, challenge, cache, previous, fps, progress)
+    results = run_stages(stages, workers=workers, on_done=on_done)
+
+    if cache is not None:
+        bt.add_log('Archives cache: %s' % cache)
+
+    bt.components = json.dumps({name: {'fingerprint': fp, 'result': results[name]}
+                                for name, fp in fps.items()})
+
     leaderboard = gen_leaderboard(challenge)
 
     data = {
         'title': challenge.title,
         'description': challenge.description,
-        'html': html,
-        'phases': phases,
+        'html': results['documentation'],
+        'phases': results['phases'],
         'leaderboard': leaderboard,
         'has_registration': False,
         'force_submission_to_leaderboard': True,
@@ -274,9 +547,8 @@ def create_bundle(bt, output_dir, challenge):
         'admin_names': 'guyon,lsenta'  # temporary default admins.
     }
 
-    if challenge.logo:
-        logo = gen_logo(bt, output_dir, challenge)
-        data['image'] = logo
+    if 'logo' in results:
+        data['image'] = results['logo']
 
     bt.add_log('Dump the competition.yaml file')
     with open(path.join(output_dir, 'competition.yaml'), 'w') as f:
@@ -285,36 +557,89 @@ def create_bundle(bt, output_dir, challenge):
 
 def zipdir(bt, output_dir, archive_name, data_dir):
     bt.add_log('Creating archive: %s' % archive_name)
-    a = shutil.make_archive(path.join(output_dir, archive_name), 'zip',
-                            root_dir=data_dir, base_dir='.')
+    a = path.join(output_dir, archive_name + '.zip')
+
+    with measure(bt, 'zipdir:%s' % archive_name) as m:
+        with ZipFile(a, 'w', ZIP_DEFLATED, allowZip64=True) as zf:
+            archives.write_dir(zf, data_dir)
+
+        m['bytes_in'], m['bytes_out'] = archives.dir_size(data_dir), file_size(a)
+
     return a
 
 
-def create_archive(bt, data_dir, output_dir):
-    bt.add_log('Package to bundle directory')
-    return zipdir(bt, output_dir, 'bundle', data_dir)
+def archive_name(challenge):
+    return 'bundle_%s.zip' % challenge.pk
+
 
+def save_archive(bt, data_dir, challenge, bundle_task, progress=None):
+    """
+    Write the archive of `data_dir' to the output of `bundle_task', under a name of
+    its own: the published name still holds the previous bundle, see `publish_archive'.
+    """
+    if progress is None:
+        progress = Progress()
 
-def save_archive(bt, archive, challenge, bundle_task):
+    size = archives.dir_size(data_dir)
+
+    progress.check()
     bt.add_log('Export the archive')
-    with open(archive, 'rb') as f:
-        bundle_task.output.save('bundle_%s.zip' % (challenge.pk), File(f))
+    progress.start('upload', size)
+
+    with measure(bt, 'save_archive') as m:
+        staged = '%s.%s.part' % (archive_name(challenge), bundle_task.pk)
+        with open_for_write(bundle_task.output, staged) as f:
+            with ZipFile(f, 'w', ZIP_DEFLATED, allowZip64=True) as zf:
+                archives.write_dir(zf, data_dir, callback=partial(progress.advance, 'upload'))
+
+        m['bytes_in'], m['bytes_out'] = size, bundle_task.output.size
+
+    progress.finish('upload')
 
 
-def generate_task_data(bundle_task, challenge):
+def publish_archive(bundle_task, challenge):
+    """
+    Set the build as finished, with the archive `save_archive' wrote moved to its
+    published name. A build cancelled meanwhile raises BuildCancelledException,
+    its archive is left unpublished.
+    """
+    output = bundle_task.output
+    staged = output.name
+
+    output.name = output.field.generate_filename(bundle_task, archive_name(challenge))
+    bundle_task.state = bundle_task.FINISHED
+    bundle_task.closed = timezone.now()
+
+    if not bundle_task.save_unless_cancelled('state', 'closed', 'output', 'components', 'stats'):
+        output.name = staged
+        raise BuildCancelledException('The build was cancelled as it finished')
+
+    try:
+        os.replace(output.storage.path(staged), output.path)
+    except:
+        output.name = staged
+        raise
+
+
+def generate_task_data(bundle_task, challenge, progress=None):
     task = challenge.task
     data = challenge.dataset
 
+    if progress is None:
+        progress = Progress()
+
     if task.has_content and task.is_public:
         bundle_task.add_log('Skipping task data generation, already present')
+        progress.finish('split')
         return
 
     if data.updated_at <= challenge.build_at:
         bundle_task.add_log('Skipping task data generation, already generated')
+        progress.finish('split')
         return
 
     bundle_task.add_log('Starting task data generation, based on dataset: %s' % (data.pk))
-    train, valid, test = task.train_ratio, task.valid_ratio, task.test_ratio
+    train, valid = task.train_ratio, task.valid_ratio
 
     bundle_task.add_log('Generating content for task: %s(%s)' % (task.name, task.pk))
 
@@ -322,42 +647,40 @@ def generate_task_data(bundle_task, challenge):
 
     train_size = int(train / 100.0 * size)
     valid_size = int(valid / 100.0 * size)
-    test_size = int(test / 100.0 * size)
-
-    xs = list(range(size))
-    random.shuffle(xs)
 
-    train, rest = xs[:train_size], xs[train_size:]
-    valid, test = rest[:valid_size], rest[valid_size:]
+    labels = split.assignment(size, train_size, valid_size)
 
     input = data.input.raw_content
     target = data.target.raw_content
 
     input.open(), target.open()
-    with fs.tmp_dir() as output:
-        gen = os.path.join(output, 'gen')
-        fs.mkdir(gen)
-        with open(os.path.join(gen, 'gen_train.data'), 'wb') as ti, \
-                open(os.path.join(gen, 'gen_train.solution'), 'wb') as tt, \
-                open(os.path.join(gen, 'gen_valid.data'), 'wb') as vi, \
-                open(os.path.join(gen, 'gen_valid.solution'), 'wb') as vt, \
-                open(os.path.join(gen, 'gen_test.data'), 'wb') as si, \
-                open(os.path.join(gen, 'gen_test.solution'), 'wb') as st:
-            for i in range(size):
-                li = input.readline()
-                lt = target.readline()
-
-                if i in train:
-                    ti.write(li)
-                    tt.write(lt)
-                elif i in valid:
-                    vi.write(li)
-                    vt.write(lt)
-                else:
-                    si.write(li)
-                    st.write(lt)
-        task.update_from_chalearn(gen)
-    input.close(), target.close()
+    progress.start('split', input.size + target.size)
+
+    def advance(_):
+        # Also where a cancelled build stops, the split files are dropped with `output'.
+        progress.update('split', input.file.tell() + target.file.tell())
+
+    try:
+        with fs.tmp_dir() as output, measure(bundle_task, 'generate_task_data') as m:
+            gen = os.path.join(output, 'gen')
+            fs.mkdir(gen)
+            with open(os.path.join(gen, 'gen_train.data'), 'wb') as ti, \
+                    open(os.path.join(gen, 'gen_train.solution'), 'wb') as tt, \
+                    open(os.path.join(gen, 'gen_valid.data'), 'wb') as vi, \
+                    open(os.path.join(gen, 'gen_valid.solution'), 'wb') as vt, \
+                    open(os.path.join(gen, 'gen_test.data'), 'wb') as si, \
+                    open(os.path.join(gen, 'gen_test.solution'), 'wb') as st:
+                outputs = {split.TRAIN: (ti, tt),
+                           split.VALID: (vi, vt),
+                           split.TEST: (si, st)}
+                split.split_lines(labels, input.file, target.file, outputs, callback=advance)
+
+            m['bytes_in'], m['bytes_out'] = input.size + target.size, archives.dir_size(gen)
+            progress.check()
+            task.update_from_chalearn(gen)
+    finally:
+        input.close(), target.close()
+    progress.finish('split')
 
 
 @shared_task
@@ -365,28 +688,55 @@ def bundle(bundle_task):
     try:
         challenge = bundle_task.challenge
 
-        with tmp_dirs(challenge) as (data, output):
+        # The build could have been cancelled while waiting for a worker.
+        bundle_task.refresh_from_db(fields=['state'])
+        if bundle_task.state == bundle_task.CANCELLED:
+            bundle_task.add_log('Build cancelled before it started')
+            bundle_task.flush_logs()
+            return
+
+        with tmp_dirs(challenge) as (data, _):
             bundle_task.add_log('Starting bundler for: %s' % (challenge.title,))
 
             bundle_task.state = bundle_task.STARTED
-            bundle_task.save()
+            if not bundle_task.save_unless_cancelled('state'):
+                raise BuildCancelledException('The build was cancelled before it started')
+
+            progress = Progress(bundle_task)
+            plan_progress(progress, challenge)
+
+            generate_task_data(bundle_task, challenge, progress)
+            bundle_task.flush_logs()
+
+            previous = PreviousBundle.find(bundle_task)
+            create_bundle(bundle_task, data, challenge, previous=previous, progress=progress)
+            save_archive(bundle_task, data, challenge, bundle_task, progress)
 
-            generate_task_data(bundle_task, challenge)
-            create_bundle(bundle_task, data, challenge)
-            a = create_archive(bundle_task, data, output)
-            save_archive(bundle_task, a, challenge, bundle_task)
+        publish_archive(bundle_task, challenge)
 
         challenge.build_at = timezone.now()
         challenge.save()
 
         bundle_task.add_log('Set state to finished')
-        bundle_task.state = bundle_task.FINISHED
-        bundle_task.closed = timezone.now()
-        bundle_task.save()
+        bundle_task.flush_logs()
+    except BuildCancelledException as e:
+        # The temporary directories are gone with the stack, the state was set by `cancel'.
+        # The output, if any, is the archive that wasn't published.
+        bundle_task.refresh_from_db(fields=['state', 'closed'])
+        if bundle_task.output:
+            bundle_task.output.delete(save=False)
+        bundle_task.save(update_fields=['output', 'stats'])
+
+        bundle_task.add_log(e.message)
+        bundle_task.add_log('Set state to cancelled')
+        bundle_task.flush_logs()
     except Exception as e:
         bundle_task.state = bundle_task.FAILED
-        bundle_task.save()
+        bundle_task.save_unless_cancelled('state', 'stats')
+        if bundle_task.output:
+            bundle_task.output.delete(save=False)  # not published either
 
         bundle_task.add_log('Exception: %r' % e)
         bundle_task.add_log('Traceback:\n%s' % traceback.format_exc())
         bundle_task.add_log('Set state to failed')
+        bundle_task.flush_logs()
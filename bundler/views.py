@@ -7,6 +7,7 @@ from django.http import StreamingHttpResponse
 from django.shortcuts import redirect, get_object_or_404, render
 from django.urls import reverse
 from django.utils.text import slugify
+from django.views.decorators.http import require_POST
 
 from chalab import errors
 from wizard.models import ChallengeModel
@@ -41,6 +42,21 @@ def build(request, pk):
                             kwargs={'pk': pk}))
 
 
+@login_required
+@require_POST
+def cancel(request, pk):
+    c = get_object_or_404(ChallengeModel, created_by=request.user, pk=pk)
+    b = BundleTaskModel.objects.filter(challenge=c).first()
+
+    if b is None or not b.cancel():
+        raise errors.HTTP400Exception('wizard/challenge/error.html', 'no build in progress',
+                                      """There is no bundle being built to cancel.""",
+                                      challenge=c)
+
+    return redirect(reverse('wizard:challenge:build',
+                            kwargs={'pk': pk}))
+
+
 @login_required
 def download(request, pk):
     c = get_object_or_404(ChallengeModel, created_by=request.user, pk=pk)
@@ -90,4 +106,6 @@ def status_json(request, pk):
 
     return JsonResponse({'state': b.state,
                          'created': b.created,
-                         'closed': b.closed})
+                         'closed': b.closed,
+                         'progress': b.progress,
+                         'stats': b.stats_dict})
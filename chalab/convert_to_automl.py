@@ -1,6 +1,12 @@
 import csv
+import logging
 import os
 import re
+import time
+from collections import Counter, namedtuple
+from itertools import chain, islice
+
+log = logging.getLogger('chalab.convert_to_automl')
 
 
 # Convert the file (their path are given in "path") from the format give in "format"
@@ -19,120 +25,549 @@ def convert(path, format='auto'):
         return detect_from(path)
 
 
-def detect_from(path):
-    file = open(path, 'r')
-    lines = file.readlines()
-    file.close()
+# Format detection only reads the first DETECT_LINES lines of a file, up to
+# DETECT_PREFIX_SIZE bytes, and DETECT_SAMPLES blocks of DETECT_SAMPLE_SIZE bytes
+# spread over the rest.
+DETECT_LINES = 1000
+DETECT_PREFIX_SIZE = 1024 * 1024
+DETECT_SAMPLES = 8
+DETECT_SAMPLE_SIZE = 64 * 1024
+
+LIBSVM_LINE = re.compile(r'^[^ ]+( [^ :]*:[^ :]*)+$')
+
+Detection = namedtuple('Detection', ['format', 'confidence'])
+
+
+def _decoded(lines):
+    return [line.decode('utf-8', 'replace').rstrip('\r') for line in lines]
+
+
+def sample_lines(path, lines=DETECT_LINES, samples=DETECT_SAMPLES,
+                 sample_size=DETECT_SAMPLE_SIZE, prefix_size=DETECT_PREFIX_SIZE):
+    """
+    Return the first `lines' lines of the file found in its first `prefix_size'
+    bytes, and the full lines of `samples' blocks read at offsets spread over
+    the rest of it.
+    """
+    size = os.path.getsize(path)
+
+    with open(path, 'rb') as f:
+        prefix = f.read(prefix_size).split(b'\n')
+        if prefix_size < size:
+            prefix.pop()  # may be cut
+        prefix = prefix[:lines]
+        start = min(size, sum(len(line) + 1 for line in prefix))
+
+        sampled = []
+        for k in range(samples if start < size else 0):
+            offset = start + (size - start) * k // samples
+            if sampled and offset < f.tell():
+                continue  # the previous block went past this one
+
+            f.seek(offset)
+            block = f.read(sample_size).split(b'\n')
 
-    arff = True
-    libsvm = True
+            # The first line may be cut, the last one too unless it ends the file.
+            if offset > start:
+                block = block[1:]
+            if f.tell() < size:
+                block = block[:-1]
+            sampled.extend(block)
+
+    return _decoded(prefix), _decoded(sampled)
+
+
+def _arff_header(lines):
+    """
+    True if the lines are an ARFF header up to its @data,
+    None if they are the start of a header that isn't over.
+    """
+    declarations = False
 
     for line in lines:
         basic_line = line.lower().strip()
 
-        if arff:
-            if not (basic_line.startswith('%') or basic_line.startswith('@') or not basic_line):
-                arff = False
-            elif basic_line == '@data':
-                return from_arff(path)
+        if basic_line == '@data':
+            return True
+        if not (basic_line.startswith('%') or basic_line.startswith('@') or not basic_line):
+            return False
+        declarations = declarations or basic_line.startswith('@')
 
-        if libsvm:
-            if basic_line and re.match('^[^\ ]+( [^\ \:]*\:[^\ \:]*)+$', basic_line) is None:
-                libsvm = False
+    return None if declarations else False
 
-    if libsvm:
-        return from_libsvm(path)
 
-    return from_csv(path)
+def _csv_fit(lines):
+    """Share of the lines having the most common number of fields of their dialect."""
+    try:
+        dialect = csv.Sniffer().sniff('\n'.join(lines[:50]))
+    except csv.Error:
+        dialect = csv.excel  # No delimiter found, a single column.
+
+    counts = Counter(len(row) for row in csv.reader(lines, dialect))
+    return counts.most_common(1)[0][1] / len(lines)
+
+
+def detect(path, **kwargs):
+    """
+    Detect the format of the file from a bounded part of it, read by `sample_lines'
+    with `kwargs'.
+
+    Return the Detection of 'arff', 'libsvm' or 'csv' with the share of the lines
+    read that fit this format as its confidence.
+    """
+    prefix, sampled = sample_lines(path, **kwargs)
+
+    header = _arff_header(prefix)
+    if header:
+        return Detection('arff', 1.0)
+    elif header is None:
+        # Only header lines so far, a long list of attributes.
+        return Detection('arff', 0.5)
+
+    lines = [line.strip() for line in prefix + sampled]
+    lines = [line for line in lines if line]
+    if not lines:
+        return Detection('csv', 0.0)
+
+    # CSV rows don't look like libsvm rows, while the sniffer may find a delimiter in both.
+    libsvm = sum(LIBSVM_LINE.match(line.lower()) is not None for line in lines) / len(lines)
+    if libsvm > 0.5:
+        return Detection('libsvm', libsvm)
+    return Detection('csv', _csv_fit(lines))
+
+
+def detect_from(path):
+    """Convert the file from the format detected by `detect'."""
+    return convert(path, detect(path).format)
+
+
+# CSV files are read CSV_CHUNK_SIZE bytes of lines at a time, converted rows are
+# written CSV_BATCH_ROWS at a time through a buffer of WRITE_BUFFER_SIZE bytes.
+CSV_CHUNK_SIZE = 4 * 1024 * 1024
+CSV_BATCH_ROWS = 10000
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class ConversionStats(namedtuple('ConversionStats', ['rows', 'seconds'])):
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else float(self.rows)
+
+
+def _is_plain(block, dialect):
+    """True if the lines of `block' only need their delimiters replaced by spaces."""
+    d = dialect.delimiter
+    if dialect.quotechar in block or (d != ' ' and (' ' in block or '\t' in block)):
+        return False
+
+    return not _has_empty(block, d)
+
+
+def _has_empty(block, d):
+    """True if the lines of `block' have empty fields, missing values."""
+    return (block.startswith(d) or d + d in block or '\n' + d in block
+            or d + '\n' in block or d + '\r' in block or block.endswith(d))
+
+
+def _automl_row(row):
+    """The AutoML line of a CSV row, missing values become NaN and values can't hold spaces."""
+    return ' '.join('_'.join(v.split()) or 'NaN' for v in row) + '\n'
+
+
+def _automl_rows(rows):
+    """The AutoML lines of the CSV `rows', joined a row at a time when none needs care."""
+    text = '\n'.join(map(' '.join, rows)) + '\n'
+
+    # As many spaces and lines as the rows have separators means no value holds one.
+    spaces = sum(map(len, rows)) - len(rows) + rows.count([])
+    if (text.count(' ') == spaces and text.count('\n') == len(rows) and '\t' not in text
+            and '\r' not in text and [''] not in rows and not _has_empty(text, ' ')):
+        return text
+
+    return ''.join(map(_automl_row, rows))
+
+
+def csv_to_automl(src, dest, dialect, has_header=False, chunk_size=CSV_CHUNK_SIZE,
+                  batch_rows=CSV_BATCH_ROWS):
+    """
+    Convert the CSV file `src' to the AutoML file `dest' and return its ConversionStats.
+
+    Chunks of lines without quotes, nor missing values, nor spaces in the values
+    are converted at once. From the first chunk that isn't, the rest of the file
+    is parsed row by row.
+    """
+    started = time.time()
+    rows = 0
+    plain = {ord(dialect.delimiter): ' ', ord('\r'): None}
+
+    try:
+        with open(src, newline='') as f, open(dest, 'w', buffering=WRITE_BUFFER_SIZE) as out:
+            if has_header:
+                next(csv.reader(f, dialect), None)
+
+            for lines in iter(lambda: f.readlines(chunk_size), []):
+                block = ''.join(lines)
+
+                if _is_plain(block, dialect):
+                    out.write(block.translate(plain))
+                    rows += len(lines)
+                    continue
+
+                reader = csv.reader(chain(lines, f), dialect)
+                for batch in iter(lambda: list(islice(reader, batch_rows)), []):
+                    out.write(_automl_rows(batch))
+                    rows += len(batch)
+    except:
+        if os.path.exists(dest):
+            os.remove(dest)
+        raise
+
+    return ConversionStats(rows, time.time() - started)
 
 
 def from_csv(path):
     origin_path, file = os.path.split(path)
 
-    final_path = os.path.join(origin_path, "csv")
-    os.makedirs(final_path, exist_ok=True)
-
-    origin_file = open(path, 'r')
+    with open(path, 'r', newline='') as origin_file:
+        sample = origin_file.read(1024)
 
-    dialect = csv.Sniffer().sniff(origin_file.read(1024))
-    origin_file.seek(0)
-    has_header = csv.Sniffer().has_header(origin_file.read(1024))
-    origin_file.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample)
+        has_header = csv.Sniffer().has_header(sample)
+    except csv.Error:
+        dialect, has_header = csv.excel, False  # A single column.
 
     # If already in AutoML, we do nothing
     if not has_header and dialect.delimiter == ' ':
         return origin_path
 
-    csv_file = csv.reader(origin_file, dialect)
+    final_path = os.path.join(origin_path, "csv")
+    os.makedirs(final_path, exist_ok=True)
 
-    final_file = open(os.path.join(final_path, file), "w")
+    stats = csv_to_automl(path, os.path.join(final_path, file), dialect, has_header)
+    log.info('Converted %s rows of %s from CSV in %.1fs (%d rows/s)',
+             stats.rows, file, stats.seconds, stats.rows_per_second)
 
-    # Remove header
-    if has_header:
-        next(csv_file, None)  # skip the headers
+    return final_path
 
-    for row in csv_file:
-        for val in row:
-            final_file.write(val + " ")
-        final_file.write("\n")
 
-    origin_file.close()
+# libsvm files are converted LIBSVM_CHUNK_SIZE bytes of lines at a time.
+LIBSVM_CHUNK_SIZE = 4 * 1024 * 1024
 
-    final_file.close()
 
-    return final_path
+class InvalidLibsvmException(Exception):
+    def __init__(self, msg):
+        self.message = msg
+
+
+class LibsvmReader(object):
+    """
+    A binary reader of the rows of the libsvm file `fileobj' as sparse AutoML
+    rows, `index:value' with indexes starting at 1 in both formats.
+
+    The label of each row is written to `labels', if given, as it goes by. The rows,
+    non zero values and largest feature index read so far are counted.
+    The indexes of a row are expected in increasing order, as libsvm requires.
+    """
+
+    def __init__(self, fileobj, labels=None, chunk_size=LIBSVM_CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.labels = labels
+        self.chunk_size = chunk_size
+
+        self.rows = 0
+        self.nnz = 0
+        self.max_index = 0
+
+        self._tail = b''
+        self._buffer = b''
+        self._pos = 0
+        self._eof = False
+
+    def _convert(self, lines):
+        data, labels = [], []
+
+        for line in lines:
+            tokens = line.split(b'#', 1)[0].split()
+            if not tokens:
+                continue
+
+            features = [t for t in tokens[1:] if not t.startswith(b'qid:')]
+            if features:
+                index = features[-1].split(b':', 1)[0]
+                try:
+                    self.max_index = max(self.max_index, int(index))
+                except ValueError:
+                    raise InvalidLibsvmException("Invalid feature index at row %s: %r"
+                                                 % (self.rows + len(data) + 1, index))
+
+            labels.append(tokens[0])
+            data.append(b' '.join(features))
+
+        self.rows += len(data)
+        self.nnz += sum(x.count(b':') for x in data)
+
+        if not data:
+            return b''
+
+        if self.labels is not None:
+            self.labels.write(b'\n'.join(labels) + b'\n')
+        return b'\n'.join(data) + b'\n'
+
+    def _fill(self, n):
+        while not self._eof and (n < 0 or len(self._buffer) - self._pos < n):
+            chunk = self.fileobj.read(self.chunk_size)
+
+            if chunk:
+                lines = (self._tail + chunk).split(b'\n')
+                self._tail = lines.pop()
+            else:
+                lines, self._eof = [self._tail], True
+
+            self._buffer = self._buffer[self._pos:] + self._convert(lines)
+            self._pos = 0
+
+    def read(self, n=-1):
+        self._fill(n)
+
+        end = len(self._buffer) if n < 0 else self._pos + n
+        data = self._buffer[self._pos:end]
+        self._pos += len(data)
+        return data
 
 
 def from_libsvm(path):
+    """
+    Split the libsvm file in the sparse .data and the .solution of its labels,
+    with a _public.info giving their format and the number of features.
+    """
     origin_path, file = os.path.split(path)
+    name = os.path.splitext(file)[0]
 
     final_path = os.path.join(origin_path, "libsvm")
     os.makedirs(final_path, exist_ok=True)
 
-    origin_file = open(path, 'r')
-    lines = origin_file.readlines()
-    origin_file.close()
+    final_name = os.path.join(final_path, name)
+    with open(path, 'rb') as origin_file, \
+            open(final_name + '.solution', 'wb') as labels, \
+            open(final_name + '.data', 'wb', buffering=WRITE_BUFFER_SIZE) as final_file:
+        reader = LibsvmReader(origin_file, labels)
+        for chunk in iter(lambda: reader.read(WRITE_BUFFER_SIZE), b''):
+            final_file.write(chunk)
 
-    final_file = open(os.path.join(final_path, file), "w")
+    with open(final_name + '_public.info', 'w') as info:
+        info.write("is_sparse = 1\nfeat_num = %s\ntrain_num = %s\n"
+                   % (reader.max_index, reader.rows))
 
-    final_file.write("libsdfhkfdhfkhsd\n")
-    for line in lines:
-        final_file.write(line)
+    return final_path
 
-    final_file.close()
 
-    return final_path
+class InvalidArffException(Exception):
+    def __init__(self, msg):
+        self.message = msg
+
+
+ARFF_ATTRIBUTE = re.compile(r"""@attribute\s+('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|\S+)\s+(.*)$""",
+                            re.IGNORECASE)
+ARFF_NUMERIC = {'numeric', 'real', 'integer'}
+
+
+def _arff_values(text):
+    """The comma separated values of `text', quoted with ' or "."""
+    if "'" not in text and '"' not in text:
+        return [v.strip() for v in text.split(',')]
+
+    quotechar = "'" if "'" in text else '"'
+    return next(csv.reader([text], quotechar=quotechar, escapechar='\\',
+                           skipinitialspace=True))
+
+
+class ArffAttribute(object):
+    """An attribute of an ARFF header, encoding its values as AutoML numbers."""
+
+    def __init__(self, name, kind):
+        self.name = name.strip('\'"')
+        self.codes = None
+        self.fixed = True
+
+        kind = kind.strip()
+        lower = kind.lower()
+
+        if kind.startswith('{'):
+            # Nominal values are coded by their rank, the first one is 0 as in sparse rows.
+            values = _arff_values(kind.strip('{}'))
+            self.codes = {v: str(i) for i, v in enumerate(values)}
+            self.type = 'Binary' if len(values) == 2 else 'Categorical'
+        elif lower in ARFF_NUMERIC:
+            self.type = 'Numerical'
+        elif lower == 'string' or lower.startswith('date'):
+            # Coded in their order of appearance.
+            self.codes = {}
+            self.type = 'Categorical'
+            self.fixed = False
+        else:
+            raise InvalidArffException("Unsupported type for the attribute %s: %s"
+                                       % (self.name, kind))
+
+    def encode(self, value):
+        if value == '?' or value == '':
+            return 'NaN'
+        if self.codes is None:
+            return value
+
+        code = self.codes.get(value)
+        if code is None:
+            if self.fixed:
+                raise InvalidArffException("Unexpected value for the attribute %s: %s"
+                                           % (self.name, value))
+            code = self.codes[value] = str(len(self.codes))
+        return code
+
+
+class ArffConverter(object):
+    """
+    Convert an ARFF file to AutoML, a line at a time.
+
+    Dense rows are written as dense AutoML rows, sparse `{index value, ...}' rows
+    as sparse AutoML rows. The first row sets the layout of the output, the rows
+    in the other layout are converted to it.
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.attributes = []
+        self.sparse = None
+        self.rows = 0
+
+        self._in_data = False
+        self._numeric = False
+
+    def header(self, line):
+        basic_line = line.lower()
+
+        if basic_line.startswith('@attribute'):
+            m = ARFF_ATTRIBUTE.match(line)
+            if m is None:
+                raise InvalidArffException("Invalid attribute: %s" % line)
+            self.attributes.append(ArffAttribute(*m.groups()))
+        elif basic_line == '@data':
+            self._in_data = True
+            self._numeric = all(a.codes is None for a in self.attributes)
+
+    def _dense_values(self, line):
+        if line.endswith('}'):
+            line = line[:line.rindex('{')].rstrip().rstrip(',')  # The weight of the row.
+
+        values = _arff_values(line)
+        if self.attributes:
+            if len(values) != len(self.attributes):
+                raise InvalidArffException("Expected %s values, got %s at row %s"
+                                           % (len(self.attributes), len(values), self.rows + 1))
+            return [a.encode(v) for a, v in zip(self.attributes, values)]
+        return ['NaN' if v in ('?', '') else v for v in values]
+
+    def _sparse_values(self, line):
+        """The (index, value) of the sparse row `line', indexes starting at 0."""
+        body = line[1:line.index('}')]
+        pairs = []
+
+        for pair in _arff_values(body) if body.strip() else []:
+            index, _, value = pair.strip().partition(' ')
+            i = int(index)
+            if i >= len(self.attributes):
+                raise InvalidArffException("Unexpected index %s at row %s" % (i, self.rows + 1))
+            pairs.append((i, self.attributes[i].encode(value.strip())))
+
+        return pairs
+
+    def _row(self, line):
+        sparse_row = line.startswith('{')
+        if self.sparse is None:
+            self.sparse = sparse_row
+
+        if (not sparse_row and self._numeric and not self.sparse and '?' not in line
+                and "'" not in line and '"' not in line and not line.endswith('}')
+                and line.count(',') == len(self.attributes) - 1):
+            return line.replace(',', ' ')
+
+        if not sparse_row and not self.sparse:
+            return ' '.join(self._dense_values(line))
+
+        if sparse_row:
+            pairs = self._sparse_values(line)
+        else:
+            pairs = list(enumerate(self._dense_values(line)))
+
+        if self.sparse:
+            return ' '.join('%s:%s' % (i + 1, v) for i, v in pairs if v != '0')
+
+        values = ['0'] * len(self.attributes)
+        for i, v in pairs:
+            values[i] = v
+        return ' '.join(values)
+
+    def feed(self, line):
+        line = line.strip()
+        if not line or line.startswith('%'):
+            return
+
+        if not self._in_data and line.startswith('@'):
+            self.header(line)
+            return
+
+        # Files without a header hold data only.
+        self._in_data = True
+        self.out.write(self._row(line) + '\n')
+        self.rows += 1
+
+    @property
+    def names(self):
+        return [a.name for a in self.attributes]
+
+    @property
+    def types(self):
+        return [a.type for a in self.attributes]
+
+
+def arff_to_automl(src, dest):
+    """Convert the ARFF file `src' to the AutoML file `dest', return the ArffConverter."""
+    try:
+        with open(src, 'r') as f, open(dest, 'w', buffering=WRITE_BUFFER_SIZE) as out:
+            converter = ArffConverter(out)
+            for line in f:
+                converter.feed(line)
+    except:
+        if os.path.exists(dest):
+            os.remove(dest)
+        raise
+
+    return converter
 
 
 def from_arff(path):
+    """
+    Convert the ARFF file, the attributes of a .data file are described in its
+    _feat.name and _feat.type files, sparse data in its _public.info.
+    """
     origin_path, file = os.path.split(path)
+    name, suffix = os.path.splitext(file)
 
     final_path = os.path.join(origin_path, "arff")
     os.makedirs(final_path, exist_ok=True)
 
-    origin_file = open(path, 'r')
-    lines = origin_file.readlines()
-    origin_file.close()
-
-    final_file = open(os.path.join(final_path, file), "w")
-
-    attribute = []
+    converter = arff_to_automl(path, os.path.join(final_path, file))
 
-    for line in lines:
-        if line.strip():
-            if line.startswith('@'):
-                if line.lower().startswith('@attribute'):
-                    attribute.append(line[11:])
-            elif line.startswith('%'):
-                pass
-            else:
-                final_file.write(line.replace(",", " "))
+    if suffix != '.data' or not converter.attributes:
+        return final_path
 
-    final_file.close()
+    final_name = os.path.join(final_path, name)
+    with open(final_name + '_feat.name', 'w') as f:
+        f.writelines('%s\n' % x for x in converter.names)
+    with open(final_name + '_feat.type', 'w') as f:
+        f.writelines('%s\n' % x for x in converter.types)
 
-    final_file_name = open(os.path.join(final_path, os.path.splitext(file)[0] + '_feat.name'), "w")
-    for line in attribute:
-        final_file_name.write(line)
-    final_file_name.close()
+    if converter.sparse:
+        with open(final_name + '_public.info', 'w') as info:
+            info.write("is_sparse = 1\nfeat_num = %s\n" % len(converter.attributes))
 
     return final_path
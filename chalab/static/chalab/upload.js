@@ -0,0 +1,129 @@
+/*
+ * Upload a file chunk by chunk, see wizard.views.data_upload.
+ *
+ * Each chunk is sent with its offset and sha256. Failed chunks are retried,
+ * an upload interrupted by a reload resumes from the last chunk received.
+ */
+(function ($) {
+    var RETRIES = 5;
+    var RETRY_DELAY = 2000;
+
+    function hex(buffer) {
+        var bytes = new Uint8Array(buffer), r = '';
+        for (var i = 0; i < bytes.length; i++) {
+            r += ('0' + bytes[i].toString(16)).slice(-2);
+        }
+        return r;
+    }
+
+    function read(blob) {
+        return new Promise(function (resolve, reject) {
+            var reader = new FileReader();
+            reader.onload = function () { resolve(reader.result); };
+            reader.onerror = function () { reject(reader.error); };
+            reader.readAsArrayBuffer(blob);
+        });
+    }
+
+    function sendChunk(url, csrf, blob, offset) {
+        return read(blob).then(function (buffer) {
+            return crypto.subtle.digest('SHA-256', buffer).then(function (digest) {
+                return $.ajax({
+                    url: url, type: 'POST', data: buffer, processData: false,
+                    contentType: 'application/octet-stream',
+                    headers: {'X-CSRFToken': csrf,
+                              'Upload-Offset': offset,
+                              'Upload-Checksum': hex(digest)}
+                });
+            });
+        });
+    }
+
+    window.chunkedUploadSupported = function () {
+        return !!(window.crypto && crypto.subtle && window.Promise && Blob.prototype.slice);
+    };
+
+    /*
+     * options: file, url (the data.upload url), csrf, fields (the other fields of
+     * the form, as given by serializeArray), onProgress(offset, size), onDone(),
+     * onError(message).
+     *
+     * The fields are sent when the upload starts or resumes, the server validates
+     * and saves them as a regular post of the form would.
+     */
+    window.chunkedUpload = function (options) {
+        var file = options.file;
+        var key = 'chalab-upload:' + options.url + ':' + file.name + ':' + file.size + ':'
+            + file.lastModified;
+        var url, chunkSize, retries = RETRIES;
+
+        function next(status) {
+            options.onProgress(status.offset, status.size);
+
+            if (status.complete) {
+                localStorage.removeItem(key);
+                options.onDone();
+                return;
+            }
+
+            var blob = file.slice(status.offset, status.offset + chunkSize);
+            sendChunk(url, options.csrf, blob, status.offset)
+                .then(function (s) { retries = RETRIES; next(s); },
+                      function (xhr) { failed(xhr, status); });
+        }
+
+        function failed(xhr, status) {
+            var s = xhr && xhr.responseJSON;
+            if (s && s.offset !== undefined && xhr.status == 409) {
+                next(s);  // The server is somewhere else, resume from there.
+            } else if (retries-- > 0) {
+                window.setTimeout(function () { next((s && s.offset !== undefined) ? s : status); },
+                                  RETRY_DELAY);
+            } else {
+                options.onError((s && s.error) || 'The upload failed, please retry.');
+            }
+        }
+
+        function post(extra) {
+            return $.ajax({url: options.url, type: 'POST',
+                           data: $.param((options.fields || []).concat(extra)),
+                           headers: {'X-CSRFToken': options.csrf}});
+        }
+
+        function error(xhr, message) {
+            options.onError((xhr.responseJSON && xhr.responseJSON.error) || message);
+        }
+
+        function start() {
+            post([{name: 'filename', value: file.name}, {name: 'size', value: file.size}])
+                .done(function (s) {
+                    localStorage.setItem(key, JSON.stringify({id: s.id, chunkSize: s.chunk_size}));
+                    url = options.url + '/' + s.id;
+                    chunkSize = s.chunk_size;
+                    next(s);
+                })
+                .fail(function (xhr) {
+                    error(xhr, 'The upload could not start.');
+                });
+        }
+
+        var previous = JSON.parse(localStorage.getItem(key) || 'null');
+        if (previous === null) {
+            start();
+            return;
+        }
+
+        url = options.url + '/' + previous.id;
+        chunkSize = previous.chunkSize;
+        post([{name: 'resume', value: previous.id}])
+            .done(next)
+            .fail(function (xhr) {
+                if (xhr.status == 404) {
+                    localStorage.removeItem(key);  // complete or expired.
+                    start();
+                } else {
+                    error(xhr, 'The upload could not resume.');
+                }
+            });
+    };
+}(jQuery));
@@ -1,8 +1,19 @@
+import os
+import shutil
+import time
+import zlib
 from contextlib import contextmanager
-from zipfile import ZipFile
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED, ZIP64_LIMIT
 
 from .fs import tmp_dir
 
+COPY_CHUNK_SIZE = 1024 * 1024
+STORED_SUFFIXES = ('.zip',)
+
+# What `write_deflated' uses of ZipFile beyond its public API.
+ZIPFILE_INTERNALS = ('_lock', '_writing', '_seekable', '_writecheck', '_didModify', 'start_dir',
+                     'fp', 'filelist', 'NameToInfo')
+
 
 @contextmanager
 def unzip_fp(f):
@@ -10,12 +21,178 @@ def unzip_fp(f):
         zf = ZipFile(f, mode='r')
         members = zf.namelist()
 
-        members = [m for m in members
-                   if (('__MACOS' not in m) and
-                       (not m.startswith('/')) and
-                       (not '..' in m))]
+        members = [m for m in members if is_safe_member(m)]
 
         for member in members:
             zf.extract(member, path=tmp)
 
         yield tmp
+
+
+class InvalidArchiveException(Exception):
+    def __init__(self, msg):
+        self.message = msg
+
+
+def is_safe_member(name):
+    return '__MACOS' not in name and not name.startswith('/') and '..' not in name
+
+
+def members(zf):
+    """The files of the opened ZipFile `zf', as found in its central directory."""
+    return [i for i in zf.infolist()
+            if not i.filename.endswith('/') and is_safe_member(i.filename)]
+
+
+def check_sizes(infos, max_size=None, max_ratio=None):
+    """
+    Check the sizes the central directory gives for the members `infos',
+    before any of them is read: at most `max_size' bytes once extracted,
+    and compressed at most `max_ratio' times.
+
+    Reading a member fails past its size, it can't be larger than announced.
+    """
+    total = sum(i.file_size for i in infos)
+    if max_size is not None and total > max_size:
+        raise InvalidArchiveException("The archive holds %s bytes once extracted, "
+                                      "more than the %s allowed" % (total, max_size))
+
+    for i in infos:
+        if max_ratio is not None and i.file_size > max_ratio * max(i.compress_size, 1):
+            raise InvalidArchiveException("%s is compressed more than %s times"
+                                          % (i.filename, max_ratio))
+
+
+def extract_member(zf, info, path):
+    """Write the member `info' of the opened ZipFile `zf' to `path'."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with zf.open(info) as src, open(path, 'wb') as dest:
+        shutil.copyfileobj(src, dest, COPY_CHUNK_SIZE)
+
+
+def write_fileobj(zf, name, fileobj, compress_type=ZIP_DEFLATED, callback=None,
+                  date_time=None):
+    """
+    Write the content of `fileobj' to the entry `name' of the opened ZipFile `zf',
+    chunk by chunk, without going through a temporary file.
+
+    `callback' is called with the size of each chunk once written.
+    """
+    info = ZipInfo(name, date_time=date_time or time.localtime(time.time())[:6])
+    info.compress_type = compress_type
+    info.external_attr = 0o644 << 16
+
+    # The size isn't known beforehand, allow for entries larger than 2GB.
+    with zf.open(info, mode='w', force_zip64=True) as dest:
+        for chunk in iter(lambda: fileobj.read(COPY_CHUNK_SIZE), b''):
+            dest.write(chunk)
+
+            if callback is not None:
+                callback(len(chunk))
+
+
+def write_deflated(zf, name, fileobj, compress_size, file_size, crc, date_time=None,
+                   callback=None):
+    """
+    Write the entry `name' of the opened ZipFile `zf' from the raw deflate data read
+    from `fileobj', already compressed: it is copied without being decompressed.
+
+    `callback' is called with the uncompressed size each copied chunk stands for.
+    This goes through the internals of ZipFile, as of Python 3.6. When one of them
+    is missing, the data is decompressed and compressed again instead.
+    """
+    info = ZipInfo(name, date_time=date_time or time.localtime(time.time())[:6])
+    info.compress_type = ZIP_DEFLATED
+    info.external_attr = 0o644 << 16
+
+    if not all(hasattr(zf, a) for a in ZIPFILE_INTERNALS):
+        with zf.open(info, mode='w', force_zip64=True) as dest:
+            for chunk in inflated(fileobj, compress_size, name):
+                dest.write(chunk)
+
+                if callback is not None:
+                    callback(len(chunk))
+
+        if (info.file_size, info.CRC) != (file_size, crc):
+            raise ValueError("%s: the compressed data doesn't match its size and CRC" % name)
+        return
+
+    info.file_size, info.compress_size, info.CRC = file_size, compress_size, crc
+
+    zip64 = file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT
+
+    with zf._lock:
+        if zf._writing:
+            raise ValueError("Can't write to the ZIP file while there is an open writing handle")
+
+        if zf._seekable:
+            zf.fp.seek(zf.start_dir)
+        info.header_offset = zf.fp.tell()
+        zf._writecheck(info)
+        zf._didModify = True
+
+        zf.fp.write(info.FileHeader(zip64))
+
+        left = compress_size
+        while left > 0:
+            chunk = fileobj.read(min(COPY_CHUNK_SIZE, left))
+            if not chunk:
+                raise EOFError("%s: the compressed data ended %s bytes early" % (name, left))
+
+            zf.fp.write(chunk)
+            left -= len(chunk)
+
+            if callback is not None:
+                callback(len(chunk) * file_size // max(compress_size, 1))
+
+        zf.filelist.append(info)
+        zf.NameToInfo[name] = info
+        zf.start_dir = zf.fp.tell()
+
+
+def inflated(fileobj, compress_size, name):
+    """The chunks of the `compress_size' bytes of raw deflate data read from `fileobj', inflated."""
+    d = zlib.decompressobj(-zlib.MAX_WBITS)
+
+    left = compress_size
+    while left > 0:
+        chunk = fileobj.read(min(COPY_CHUNK_SIZE, left))
+        if not chunk:
+            raise EOFError("%s: the compressed data ended %s bytes early" % (name, left))
+        left -= len(chunk)
+
+        # Bounded, a chunk can inflate to much more than its size.
+        while chunk:
+            yield d.decompress(chunk, COPY_CHUNK_SIZE)
+            chunk = d.unconsumed_tail
+
+    yield d.flush()
+
+
+def dir_size(root):
+    return sum(os.path.getsize(os.path.join(current, f))
+               for current, _, files in os.walk(root)
+               for f in files)
+
+
+def write_dir(zf, root, callback=None):
+    """
+    Write every file found under `root' in the opened ZipFile `zf',
+    with names relative to `root'.
+
+    Nested archives are stored as is: compressing them again only costs time.
+    `callback' is called with the size of each chunk once written.
+    """
+    for current, dirs, files in os.walk(root):
+        dirs.sort()
+
+        for f in sorted(files):
+            p = os.path.join(current, f)
+            compress_type = ZIP_STORED if f.endswith(STORED_SUFFIXES) else ZIP_DEFLATED
+            date_time = time.localtime(os.path.getmtime(p))[:6]
+
+            with open(p, 'rb') as fileobj:
+                write_fileobj(zf, os.path.relpath(p, root), fileobj,
+                              compress_type=compress_type, callback=callback,
+                              date_time=date_time)
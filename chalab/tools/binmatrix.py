@@ -0,0 +1,226 @@
+"""
+Binary copies of the AutoML matrices, stored next to the text file and memory-mapped
+when read, so the values are available without parsing the text again.
+
+Dense matrices are stored as rows * cols float64 values, row after row. Values
+that are not numbers, and the values missing from short rows, are NaN.
+
+Sparse matrices are stored in the CSR layout: `indptr', rows + 1 uint64 offsets in
+`indices' and `data', then `indices', the uint32 0-based column of each value,
+then `data', the float64 values. Sections are padded to 8 bytes.
+
+The header keeps the size and modification time of the text file,
+a copy that doesn't match them anymore is stale. Numbers use the byte order of
+the machine.
+"""
+import mmap
+import os
+import shutil
+from array import array
+from struct import Struct, error as StructError
+from tempfile import NamedTemporaryFile, TemporaryFile
+
+from .compressed import open_plain
+from .matrix import iter_lines, number
+
+DENSE = b'CHLBDNS1'
+SPARSE = b'CHLBCSR1'
+HEADER = Struct('=8sQQQQQ')  # magic, source size, source mtime in ns, rows, cols, nnz
+SUFFIX = '.bin'
+
+BATCH_ROWS = 4096
+NAN = float('nan')
+
+
+class InvalidBinaryMatrixException(Exception):
+    def __init__(self, msg):
+        self.message = msg
+
+
+def binary_path(path):
+    return path + SUFFIX
+
+
+def _padding(n):
+    return -n % 8
+
+
+def _dense_values(tokens, cols):
+    try:
+        values = list(map(float, tokens))
+    except ValueError:
+        values = [NAN if v is None else v for v in map(number, tokens)]
+
+    if len(values) != cols:
+        values = (values + [NAN] * cols)[:cols]
+    return values
+
+
+def _write_dense(fileobj, out):
+    rows, cols = 0, None
+    batch = array('d')
+
+    for line in iter_lines(fileobj):
+        tokens = line.split()
+        if cols is None:
+            cols = len(tokens)
+
+        batch.extend(_dense_values(tokens, cols))
+        rows += 1
+
+        if rows % BATCH_ROWS == 0:
+            batch.tofile(out)
+            batch = array('d')
+
+    batch.tofile(out)
+    return rows, cols or 0, 0
+
+
+def _write_sparse(fileobj, out):
+    rows, cols = 0, 0
+    indptr = array('Q', [0])
+
+    # The indices and data sections are only known once all the rows are read.
+    with TemporaryFile() as indices_f, TemporaryFile() as data_f:
+        indices, data = array('I'), array('d')
+
+        for line in iter_lines(fileobj):
+            tokens = line.split()
+
+            for t in tokens:
+                i, _, v = t.partition(b':')
+                i, v = int(i) - 1, number(v)
+
+                indices.append(i)
+                data.append(NAN if v is None else v)
+                cols = max(cols, i + 1)
+
+            rows += 1
+            indptr.append(indptr[-1] + len(tokens))
+
+            if len(data) >= BATCH_ROWS:
+                indices.tofile(indices_f), data.tofile(data_f)
+                indices, data = array('I'), array('d')
+
+        indices.tofile(indices_f), data.tofile(data_f)
+
+        indptr.tofile(out)
+        for f in (indices_f, data_f):
+            f.seek(0)
+            shutil.copyfileobj(f, out)
+            out.write(b'\0' * _padding(f.tell()))
+
+    return rows, cols, indptr[-1]
+
+
+def build(source, sparse=False, path=None):
+    """Write the binary copy of the text matrix `source', atomically."""
+    path = path or binary_path(source)
+    st = os.stat(source)
+
+    with open_plain(source) as f, \
+            NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as out:
+        out.write(b'\0' * HEADER.size)
+
+        if sparse:
+            rows, cols, nnz = _write_sparse(f, out)
+        else:
+            rows, cols, nnz = _write_dense(f, out)
+
+        out.seek(0)
+        out.write(HEADER.pack(SPARSE if sparse else DENSE,
+                              st.st_size, st.st_mtime_ns, rows, cols, nnz))
+
+    os.replace(out.name, path)
+    return path
+
+
+def is_current(source, sparse=False, path=None):
+    """Whether the binary copy of `source' exists and matches it."""
+    path = path or binary_path(source)
+
+    try:
+        with open(path, 'rb') as f:
+            magic, size, mtime, _, _, _ = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, StructError):
+        return False
+
+    st = os.stat(source)
+    return (magic == (SPARSE if sparse else DENSE) and
+            size == st.st_size and mtime == st.st_mtime_ns)
+
+
+class BinaryMatrix(object):
+    """A memory-mapped binary matrix, dense or sparse."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.size, self.mtime, self.rows, self.cols, self.nnz = \
+            HEADER.unpack_from(self._mmap)
+
+        if magic not in (DENSE, SPARSE):
+            self._mmap.close()
+            raise InvalidBinaryMatrixException("Not a binary matrix: %s" % path)
+
+        self.sparse = magic == SPARSE
+        self._views = []
+        body = self._view(HEADER.size, len(self._mmap))
+
+        if self.sparse:
+            n = (self.rows + 1) * 8
+            m = self.nnz * 4 + _padding(self.nnz * 4)
+            self.indptr = self._view(HEADER.size, HEADER.size + n, 'Q')
+            self.indices = self._view(HEADER.size + n, HEADER.size + n + self.nnz * 4, 'I')
+            self.data = self._view(HEADER.size + n + m, HEADER.size + n + m + self.nnz * 8, 'd')
+        else:
+            self.data = body.cast('d')
+            self._views.append(self.data)
+
+    def _view(self, start, end, fmt=None):
+        v = memoryview(self._mmap)[start:end]
+        self._views.append(v)
+        if fmt is not None:
+            v = v.cast(fmt)
+            self._views.append(v)
+        return v
+
+    def __len__(self):
+        return self.rows
+
+    def row(self, i):
+        """
+        Return the values of the row `i', a view on the file.
+        For sparse matrices, return the columns and the values of the row.
+        """
+        if not 0 <= i < self.rows:
+            raise IndexError('row %s out of %s rows' % (i, self.rows))
+
+        if self.sparse:
+            start, end = self.indptr[i], self.indptr[i + 1]
+            return self.indices[start:end], self.data[start:end]
+
+        return self.data[i * self.cols:(i + 1) * self.cols]
+
+    def close(self):
+        for v in reversed(self._views):
+            v.release()
+
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # rows are still referenced, the mapping goes away with them.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_binary(source, sparse=False):
+    """Open the binary copy of `source', building it first if it's missing or stale."""
+    if not is_current(source, sparse):
+        build(source, sparse)
+    return BinaryMatrix(binary_path(source))
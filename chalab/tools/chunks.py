@@ -0,0 +1,102 @@
+"""
+Split files in byte ranges aligned on lines, to go through them in parallel.
+"""
+import os
+
+from billiard.pool import Pool
+
+READ_SIZE = 1024 * 1024
+PARALLEL_SIZE = 64 * 1024 * 1024
+
+
+def line_ranges(path, parts):
+    """
+    Return about `parts' (start, end) byte ranges covering the file,
+    each range starts at the beginning of a line.
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+
+    with open(path, 'rb') as f:
+        for k in range(1, parts):
+            pos = size * k // parts
+            if pos <= bounds[-1]:
+                continue
+
+            f.seek(pos - 1)
+            f.readline()  # the range ends after the line holding `pos - 1'
+            if bounds[-1] < f.tell() < size:
+                bounds.append(f.tell())
+
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+class RangeReader(object):
+    """A binary reader for the bytes [start, end) of the file `f'."""
+
+    def __init__(self, f, start, end):
+        self.f = f
+        self.left = end - start
+        f.seek(start)
+
+    def read(self, n=-1):
+        if n < 0 or n > self.left:
+            n = self.left
+        data = self.f.read(n)
+        self.left -= len(data)
+        return data
+
+
+def map_ranges(fn, path, args=(), workers=1, min_size=PARALLEL_SIZE):
+    """
+    Call `fn(path, start, end, *args)' on ranges of lines of the file and return
+    the results, in the order of the file.
+
+    Files of `min_size' bytes or more are split in `workers' ranges going through
+    a pool of processes, smaller files get a single call on the whole file.
+    The pool is billiard's: unlike multiprocessing, it can start processes from
+    daemonic processes such as the celery workers.
+    """
+    size = os.path.getsize(path)
+
+    if workers <= 1 or size < min_size:
+        return [fn(path, 0, size, *args)]
+
+    ranges = line_ranges(path, workers)
+    pool = Pool(processes=len(ranges))
+
+    try:
+        futures = [pool.apply_async(fn, (path, start, end) + tuple(args))
+                   for start, end in ranges]
+        results = [f.get() for f in futures]
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+    return results
+
+
+def _count_range(path, start, end):
+    lines, last = 0, b''
+
+    with open(path, 'rb') as f:
+        r = RangeReader(f, start, end)
+        for chunk in iter(lambda: r.read(READ_SIZE), b''):
+            lines += chunk.count(b'\n')
+            last = chunk[-1:]
+
+    return lines, last
+
+
+def count_lines(path, workers=1, min_size=PARALLEL_SIZE):
+    """Return the number of lines of the file, the last one may have no end of line."""
+    counts = map_ranges(_count_range, path, workers=workers, min_size=min_size)
+
+    lines = sum(n for n, _ in counts)
+    last = counts[-1][1]
+    return lines + (1 if last not in (b'', b'\n') else 0)
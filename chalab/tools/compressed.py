@@ -0,0 +1,99 @@
+"""
+Gzip files that know their uncompressed size, for the matrices compressed at rest.
+
+Each file is a single gzip member, readable by any gzip tool. Its header has
+an extra field `CL' holding the uncompressed size on 8 bytes (the gzip trailer
+only has it modulo 4GB). The deflate data can be copied as is into a zip
+archive, see `chalab.tools.archives.write_deflated'.
+"""
+import gzip
+import os
+import zlib
+from collections import namedtuple
+from struct import Struct, error as StructError
+
+SUFFIX = '.gz'
+CHUNK_SIZE = 1024 * 1024
+
+EXTRA_ID = b'CL'
+FEXTRA = 4
+OS_UNKNOWN = 255
+
+# magic, method, flags, mtime, extra flags, os, extra length, extra id, field length, size
+HEADER = Struct('<2sBBIBBH2sHQ')
+TRAILER = Struct('<II')  # crc32, size modulo 4GB
+
+Info = namedtuple('Info', ['size', 'crc', 'data_offset', 'data_size'])
+
+
+class InvalidCompressedFileException(Exception):
+    def __init__(self, msg):
+        self.message = msg
+
+
+def is_compressed(name):
+    return name.endswith(SUFFIX)
+
+
+def compress(src, dest, level=6):
+    """Compress the binary `src' into the seekable `dest', return the uncompressed size."""
+    start = dest.tell()
+    dest.write(b'\0' * HEADER.size)
+
+    c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    crc, size = 0, 0
+
+    for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        dest.write(c.compress(chunk))
+
+    dest.write(c.flush())
+    dest.write(TRAILER.pack(crc, size & 0xffffffff))
+
+    end = dest.tell()
+    dest.seek(start)
+    dest.write(HEADER.pack(b'\x1f\x8b', zlib.DEFLATED, FEXTRA, 0, 0, OS_UNKNOWN,
+                           4 + 8, EXTRA_ID, 8, size))
+    dest.seek(end)
+
+    return size
+
+
+def compress_file(path, dest_path, level=6):
+    with open(path, 'rb') as src, open(dest_path, 'wb') as dest:
+        return compress(src, dest, level)
+
+
+def info(path):
+    """Return the sizes and crc32 of the compressed file, and where its deflate data is."""
+    total = os.path.getsize(path)
+
+    try:
+        with open(path, 'rb') as f:
+            magic, method, flags, _, _, _, _, extra_id, _, size = \
+                HEADER.unpack(f.read(HEADER.size))
+            f.seek(total - TRAILER.size)
+            crc, _ = TRAILER.unpack(f.read(TRAILER.size))
+    except StructError as e:
+        raise InvalidCompressedFileException("Truncated file: %s" % path) from e
+
+    if magic != b'\x1f\x8b' or method != zlib.DEFLATED or flags != FEXTRA or extra_id != EXTRA_ID:
+        raise InvalidCompressedFileException("Not a compressed matrix file: %s" % path)
+
+    return Info(size=size, crc=crc, data_offset=HEADER.size,
+                data_size=total - HEADER.size - TRAILER.size)
+
+
+def open_plain(path, mode='rb'):
+    """Open the file at `path' for reading its uncompressed content."""
+    if is_compressed(path):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def plain_size(path):
+    """The uncompressed size of the file at `path'."""
+    if is_compressed(path):
+        return info(path).size
+    return os.path.getsize(path)
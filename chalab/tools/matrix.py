@@ -0,0 +1,314 @@
+"""
+Profile the matrices of the AutoML format in a single streaming pass.
+
+Dense files hold a row of whitespace separated values per line,
+sparse files a row of `index:value' pairs, indexes starting at 1.
+"""
+import os
+from array import array
+from collections import defaultdict
+
+from .chunks import PARALLEL_SIZE, RangeReader, map_ranges
+
+CHUNK_SIZE = 1024 * 1024
+
+INF = float('inf')
+
+
+def number(token):
+    """The value of `token', None if it is not a number or NaN."""
+    try:
+        v = float(token)
+    except ValueError:
+        return None
+    return v if v == v else None
+
+
+class InvalidMatrixException(Exception):
+    def __init__(self, msg):
+        self.message = msg
+
+
+class MatrixProfile(object):
+    def __init__(self, sparse=False):
+        self.sparse = sparse
+
+        self.rows = 0
+        self.cols = 0
+        self.consistent = True
+        self.first_inconsistent_line = None  # 1-based
+
+        self.values = 0  # values found in the file
+        self.nnz = 0  # non zero values, the missing ones aren't
+
+        # Per column, None where a column holds no number.
+        self.mins = []
+        self.maxs = []
+        self.missing = []
+
+    @property
+    def sparsity(self):
+        """Ratio of zero values in the matrix."""
+        if self.sparse:
+            size = self.rows * self.cols
+        else:
+            size = self.values
+
+        if not size:
+            return 0.0
+        return 1.0 - self.nnz / size
+
+    @property
+    def columns(self):
+        return {'min': self.mins, 'max': self.maxs, 'missing': self.missing}
+
+    def __repr__(self):
+        return "<%s: rows=%s, cols=%s, consistent=%s, nnz=%s>" \
+               % (type(self).__name__, self.rows, self.cols, self.consistent, self.nnz)
+
+
+def iter_lines(fileobj, chunk_size=CHUNK_SIZE):
+    """
+    Yield the lines of the binary `fileobj', without their end of line.
+
+    Reads `chunk_size' bytes at a time, only the current line is kept across chunks.
+    """
+    tail = b''
+
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+
+        lines = (tail + chunk).split(b'\n')
+        tail = lines.pop()
+        yield from lines
+
+    if tail:
+        yield tail
+
+
+def _recorded(lines, offsets, pos=0):
+    """Pass the lines through, appending their start offset to `offsets'."""
+    for line in lines:
+        offsets.append(pos)
+        pos += len(line) + 1
+        yield line
+
+
+def _columns(mins, maxs):
+    """Replace the bounds of the columns that saw no number by None."""
+    empty = [lo == INF and hi == -INF for lo, hi in zip(mins, maxs)]
+    return ([None if e else x for e, x in zip(empty, mins)],
+            [None if e else x for e, x in zip(empty, maxs)])
+
+
+def _add_rows(rows, mins, maxs, missing):
+    """
+    Add the bounds of full rows to the columns, a column at a time.
+    Return the number of non zero values.
+    """
+    nnz = 0
+
+    for i, column in enumerate(zip(*rows)):
+        try:
+            values = list(map(float, column))
+        except ValueError:
+            values = [x for x in map(number, column) if x is not None]
+            missing[i] += len(column) - len(values)
+
+        nnz += len(values) - values.count(0.0)
+        if values:
+            mins[i], maxs[i] = min(mins[i], min(values)), max(maxs[i], max(values))
+
+    return nnz
+
+
+def _profile_dense(p, lines, cols=None, batch_size=4096):
+    mins = maxs = missing = None
+    batch = []
+
+    if cols is not None:
+        mins, maxs, missing = [INF] * cols, [-INF] * cols, [0] * cols
+
+    for line in lines:
+        p.rows += 1
+        tokens = line.split()
+        n = len(tokens)
+
+        if cols is None:
+            cols = n
+            mins, maxs, missing = [INF] * n, [-INF] * n, [0] * n
+        elif n != cols and tokens and p.consistent:
+            p.consistent = False
+            p.first_inconsistent_line = p.rows
+
+        p.values += n
+
+        if not tokens:
+            continue
+
+        # Full rows without NaN or inf are batched, columns are then parsed by the builtins.
+        if n == cols and b'n' not in line and b'N' not in line:
+            batch.append(tokens)
+            if len(batch) >= batch_size:
+                p.nnz += _add_rows(batch, mins, maxs, missing)
+                batch = []
+            continue
+
+        for i, t in enumerate(tokens):
+            v = number(t)
+            p.nnz += v is not None and v != 0.0
+
+            if i >= cols:
+                continue
+            elif v is None:
+                missing[i] += 1
+            else:
+                mins[i], maxs[i] = min(mins[i], v), max(maxs[i], v)
+
+        for i in range(n, cols):
+            missing[i] += 1
+
+    if batch:
+        p.nnz += _add_rows(batch, mins, maxs, missing)
+
+    p.cols = cols or 0
+    p.mins, p.maxs = _columns(mins or [], maxs or [])
+    p.missing = missing or []
+
+
+def _profile_sparse(p, lines):
+    mins, maxs = defaultdict(lambda: INF), defaultdict(lambda: -INF)
+    missing = defaultdict(int)
+
+    for line in lines:
+        p.rows += 1
+
+        for t in line.split():
+            i, sep, v = t.partition(b':')
+            try:
+                i, v = int(i) - 1, number(v)
+            except ValueError:
+                i = -1
+
+            if not sep or i < 0:
+                raise InvalidMatrixException("Row %s: `%s' is not an index:value pair, indexes "
+                                             "start at 1" % (p.rows, t.decode('latin-1')))
+
+            p.values += 1
+            p.nnz += v is not None and v != 0.0
+            p.cols = max(p.cols, i + 1)
+
+            if v is None:
+                missing[i] += 1
+            else:
+                mins[i], maxs[i] = min(mins[i], v), max(maxs[i], v)
+
+    r = range(p.cols)
+    p.mins, p.maxs = _columns([mins[i] for i in r], [maxs[i] for i in r])
+    p.missing = [missing[i] for i in r]
+
+
+def profile(fileobj, sparse=False, chunk_size=CHUNK_SIZE, offsets=None):
+    """
+    Read the binary `fileobj' once and return its MatrixProfile.
+
+    Dense rows are expected to have as many values as the first row, blank lines
+    are counted as rows but not checked. Sparse files have as many columns as
+    their largest index.
+
+    The min, max and missing values of each column are computed on the way,
+    values that are not numbers and the values of short rows count as missing.
+
+    The start offset of each line is appended to `offsets' if given,
+    see `chalab.tools.rowindex'. Sparse rows that are not `index:value' pairs
+    raise InvalidMatrixException.
+    """
+    p = MatrixProfile(sparse=sparse)
+    lines = iter_lines(fileobj, chunk_size)
+
+    if offsets is not None:
+        lines = _recorded(lines, offsets)
+
+    if sparse:
+        _profile_sparse(p, lines)
+    else:
+        _profile_dense(p, lines)
+
+    return p
+
+
+def _merged(a, b, fn):
+    """Merge two lists of column values with `fn', None where a column has no value."""
+    r = []
+    for i in range(max(len(a), len(b))):
+        x = a[i] if i < len(a) else None
+        y = b[i] if i < len(b) else None
+        r.append(y if x is None else x if y is None else fn(x, y))
+    return r
+
+
+def merge(profiles):
+    """Merge the profiles of consecutive parts of a matrix."""
+    r = MatrixProfile(sparse=profiles[0].sparse)
+
+    for p in profiles:
+        if not p.consistent and r.consistent:
+            r.consistent = False
+            r.first_inconsistent_line = r.rows + p.first_inconsistent_line
+
+        r.rows += p.rows
+        r.values += p.values
+        r.nnz += p.nnz
+        r.cols = max(r.cols, p.cols)
+
+        r.mins = _merged(r.mins, p.mins, min)
+        r.maxs = _merged(r.maxs, p.maxs, max)
+        r.missing = _merged(r.missing, p.missing, lambda x, y: x + y)
+
+    r.missing = [x or 0 for x in r.missing]
+    return r
+
+
+def _profile_range(path, start, end, sparse, cols, with_offsets):
+    p = MatrixProfile(sparse=sparse)
+    offsets = array('Q') if with_offsets else None
+
+    with open(path, 'rb') as f:
+        lines = iter_lines(RangeReader(f, start, end))
+        if with_offsets:
+            lines = _recorded(lines, offsets, start)
+
+        if sparse:
+            _profile_sparse(p, lines)
+        else:
+            _profile_dense(p, lines, cols)
+
+    return p, offsets
+
+
+def profile_path(path, sparse=False, offsets=None, workers=1, min_size=PARALLEL_SIZE):
+    """
+    Profile the matrix file at `path' like `profile', large files are split
+    in ranges of lines profiled by `workers' processes.
+    """
+    cols = None
+    if not sparse:
+        # The first line sets the columns expected from all the ranges.
+        with open(path, 'rb') as f:
+            cols = len(next(iter_lines(f), b'').split())
+
+    try:
+        results = map_ranges(_profile_range, path, (sparse, cols, offsets is not None),
+                             workers=workers, min_size=min_size)
+    except InvalidMatrixException:
+        # The row named is the one in its range, profile the whole file to name it.
+        _profile_range(path, 0, os.path.getsize(path), sparse, cols, False)
+        raise
+
+    if offsets is not None:
+        for _, o in results:
+            offsets.extend(o)
+
+    return merge([p for p, _ in results])
@@ -0,0 +1,126 @@
+"""
+An index of the offsets where the lines of a file start, stored next to the file.
+
+The index is a header followed by the offsets as unsigned 64 bits integers,
+in the byte order of the machine, and the file size as a last offset
+(uncompressed, for files compressed at rest):
+row `i' spans from offsets[i] to offsets[i + 1]. It is memory-mapped when read.
+
+The header keeps the size and modification time of the indexed file,
+an index that doesn't match them anymore is stale.
+"""
+import mmap
+import os
+from array import array
+from struct import Struct, error as StructError
+from tempfile import NamedTemporaryFile
+
+from .compressed import open_plain, plain_size
+from .matrix import iter_lines
+
+MAGIC = b'CHLBIDX1'
+HEADER = Struct('=8sQQQ')  # magic, source size, source mtime in ns, rows
+SUFFIX = '.idx'
+
+
+class InvalidIndexException(Exception):
+    def __init__(self, msg):
+        self.message = msg
+
+
+def index_path(path):
+    return path + SUFFIX
+
+
+def line_offsets(fileobj):
+    """Return the offsets of the lines of the binary `fileobj'."""
+    offsets = array('Q')
+    pos = 0
+
+    for line in iter_lines(fileobj):
+        offsets.append(pos)
+        pos += len(line) + 1
+
+    return offsets
+
+
+def write(source, offsets, path=None):
+    """Store the `offsets' of the lines of `source', atomically."""
+    path = path or index_path(source)
+    st = os.stat(source)
+
+    with NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+        f.write(HEADER.pack(MAGIC, st.st_size, st.st_mtime_ns, len(offsets)))
+        offsets.tofile(f)
+        array('Q', [plain_size(source)]).tofile(f)
+
+    os.replace(f.name, path)
+    return path
+
+
+def build(source, path=None):
+    with open_plain(source) as f:
+        offsets = line_offsets(f)
+
+    return write(source, offsets, path)
+
+
+def is_current(source, path=None):
+    """Whether the index of `source' exists and matches it."""
+    path = path or index_path(source)
+
+    try:
+        with open(path, 'rb') as f:
+            magic, size, mtime, _ = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, StructError):
+        return False
+
+    st = os.stat(source)
+    return magic == MAGIC and size == st.st_size and mtime == st.st_mtime_ns
+
+
+class RowIndex(object):
+    """A memory-mapped index, gives the span of a row in constant time."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.size, self.mtime, self.rows = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise InvalidIndexException("Not a row index: %s" % path)
+
+        self._offsets = memoryview(self._mmap)[HEADER.size:].cast('Q')
+
+    def __len__(self):
+        return self.rows
+
+    def span(self, i):
+        """Return the start and end offsets of the row `i', its end of line included."""
+        if not 0 <= i < self.rows:
+            raise IndexError('row %s out of %s rows' % (i, self.rows))
+        return self._offsets[i], self._offsets[i + 1]
+
+    def read(self, fileobj, i):
+        """Read the row `i' from the binary `fileobj', without its end of line."""
+        start, end = self.span(i)
+        fileobj.seek(start)
+        return fileobj.read(end - start).rstrip(b'\r\n')
+
+    def close(self):
+        self._offsets.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_index(source):
+    """Open the index of `source', building it first if it's missing or stale."""
+    if not is_current(source):
+        build(source)
+    return RowIndex(index_path(source))
@@ -0,0 +1,59 @@
+import random
+
+TRAIN = 0
+VALID = 1
+TEST = 2
+
+
+def assignment(size, train_size, valid_size, rand=random):
+    """
+    Return a bytearray giving, for each of the `size' rows, the split it belongs to
+    (TRAIN, VALID or TEST).
+
+    Exactly `train_size' rows are sent to TRAIN, `valid_size' to VALID and the rest
+    to TEST. Rows are drawn by sequential sampling: every assignment is equally likely,
+    like shuffling the row indexes, but we only keep one byte per row.
+    """
+    if train_size + valid_size > size:
+        raise ValueError("can't split %s rows into %s train and %s valid rows"
+                         % (size, train_size, valid_size))
+
+    labels = bytearray(size)
+    left_train, left_valid = train_size, valid_size
+
+    for i in range(size):
+        r = rand.random() * (size - i)
+
+        if r < left_train:
+            left_train -= 1
+        elif r < left_train + left_valid:
+            left_valid -= 1
+            labels[i] = VALID
+        else:
+            labels[i] = TEST
+
+    return labels
+
+
+def split_lines(labels, input, target, outputs, callback=None, every=100000):
+    """
+    Send each line of `input' and `target' to the pair of files given by its label.
+
+    `outputs' is indexed by label and holds (input file, target file) pairs.
+    Both sources are read together in a single pass, lines past the end of `labels'
+    are ignored. Returns the number of lines written for each label.
+
+    `callback' is called with the number of lines done, every `every' lines.
+    """
+    counts = [0] * len(outputs)
+
+    for i, (label, li, lt) in enumerate(zip(labels, input, target), 1):
+        fi, ft = outputs[label]
+        fi.write(li)
+        ft.write(lt)
+        counts[label] += 1
+
+        if callback is not None and i % every == 0:
+            callback(i)
+
+    return counts
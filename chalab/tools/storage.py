@@ -1,8 +1,16 @@
+import hashlib
+import io
 import os
+import re
+import tempfile
+from contextlib import contextmanager
 
 from django.conf import settings
+from django.core.files import File
 from django.core.files.storage import FileSystemStorage
 
+from . import compressed
+
 
 class OverwriteStorage(FileSystemStorage):
     def get_available_name(self, name, max_length):
@@ -29,6 +37,206 @@ class OverwriteStorage(FileSystemStorage):
         return name
 
 
+CHUNK_SIZE = 1024 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    A file system storage naming the files after the sha256 of their content:
+    `prefix'/ab/cd/abcd....ext, keeping the extension of the name asked for.
+
+    Identical contents are stored once, saving content that is already stored
+    writes nothing. The files are shared, see `wizard.models.BlobModel' for their
+    reference counts. Looking up and writing a file happens within `claim', so that
+    the file can't be collected meanwhile.
+
+    With CONTENT_STORAGE_COMPRESSION = 'gzip', new files are compressed at rest
+    (abcd....ext.gz, see `chalab.tools.compressed'). They are read uncompressed
+    through `open', their `size' is the uncompressed one. `plain_path' tells
+    whether the file at `path' can be read as is.
+    """
+    NAME = re.compile(r'(?:.*/)?([0-9a-f]{64})(?:\.[^/]*)?$')
+    CODECS = (None, 'gzip')
+
+    def __init__(self, prefix='data/cas', compress=None, **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = prefix
+        self._compress = compress
+
+    @property
+    def compress(self):
+        codec = self._compress or getattr(settings, 'CONTENT_STORAGE_COMPRESSION', None)
+        if codec not in self.CODECS:
+            raise ValueError("Unsupported storage compression: %s" % codec)
+        return codec
+
+    def content_name(self, digest, name):
+        ext = os.path.splitext(name)[1]
+        if self.compress:
+            ext += compressed.SUFFIX
+        return '/'.join([self.prefix, digest[:2], digest[2:4], digest + ext])
+
+    def digest(self, name):
+        """The sha256 of the content stored as `name', None for names not given by this storage."""
+        m = self.NAME.match(name or '')
+        return m.group(1) if m and name.startswith(self.prefix + '/') else None
+
+    def get_available_name(self, name, max_length=None):
+        return name  # The name only depends on the content, it can't clash.
+
+    @contextmanager
+    def claim(self, name):
+        """Held while the file `name' is looked up then written, replaced by `BlobModel.claim'."""
+        yield
+
+    def temporary(self):
+        """Return the path of a new empty file, to be stored with `save_path'."""
+        d = self.path(os.path.join(self.prefix, 'tmp'))
+        os.makedirs(d, exist_ok=True)
+
+        fd, path = tempfile.mkstemp(dir=d)
+        os.close(fd)
+        return path
+
+    def save_path(self, path, name):
+        """Store the file at `path', moving it, and return its name."""
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                h.update(chunk)
+
+        return self._adopt(path, h.hexdigest(), name)
+
+    def _adopt(self, path, digest, name):
+        target = self.content_name(digest, name)
+        full_path = self.path(target)
+
+        with self.claim(target):
+            if os.path.exists(full_path):
+                os.remove(path)
+                return target
+
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+            if compressed.is_compressed(target):
+                packed = self.temporary()
+                try:
+                    compressed.compress_file(path, packed)
+                except:
+                    os.remove(packed)
+                    raise
+                finally:
+                    os.remove(path)
+                path = packed
+
+            os.replace(path, full_path)
+            return target
+
+    def _open(self, name, mode='rb'):
+        if compressed.is_compressed(name):
+            return CompressedFile(self.path(name), mode)
+        return super()._open(name, mode)
+
+    def size(self, name):
+        if compressed.is_compressed(name):
+            return compressed.info(self.path(name)).size
+        return super().size(name)
+
+    def _save(self, name, content):
+        if hasattr(content, 'temporary_file_path'):
+            return self.save_path(content.temporary_file_path(), name)
+
+        # Contents that can be read twice are hashed first, to write nothing when stored.
+        try:
+            content.seek(0)
+            digest = _chunks_digest(content.chunks())
+        except (AttributeError, io.UnsupportedOperation):
+            digest = None
+
+        if digest is not None:
+            target = self.content_name(digest, name)
+            with self.claim(target):
+                if self.exists(target):
+                    return target
+
+        path = self.temporary()
+        h = hashlib.sha256()
+        try:
+            with open(path, 'wb') as f:
+                for chunk in content.chunks():
+                    chunk = chunk.encode() if isinstance(chunk, str) else chunk
+                    h.update(chunk)
+                    f.write(chunk)
+        except:
+            os.remove(path)
+            raise
+
+        return self._adopt(path, h.hexdigest(), name)
+
+
+class CompressedFile(File):
+    """A file compressed at rest, read uncompressed."""
+
+    def __init__(self, path, mode='rb'):
+        super().__init__(compressed.open_plain(path, mode), name=path)
+        self.mode = mode
+
+    @property
+    def size(self):
+        return compressed.info(self.name).size
+
+    def open(self, mode=None):
+        if not self.closed:
+            self.seek(0)
+        else:
+            self.file = compressed.open_plain(self.name, mode or self.mode)
+        return self
+
+
+def plain_path(file_field):
+    """
+    The path of the file of a FieldFile, if it can be read as is from there:
+    it is in a local storage, and not compressed. None otherwise.
+    """
+    try:
+        path = file_field.path
+    except (NotImplementedError, ValueError):
+        return None  # Not a local storage, or no file.
+
+    if compressed.is_compressed(path) or not os.path.exists(path):
+        return None
+    return path
+
+
+def _chunks_digest(chunks):
+    h = hashlib.sha256()
+    for chunk in chunks:
+        h.update(chunk.encode() if isinstance(chunk, str) else chunk)
+    return h.hexdigest()
+
+
+def file_field_digest(file_field):
+    """
+    Return the sha256 of a django FileField content,
+    given by the name for content-addressed storages.
+    """
+    if isinstance(file_field.storage, ContentAddressedStorage):
+        digest = file_field.storage.digest(file_field.name)
+        if digest is not None:
+            return digest
+
+    h = hashlib.sha256()
+
+    try:
+        file_field.open('rb')
+        for chunk in iter(lambda: file_field.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    finally:
+        file_field.close()
+
+    return h.hexdigest()
+
+
 def save_to_logo(instance, filename):
     return "".join(["data/logos/", str(instance.id), "/", filename])
 
@@ -39,3 +247,141 @@ def save_to_baseline(instance, filename):
 
 def save_to_bundle(instance, filename):
     return "".join(["data/bundles/", str(instance.challenge.id), "/", filename])
+
+
+def save_to_upload(instance, filename):
+    return "".join(["data/uploads/", str(instance.dataset.id), "/", filename])
+
+
+@contextmanager
+def open_for_write(field_file, filename):
+    """
+    Open for writing the file a FieldFile would be saved to as `filename',
+    then point the field to it once it is written.
+
+    This skips the temporary copy `FieldFile.save' needs, only file system storages
+    are supported. The file is renamed into place once written, the partial file is
+    removed on failure.
+    Content-addressed storages get the file once it is written and hashed.
+    """
+    storage = field_file.storage
+    name = field_file.field.generate_filename(field_file.instance, filename)
+
+    if isinstance(storage, ContentAddressedStorage):
+        # Only named once written.
+        path = storage.temporary()
+        try:
+            with open(path, 'wb') as f:
+                yield f
+        except:
+            os.remove(path)
+            raise
+
+        field_file.name = storage.save_path(path, name)
+        field_file._committed = True
+        return
+
+    # Written next to its final place, then renamed: a file being replaced stays
+    # whole until the new one is complete.
+    directory = os.path.dirname(storage.path(name))
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=directory, prefix='.%s.' % os.path.basename(name),
+                                suffix='.part')
+
+    try:
+        with open(fd, 'wb') as f:
+            yield f
+
+        os.chmod(path, storage.file_permissions_mode or 0o644)
+        if not isinstance(storage, OverwriteStorage):
+            name = storage.get_available_name(name, max_length=field_file.field.max_length)
+        os.replace(path, storage.path(name))
+    except:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    field_file.name = name
+    field_file._committed = True
+
+
+class PendingContent(object):
+    """
+    A file written for the FieldFile of a content-addressed storage as `filename',
+    hashed on the way. Writing it doesn't use the database, `commit' does: it stores
+    the content, claiming it, then points the field to it.
+    """
+
+    def __init__(self, field_file, filename):
+        self.field_file = field_file
+        self.filename = filename
+        self.path = field_file.storage.temporary()
+        self.file = open(self.path, 'wb')
+        self._sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self._sha256.update(data)
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def commit(self):
+        self.file.close()
+
+        f = self.field_file
+        name = f.field.generate_filename(f.instance, self.filename)
+        f.name = f.storage._adopt(self.path, self._sha256.hexdigest(), name)
+        f._committed = True
+
+
+class TeeReader(object):
+    """A binary reader passing what it reads from `fileobj' to each of `sinks'."""
+
+    def __init__(self, fileobj, *sinks):
+        self.fileobj = fileobj
+        self.sinks = sinks
+
+    def read(self, n=-1):
+        data = self.fileobj.read(n)
+        for sink in self.sinks:
+            sink(data)
+        return data
+
+
+class ChunkTooLargeException(Exception):
+    def __init__(self, msg):
+        self.message = msg
+
+
+def write_chunk(path, offset, fileobj, limit):
+    """
+    Write the content of the binary `fileobj' at `offset' in the file at `path',
+    dropping what came after it, and return its size and sha256.
+
+    Raise ChunkTooLargeException past `limit' bytes, the file is then cut back
+    to `offset'.
+    """
+    h = hashlib.sha256()
+    n = 0
+
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+
+        for block in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+            n += len(block)
+            if n > limit:
+                f.truncate(offset)
+                raise ChunkTooLargeException("The chunk is larger than %s bytes" % limit)
+
+            h.update(block)
+            f.write(block)
+
+        f.truncate()
+
+    return n, h.hexdigest()
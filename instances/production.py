@@ -9,6 +9,9 @@ DEBUG = False
 SECRET_KEY = os.environ['CHALAB_SECRET_KEY'].strip()
 ALLOWED_HOSTS = clearl(os.environ['CHALAB_ALLOWED_HOSTS'].split(','))
 
+BUNDLER_WORKERS = int(os.environ.get('CHALAB_BUNDLER_WORKERS', 4))
+BUNDLER_CACHE_DIR = os.environ.get('CHALAB_BUNDLER_CACHE_DIR', BUNDLER_CACHE_DIR) or None
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
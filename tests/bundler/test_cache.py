@@ -0,0 +1,54 @@
+import os
+import time
+
+from bundler.cache import ArtifactCache, digest
+from chalab.tools import fs
+
+
+def write(p, content):
+    with open(p, 'wb') as f:
+        f.write(content)
+
+
+def read(p):
+    with open(p, 'rb') as f:
+        return f.read()
+
+
+def test_digest_depends_on_every_part():
+    assert digest('a', 'b') == digest('a', 'b')
+    assert digest('a', 'b') != digest('b', 'a')
+    assert digest('ab') != digest('a', 'b')
+
+
+def test_get_returns_what_was_put():
+    with fs.tmp_dir() as d:
+        cache = ArtifactCache(os.path.join(d, 'cache'), budget=1024)
+        write(os.path.join(d, 'a.zip'), b'content')
+
+        assert not cache.get('key', os.path.join(d, 'b.zip'))
+
+        cache.put('key', os.path.join(d, 'a.zip'))
+
+        assert cache.get('key', os.path.join(d, 'c.zip'))
+        assert read(os.path.join(d, 'c.zip')) == b'content'
+        assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used_past_budget():
+    with fs.tmp_dir() as d:
+        cache = ArtifactCache(os.path.join(d, 'cache'), budget=25)
+
+        for i, k in enumerate(['k1', 'k2']):
+            p = os.path.join(d, k)
+            write(p, b'x' * 10)
+            cache.put(k, p)
+            os.utime(cache.path(k), (time.time() - 100 + i, time.time() - 100 + i))
+
+        # k1 is used, k2 becomes the least recently used.
+        assert cache.get('k1', os.path.join(d, 'out1'))
+
+        write(os.path.join(d, 'k3'), b'x' * 10)
+        cache.put('k3', os.path.join(d, 'k3'))
+
+        assert sorted(os.listdir(cache.root)) == ['k1', 'k3']
@@ -0,0 +1,43 @@
+from unittest.mock import Mock
+
+from bundler.instrument import measure, percentile
+
+
+def test_measure_records_on_the_bundle_task():
+    bt = Mock()
+
+    with measure(bt, 'stage') as m:
+        m['bytes_in'] = 42
+
+    name, values = bt.record_stats.call_args[0]
+    assert name == 'stage'
+    assert values['bytes_in'] == 42
+    assert values['wall'] >= 0 and values['cpu'] >= 0
+    assert values['process_peak_rss'] > 0
+    assert values['peak_rss_increase'] >= 0
+
+
+def test_measure_records_the_increase_of_the_peak_memory():
+    bt = Mock()
+
+    with measure(bt, 'stage'):
+        grown = bytearray(64 * 1024 * 1024)
+        grown[::4096] = b'x' * len(grown[::4096])  # touch every page.
+
+    values = bt.record_stats.call_args[0][1]
+    assert values['peak_rss_increase'] >= 32 * 1024 * 1024
+
+    with measure(bt, 'stage'):
+        pass  # under the peak the previous block reached.
+
+    values = bt.record_stats.call_args[0][1]
+    assert values['peak_rss_increase'] == 0
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([], 50) is None
@@ -1,6 +1,8 @@
+import pickle
+
 import pytest
 
-from bundler.models import BundleTaskModel
+from bundler.models import BundleTaskModel, LogModel
 
 pytestmark = pytest.mark.django_db
 
@@ -15,3 +17,35 @@ def test_can_create_logs(random_challenge):
     assert len(logs) == 2
     assert [x.message for x in logs] == ["This is a message",
                                          "This is another message"]
+
+
+def test_logs_are_buffered_until_flushed(random_challenge):
+    bt = BundleTaskModel.create(random_challenge.challenge)
+
+    bt.add_log("This is a message")
+    assert LogModel.objects.filter(task=bt).count() == 0
+
+    bt.flush_logs()
+    assert LogModel.objects.filter(task=bt).count() == 1
+
+
+def test_logs_keep_the_time_they_were_logged_at(random_challenge):
+    bt = BundleTaskModel.create(random_challenge.challenge)
+
+    first = bt.add_log("first")
+    second = bt.add_log("second")
+
+    logs = list(bt.logs)
+    assert [x.created for x in logs] == [first.created, second.created]
+    assert [x.message for x in logs] == ["first", "second"]
+
+
+def test_tasks_with_buffered_logs_can_be_pickled(random_challenge):
+    bt = BundleTaskModel.create(random_challenge.challenge)
+    bt.add_log("first")
+
+    copy = pickle.loads(pickle.dumps(bt))
+    copy.add_log("second")
+    copy.flush_logs()
+
+    assert [x.message for x in copy.logs] == ["first", "second"]
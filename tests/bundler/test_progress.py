@@ -0,0 +1,45 @@
+from bundler.progress import Progress
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_percent_is_weighted_by_stage():
+    p = Progress()
+    p.plan('small', 100)
+    p.plan('large', 300)
+
+    p.start('small', 10)
+    p.finish('small')
+    assert p.percent == 25
+
+    p.start('large', 1000)
+    p.advance('large', 500)
+    assert p.percent == 62
+
+
+def test_rate_and_eta_follow_the_clock():
+    clock = FakeClock()
+    p = Progress(clock=clock)
+    p.plan('stage', 100)
+    p.start('stage', 1000)
+
+    clock.now = 10.0
+    p.advance('stage', 250)
+
+    assert p.bytes == 250
+    assert p.rate == 25.0
+    assert p.eta == 30.0
+
+
+def test_unstarted_progress_has_no_eta():
+    p = Progress()
+    p.plan('stage', 100)
+
+    assert p.percent == 0
+    assert p.eta is None
@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from bundler.stages import Stage, InvalidStagesException, ordered, run_stages
+
+
+def names(stages):
+    return [s.name for s in stages]
+
+
+class TestOrdered(object):
+    def test_keeps_independent_stages_order(self):
+        stages = [Stage('a', None), Stage('b', None), Stage('c', None)]
+        assert names(ordered(stages)) == ['a', 'b', 'c']
+
+    def test_puts_requirements_first(self):
+        stages = [Stage('c', None, requires=('a', 'b')), Stage('a', None), Stage('b', None)]
+        assert names(ordered(stages)) == ['a', 'b', 'c']
+
+    def test_fails_on_unknown_requirement(self):
+        with pytest.raises(InvalidStagesException):
+            ordered([Stage('a', None, requires=('b',))])
+
+    def test_fails_on_cycle(self):
+        with pytest.raises(InvalidStagesException):
+            ordered([Stage('a', None, requires=('b',)), Stage('b', None, requires=('a',))])
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+class TestRunStages(object):
+    def test_passes_requirements_results(self, workers):
+        stages = [Stage('sum', lambda a, b: a + b, requires=('a', 'b')),
+                  Stage('a', lambda: 1),
+                  Stage('b', lambda: 2)]
+
+        assert run_stages(stages, workers=workers) == {'a': 1, 'b': 2, 'sum': 3}
+
+    def test_calls_on_done_after_each_stage(self, workers):
+        done = []
+        stages = [Stage('a', lambda: 1), Stage('b', lambda a: a, requires=('a',))]
+
+        run_stages(stages, workers=workers, on_done=done.append)
+
+        assert done == ['a', 'b']
+
+    def test_reraises_failures(self, workers):
+        def fail():
+            raise ValueError('some stage failed')
+
+        stages = [Stage('a', fail), Stage('b', lambda a: a, requires=('a',))]
+
+        with pytest.raises(ValueError):
+            run_stages(stages, workers=workers)
+
+
+def test_independent_stages_run_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+
+    stages = [Stage(x, barrier.wait) for x in 'abc']
+    results = run_stages(stages, workers=3)
+
+    assert set(results) == {'a', 'b', 'c'}
@@ -1,5 +1,5 @@
 from os import path
-from zipfile import ZipFile
+from zipfile import ZipFile, ZIP_STORED
 
 import pytest
 
@@ -54,15 +54,6 @@ class TestCreateBundle(object):
                 assert 'metadata' in ls
 
 
-def test_create_archive_creates_zip_file(challenge_ready):
-    c = challenge_ready.challenge
-
-    with tasks.tmp_dirs(c) as (data, output):
-        tasks.create_bundle(mock_bundle, data, c)
-        a = tasks.create_archive(mock_bundle, data, output)
-        assert path.exists(a)
-
-
 def log_file(bt):
     return '\n'.join([x.message for x in bt.logs])
 
@@ -77,6 +68,13 @@ class TestBundler(object):
         with bundle(challenge_ready) as (bt, output):
             assert bt.state == models.BundleTaskModel.FINISHED
 
+    def test_reports_full_progress_when_finished(self, challenge_ready):
+        with bundle(challenge_ready) as (bt, output):
+            bt.refresh_from_db()
+
+            assert bt.progress_perc == 100
+            assert bt.progress_bytes > 0
+
     def test_bundler_stores_logs_along_the_way(self, challenge_ready):
         with bundle(challenge_ready) as (bt, output):
             lf = log_file(bt)
@@ -109,6 +107,115 @@ class TestBundler(object):
 
                 assert 'bundle.zip' not in files
 
+    def test_stores_nested_archives_uncompressed(self, challenge_ready):
+        with bundle(challenge_ready) as (bt, output):
+            with ZipFile(output.path, 'r') as z:
+                assert z.getinfo('input_data_1_2.zip').compress_type == ZIP_STORED
+
+
+class TestCancel(object):
+    def test_skips_a_build_cancelled_before_it_started(self, challenge_ready):
+        bt = models.BundleTaskModel.create(challenge_ready.challenge)
+        bt.cancel()
+
+        tasks.bundle(bt)
+        bt.refresh_from_db()
+
+        assert bt.state == models.BundleTaskModel.CANCELLED
+        assert not bt.output
+        assert 'Build cancelled before it started' in log_file(bt)
+
+    def test_stops_at_the_next_checkpoint(self, monkeypatch, challenge_ready):
+        bt = models.BundleTaskModel.create(challenge_ready.challenge)
+        gen_phases = tasks.gen_phases
+
+        def cancel_then_gen(*args, **kwargs):
+            models.BundleTaskModel.objects.get(pk=bt.pk).cancel()
+            return gen_phases(*args, **kwargs)
+
+        monkeypatch.setattr(tasks, 'gen_phases', cancel_then_gen)
+
+        tasks.bundle(bt)
+        bt.refresh_from_db()
+
+        assert bt.state == models.BundleTaskModel.CANCELLED
+        assert not bt.output
+        assert 'Set state to cancelled' in log_file(bt)
+        assert 'Export the archive' not in log_file(bt)
+
+    def test_keeps_a_build_cancelled_as_it_finishes(self, monkeypatch, challenge_ready):
+        bt = models.BundleTaskModel.create(challenge_ready.challenge)
+        save_archive = tasks.save_archive
+
+        def save_then_cancel(*args, **kwargs):
+            save_archive(*args, **kwargs)
+            models.BundleTaskModel.objects.get(pk=bt.pk).cancel()
+
+        monkeypatch.setattr(tasks, 'save_archive', save_then_cancel)
+
+        tasks.bundle(bt)
+        bt.refresh_from_db()
+
+        assert bt.state == models.BundleTaskModel.CANCELLED
+        assert not bt.output
+        assert 'Set state to finished' not in log_file(bt)
+
+    def test_keeps_the_previous_bundle_if_cancelled(self, monkeypatch, challenge_ready):
+        c = challenge_ready.challenge
+        previous = models.BundleTaskModel.create(c)
+        tasks.bundle(previous)
+        previous.refresh_from_db()
+        c.refresh_from_db()
+        build_at = c.build_at
+
+        bt = models.BundleTaskModel.create(c)
+        save_archive = tasks.save_archive
+
+        def save_then_cancel(*args, **kwargs):
+            save_archive(*args, **kwargs)
+            models.BundleTaskModel.objects.get(pk=bt.pk).cancel()
+
+        monkeypatch.setattr(tasks, 'save_archive', save_then_cancel)
+        tasks.bundle(bt)
+
+        previous.refresh_from_db()
+        c.refresh_from_db()
+
+        assert previous.state == models.BundleTaskModel.FINISHED
+        assert path.exists(previous.output.path)
+        assert ZipFile(previous.output.path).namelist()
+        assert c.build_at == build_at
+
+
+class TestIncrementalBundle(object):
+    def test_records_components(self, challenge_ready):
+        with bundle(challenge_ready) as (bt, output):
+            assert set(bt.components_dict) >= {'documentation', 'input_data', 'scoring_program'}
+
+    def test_reuses_unchanged_components(self, challenge_ready):
+        with bundle(challenge_ready):
+            pass
+
+        with bundle(challenge_ready) as (bt, output):
+            assert 'Reuse from the previous bundle: input_data' in log_file(bt)
+
+            with zip(output.path) as (z, ls):
+                assert 'input_data_1_2.zip' in ls
+                assert 'overview.html' in ls
+
+    def test_rebuilds_changed_components(self, challenge_ready):
+        with bundle(challenge_ready):
+            pass
+
+        m = challenge_ready.challenge.metric
+        m.code += '\n# changed'
+        m.save()
+
+        with bundle(challenge_ready) as (bt, output):
+            lf = log_file(bt)
+            assert 'Reuse from the previous bundle: scoring_program' not in lf
+            assert 'Reuse from the previous bundle: documentation' in lf
+
 
 class TestTaskGeneration:
     def test_simple_case_works(self, challenge_ready):
@@ -150,3 +257,13 @@ class TestTaskGeneration:
         tasks.generate_task_data(mock_bundle, c)
 
         assert c.task.input_train is not None
+
+
+class TestInstrumentation:
+    def test_records_each_stage(self, challenge_ready):
+        with bundle(challenge_ready) as (bt, output):
+            stats = bt.stats_dict
+
+            assert {'gen_documentation', 'save_archive'} <= set(stats)
+            assert stats['save_archive']['bytes_out'] == output.size
+            assert stats['save_archive']['wall'] >= 0
@@ -1,3 +1,4 @@
+import json
 import time
 
 import pytest
@@ -58,6 +59,55 @@ class TestBundler(object):
         assert_redirects(r, sreverse('wizard:challenge:build', pk=c.pk))
 
 
+class TestBundlerCancel(object):
+    def test_cancels_the_running_build(self, c):
+        bt = models.BundleTaskModel.create(c.challenge)
+        bt.state = bt.STARTED
+        bt.save()
+
+        r = c.post('wizard:challenge:bundler:cancel', pk=c.pk)
+        assert_redirects(r, sreverse('wizard:challenge:build', pk=c.pk))
+
+        bt.refresh_from_db()
+        assert bt.state == bt.CANCELLED
+        assert bt.closed is not None
+
+    def test_cancel_needs_a_post(self, c):
+        bt = models.BundleTaskModel.create(c.challenge)
+        bt.state = bt.STARTED
+        bt.save()
+
+        r = c.get('wizard:challenge:bundler:cancel', pk=c.pk)
+        assert r.status_code == 405
+
+        bt.refresh_from_db()
+        assert bt.state == bt.STARTED
+
+    def test_cant_cancel_without_build(self, c):
+        r = c.post('wizard:challenge:bundler:cancel', pk=c.pk)
+
+        assert r.status_code == 400
+        assert b'There is no bundle being built to cancel' in r.content
+
+    def test_cant_cancel_a_FINISHED_build(self, c):
+        bt = models.BundleTaskModel.create(c.challenge)
+        bt.state = bt.FINISHED
+        bt.save()
+
+        r = c.post('wizard:challenge:bundler:cancel', pk=c.pk)
+
+        assert r.status_code == 400
+        bt.refresh_from_db()
+        assert bt.state == bt.FINISHED
+
+    def test_can_build_again_once_cancelled(self, c):
+        bt = models.BundleTaskModel.create(c.challenge)
+        bt.cancel()
+
+        r = c.post('wizard:challenge:bundler:build', pk=c.pk)
+        assert_redirects(r, sreverse('wizard:challenge:build', pk=c.pk))
+
+
 class TestBundlerLogs(object):
     def test_logs_pages_returns_404_by_default(self, c):
         r = c.get('wizard:challenge:bundler:logs', pk=c.pk)
@@ -81,3 +131,17 @@ class TestBundleDownload(object):
         r = c.get('wizard:challenge:bundler:download', pk=c.pk)
 
         assert r.status_code == 302
+
+
+class TestBundlerStatus(object):
+    def test_status_reports_progress(self, c):
+        bt = models.BundleTaskModel.create(c.challenge)
+        bt.progress_perc = 42
+        bt.progress_stage = 'input_data'
+        bt.save()
+
+        r = c.get('wizard:challenge:bundler:status_json', pk=c.pk)
+        status = json.loads(r.content.decode('utf-8'))
+
+        assert status['progress']['perc'] == 42
+        assert status['progress']['stage'] == 'input_data'
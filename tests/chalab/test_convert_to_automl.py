@@ -0,0 +1,205 @@
+import csv
+import os
+from io import BytesIO
+
+import pytest
+
+from chalab import convert_to_automl
+from chalab.tools import fs
+
+
+@pytest.fixture
+def write():
+    with fs.tmp_dir() as d:
+        def write(name, content):
+            p = os.path.join(d, name)
+            with open(p, 'w') as f:
+                f.write(content)
+            return p
+
+        yield write
+
+
+def test_detects_arff(write):
+    p = write('x.arff', '% comment\n@relation r\n@attribute a numeric\n\n@data\n1,2\n')
+
+    assert convert_to_automl.detect(p) == ('arff', 1.0)
+
+
+def test_detects_arff_with_long_headers(write):
+    p = write('x.arff', '@relation r\n' + '@attribute a numeric\n' * 100 + '@data\n1\n')
+
+    assert convert_to_automl.detect(p, lines=10) == ('arff', 0.5)
+
+
+def test_detects_libsvm(write):
+    p = write('x.data', '1 3:0.5 7:1\n0 1:2\n\n1 2:1\n')
+
+    assert convert_to_automl.detect(p) == ('libsvm', 1.0)
+
+
+def test_detects_csv(write):
+    assert convert_to_automl.detect(write('x.csv', 'a,b\n1,2\n3,4\n')) == ('csv', 1.0)
+    assert convert_to_automl.detect(write('x.data', '1 2 3\n4 5 6\n')) == ('csv', 1.0)
+    assert convert_to_automl.detect(write('x.solution', '1\n0\n1\n')) == ('csv', 1.0)
+
+
+def test_confidence_is_the_share_of_lines_that_fit(write):
+    p = write('x.data', '1 3:0.5\n0 1:2\n1 2:1\n0 1 2 3\n')
+
+    assert convert_to_automl.detect(p) == ('libsvm', 0.75)
+
+
+def test_reads_a_bounded_part_of_the_file(write):
+    p = write('x.data', ''.join('%d,%d\n' % (i, i) for i in range(10000)))
+
+    prefix, sampled = convert_to_automl.sample_lines(p, lines=10, samples=4, sample_size=100)
+
+    assert prefix == ['%d,%d' % (i, i) for i in range(10)]
+    assert 0 < len(sampled) < 4 * 100 / 4
+    assert all(line.count(',') == 1 and line.split(',')[0] == line.split(',')[1]
+               for line in sampled)
+
+
+def converted(src, **kwargs):
+    dest = src + '.automl'
+    stats = convert_to_automl.csv_to_automl(src, dest, csv.excel, **kwargs)
+    with open(dest) as f:
+        return f.read(), stats
+
+
+def test_csv_conversion_replaces_delimiters(write):
+    p = write('x.csv', 'a,b,c\r\n1,2,3\r\n4,5,6\r\n')
+
+    content, stats = converted(p, has_header=True)
+
+    assert content == '1 2 3\n4 5 6\n'
+    assert stats.rows == 2
+
+
+def test_csv_conversion_handles_quotes_and_missing_values(write):
+    p = write('x.csv', '1,2,3\n' * 3 + '"4",,"a b"\n,"7\n8",\n')
+
+    content, stats = converted(p, chunk_size=1)
+
+    assert content == '1 2 3\n' * 3 + '4 NaN a_b\nNaN 7_8 NaN\n'
+    assert stats.rows == 5
+
+
+def test_csv_conversion_keeps_rows_in_order_across_chunks(write):
+    p = write('x.csv', ''.join('%d,%d\n' % (i, -i) for i in range(1000)) + '"x",1\n')
+
+    content, stats = converted(p, chunk_size=100, batch_rows=7)
+
+    assert content == ''.join('%d %d\n' % (i, -i) for i in range(1000)) + 'x 1\n'
+    assert stats.rows == 1001 and stats.rows_per_second > 0
+
+
+def test_from_csv_keeps_single_columns(write):
+    p = write('x.solution', '1\n0\n1\n')
+
+    final_path = convert_to_automl.from_csv(p)
+
+    with open(os.path.join(final_path, 'x.solution')) as f:
+        assert f.read() == '1\n0\n1\n'
+
+
+def test_libsvm_reader_splits_labels_and_features():
+    labels = BytesIO()
+    src = BytesIO(b'1 3:0.5 7:1 # comment\n\n-1 qid:3 1:2\n0\n+1 2:1 10:4')
+
+    reader = convert_to_automl.LibsvmReader(src, labels, chunk_size=5)
+    data = b''.join(iter(lambda: reader.read(3), b''))
+
+    assert data == b'3:0.5 7:1\n1:2\n\n2:1 10:4\n'
+    assert labels.getvalue() == b'1\n-1\n0\n+1\n'
+    assert (reader.rows, reader.nnz, reader.max_index) == (4, 5, 10)
+
+
+def test_libsvm_reader_refuses_invalid_indexes():
+    reader = convert_to_automl.LibsvmReader(BytesIO(b'1 a:2\n'))
+
+    with pytest.raises(convert_to_automl.InvalidLibsvmException):
+        reader.read()
+
+
+def test_from_libsvm_writes_sparse_automl_files(write):
+    p = write('x.data', '1 2:0.5 7:1\n0 1:3\n')
+
+    final_path = convert_to_automl.from_libsvm(p)
+
+    def content(suffix):
+        with open(os.path.join(final_path, 'x' + suffix)) as f:
+            return f.read()
+
+    assert content('.data') == '2:0.5 7:1\n1:3\n'
+    assert content('.solution') == '1\n0\n'
+    assert 'is_sparse = 1\nfeat_num = 7\n' in content('_public.info')
+
+
+ARFF = """% The weather
+@relation weather
+@attribute outlook {sunny, overcast, 'rainy day'}
+@attribute 'temperature C' real
+@attribute windy {TRUE, FALSE}
+@attribute note string
+
+@data
+sunny,85,FALSE,'a, b'
+'rainy day',?,TRUE,x
+overcast,70,TRUE,'a, b',{2}
+"""
+
+
+def test_arff_conversion_encodes_the_values(write):
+    src = write('x.data', ARFF)
+
+    c = convert_to_automl.arff_to_automl(src, src + '.automl')
+
+    with open(src + '.automl') as f:
+        assert f.read() == '0 85 1 0\n2 NaN 0 1\n1 70 0 0\n'
+    assert c.names == ['outlook', 'temperature C', 'windy', 'note']
+    assert c.types == ['Categorical', 'Numerical', 'Binary', 'Categorical']
+    assert c.rows == 3 and not c.sparse
+
+
+def test_arff_conversion_keeps_sparse_rows_sparse(write):
+    src = write('x.data', '@relation s\n@attribute a numeric\n@attribute b {x, y}\n'
+                          '@attribute c numeric\n@data\n{0 1.5, 2 3}\n{1 y}\n1,x,0\n{}\n')
+
+    c = convert_to_automl.arff_to_automl(src, src + '.automl')
+
+    with open(src + '.automl') as f:
+        assert f.read() == '1:1.5 3:3\n2:1\n1:1\n\n'
+    assert c.sparse
+
+
+@pytest.mark.parametrize('content', [
+    '@relation r\n@attribute a {x, y}\n@data\nz\n',
+    '@relation r\n@attribute a numeric\n@attribute b numeric\n@data\n1\n',
+    '@relation r\n@attribute a relational\n@data\n1\n',
+])
+def test_arff_conversion_refuses_invalid_files(write, content):
+    src = write('x.data', content)
+
+    with pytest.raises(convert_to_automl.InvalidArffException):
+        convert_to_automl.arff_to_automl(src, src + '.automl')
+
+    assert not os.path.exists(src + '.automl')
+
+
+def test_from_arff_describes_the_features(write):
+    final_path = convert_to_automl.from_arff(write('x.data', ARFF))
+
+    with open(os.path.join(final_path, 'x_feat.name')) as f:
+        assert f.read() == 'outlook\ntemperature C\nwindy\nnote\n'
+    with open(os.path.join(final_path, 'x_feat.type')) as f:
+        assert f.read() == 'Categorical\nNumerical\nBinary\nCategorical\n'
+
+
+def test_from_arff_converts_files_without_header(write):
+    final_path = convert_to_automl.from_arff(write('x.solution', '1\n0,?\n'))
+
+    with open(os.path.join(final_path, 'x.solution')) as f:
+        assert f.read() == '1\n0 NaN\n'
+    assert os.listdir(final_path) == ['x.solution']
@@ -1,3 +1,9 @@
+import io
+import os
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+import pytest
+
 from chalab.tools import archives
 from chalab.tools import fs
 
@@ -15,3 +21,77 @@ def test_extract_zip_file():
         with archives.unzip_fp(f) as tmp:
             content_path = fs.sole_path(tmp)
             assert set(fs.ls(content_path)) == set(EXAMPLE_FILES)
+
+
+def test_write_fileobj_streams_content():
+    content = b'0 1 2 3\n' * 1000
+
+    with fs.tmp_dir() as tmp:
+        p = os.path.join(tmp, 'out.zip')
+        with ZipFile(p, 'w') as zf:
+            archives.write_fileobj(zf, 'x.data', io.BytesIO(content))
+
+        with ZipFile(p, 'r') as zf:
+            assert zf.namelist() == ['x.data']
+            assert zf.getinfo('x.data').compress_type == ZIP_DEFLATED
+            assert zf.read('x.data') == content
+
+
+def test_write_dir_stores_nested_archives():
+    with fs.tmp_dir() as tmp:
+        data = os.path.join(tmp, 'data')
+        fs.mkdir(data, 'sub')
+
+        with ZipFile(os.path.join(data, 'nested.zip'), 'w') as zf:
+            zf.writestr('a.txt', 'a')
+        with open(os.path.join(data, 'sub', 'b.txt'), 'w') as f:
+            f.write('b')
+
+        p = os.path.join(tmp, 'out.zip')
+        with ZipFile(p, 'w') as zf:
+            archives.write_dir(zf, data)
+
+        with ZipFile(p, 'r') as zf:
+            assert set(zf.namelist()) == {'nested.zip', 'sub/b.txt'}
+            assert zf.getinfo('nested.zip').compress_type == ZIP_STORED
+            assert zf.getinfo('sub/b.txt').compress_type == ZIP_DEFLATED
+
+
+def example_members():
+    with ZipFile('tests/wizard/resources/uploadable/automl_dataset.zip') as zf:
+        return archives.members(zf)
+
+
+def test_members_lists_the_files_only():
+    names = [i.filename for i in example_members()]
+    assert sorted(os.path.basename(n) for n in names) == sorted(EXAMPLE_FILES)
+
+
+def test_check_sizes_accepts_the_example():
+    archives.check_sizes(example_members(), max_size=10000, max_ratio=100)
+
+
+def test_check_sizes_refuses_large_archives():
+    with pytest.raises(archives.InvalidArchiveException):
+        archives.check_sizes(example_members(), max_size=9000)
+
+
+def test_check_sizes_refuses_highly_compressed_files():
+    b = io.BytesIO()
+    with ZipFile(b, 'w', compression=ZIP_DEFLATED) as zf:
+        zf.writestr('zeros', b'\0' * 1024 * 1024)
+
+    with ZipFile(b) as zf:
+        with pytest.raises(archives.InvalidArchiveException):
+            archives.check_sizes(archives.members(zf), max_ratio=100)
+
+
+def test_extract_member_writes_only_that_member():
+    with fs.tmp_dir() as tmp, \
+            ZipFile('tests/wizard/resources/uploadable/automl_dataset.zip') as zf:
+        p = os.path.join(tmp, 'x', 'y.solution')
+        archives.extract_member(zf, zf.getinfo('automl_dataset/automl_dataset.solution'), p)
+
+        assert fs.ls(tmp) == ['x']
+        with open(p, 'rb') as f:
+            assert f.read() == zf.read('automl_dataset/automl_dataset.solution')
@@ -0,0 +1,67 @@
+import math
+import os
+
+import pytest
+
+from chalab.tools import binmatrix, fs
+
+
+@pytest.fixture
+def tmp():
+    with fs.tmp_dir() as d:
+        yield d
+
+
+def write(d, name, content):
+    p = os.path.join(d, name)
+    with open(p, 'wb') as f:
+        f.write(content)
+    return p
+
+
+def test_dense_rows(tmp):
+    p = write(tmp, 'x.data', b'1 2 3\n4 5 6\n7 8 9\n')
+
+    with binmatrix.open_binary(p) as m:
+        assert (m.rows, m.cols, m.sparse) == (3, 3, False)
+        assert m.row(1).tolist() == [4.0, 5.0, 6.0]
+
+
+def test_dense_missing_values_are_nan(tmp):
+    p = write(tmp, 'x.data', b'1 ? 3\n4 5\n')
+
+    with binmatrix.open_binary(p) as m:
+        assert m.row(0).tolist()[0] == 1.0
+        assert math.isnan(m.row(0).tolist()[1])
+        assert math.isnan(m.row(1).tolist()[2])
+
+
+def test_sparse_rows(tmp):
+    p = write(tmp, 'x.data', b'1:0.5 3:2\n\n2:-1\n')
+
+    with binmatrix.open_binary(p, sparse=True) as m:
+        assert (m.rows, m.cols, m.nnz, m.sparse) == (3, 3, 3, True)
+
+        indices, values = m.row(0)
+        assert (indices.tolist(), values.tolist()) == ([0, 2], [0.5, 2.0])
+
+        indices, values = m.row(1)
+        assert indices.tolist() == []
+
+        indices, values = m.row(2)
+        assert (indices.tolist(), values.tolist()) == ([1], [-1.0])
+
+
+def test_is_built_once_then_rebuilt_when_stale(tmp):
+    p = write(tmp, 'x.data', b'1 2\n')
+    binmatrix.open_binary(p).close()
+
+    assert binmatrix.is_current(p)
+    assert not binmatrix.is_current(p, sparse=True)
+
+    with open(p, 'ab') as f:
+        f.write(b'3 4\n')
+    assert not binmatrix.is_current(p)
+
+    with binmatrix.open_binary(p) as m:
+        assert m.rows == 2
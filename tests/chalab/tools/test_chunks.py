@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from chalab.tools import chunks, fs
+
+
+@pytest.fixture
+def data():
+    with fs.tmp_dir() as d:
+        p = os.path.join(d, 'x.data')
+        with open(p, 'wb') as f:
+            f.write(b''.join(b'%d %d\n' % (i, i * i) for i in range(1000)))
+        yield p
+
+
+def test_ranges_cover_the_file_on_line_boundaries(data):
+    ranges = chunks.line_ranges(data, 7)
+
+    with open(data, 'rb') as f:
+        content = f.read()
+
+    assert len(ranges) == 7
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(content)
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert all(content[start - 1:start] == b'\n' for start, _ in ranges[1:])
+
+
+def test_range_reader_stops_at_the_end(data):
+    with open(data, 'rb') as f:
+        r = chunks.RangeReader(f, 2, 6)
+        assert r.read(3) == b'0\n1'
+        assert r.read() == b' '
+        assert r.read() == b''
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_count_lines(data, workers):
+    assert chunks.count_lines(data, workers=workers, min_size=0) == 1000
+
+
+def test_count_lines_without_final_newline():
+    with fs.tmp_dir() as d:
+        p = os.path.join(d, 'x.data')
+        with open(p, 'wb') as f:
+            f.write(b'a\nb')
+
+        assert chunks.count_lines(p) == 2
+
+
+def _range_pid(path, start, end):
+    return os.getpid()
+
+
+def _scan_pids(path):
+    return os.getpid(), chunks.map_ranges(_range_pid, path, workers=3, min_size=0)
+
+
+def test_ranges_go_through_a_pool_in_daemon_processes(data):
+    # The celery workers are daemonic, the ranges are still scanned in other processes there.
+    from billiard.pool import Pool
+
+    pool = Pool(processes=1)
+    try:
+        daemon, pids = pool.apply_async(_scan_pids, (data,)).get(timeout=30)
+    finally:
+        pool.close()
+        pool.join()
+
+    assert len(pids) == 3
+    assert daemon not in pids
@@ -0,0 +1,129 @@
+import gzip
+import os
+import zlib
+from zipfile import ZipFile, ZIP_DEFLATED
+
+import pytest
+
+from chalab.tools import archives, compressed, fs, rowindex
+
+CONTENT = b''.join(b'%d %d %d\n' % (i, i * 2, i % 7) for i in range(5000))
+
+
+@pytest.fixture
+def packed():
+    with fs.tmp_dir() as d:
+        p = os.path.join(d, 'x.data')
+        with open(p, 'wb') as f:
+            f.write(CONTENT)
+
+        compressed.compress_file(p, p + compressed.SUFFIX)
+        yield p + compressed.SUFFIX
+
+
+def test_is_readable_by_gzip(packed):
+    with gzip.open(packed, 'rb') as f:
+        assert f.read() == CONTENT
+
+
+def test_info_holds_the_sizes_and_crc(packed):
+    i = compressed.info(packed)
+
+    assert i.size == len(CONTENT) == compressed.plain_size(packed)
+    assert i.crc == zlib.crc32(CONTENT)
+    assert i.data_offset + i.data_size + 8 == os.path.getsize(packed)
+
+
+def test_refuses_other_gzip_files(packed):
+    with gzip.open(packed, 'wb') as f:
+        f.write(CONTENT)
+
+    with pytest.raises(compressed.InvalidCompressedFileException):
+        compressed.info(packed)
+
+
+def test_open_plain_reads_both_kinds(packed):
+    with compressed.open_plain(packed) as f:
+        assert f.read() == CONTENT
+
+    plain = packed[:-len(compressed.SUFFIX)]
+    with compressed.open_plain(plain) as f:
+        assert f.read() == CONTENT
+    assert compressed.plain_size(plain) == len(CONTENT)
+
+
+def test_rows_are_read_from_compressed_files(packed):
+    with rowindex.open_index(packed) as idx, compressed.open_plain(packed) as f:
+        assert len(idx) == 5000
+        assert idx.read(f, 4999) == b'4999 9998 1'
+        assert idx.read(f, 10) == b'10 20 3'
+
+
+def test_deflate_data_is_copied_into_zips(packed):
+    i = compressed.info(packed)
+    zip_path = packed + '.zip'
+    copied = []
+
+    with ZipFile(zip_path, 'w', ZIP_DEFLATED) as zf, open(packed, 'rb') as f:
+        zf.writestr('before.txt', b'before')
+        f.seek(i.data_offset)
+        archives.write_deflated(zf, 'data/x.data', f, i.data_size, i.size, i.crc,
+                                callback=copied.append)
+        zf.writestr('after.txt', b'after')
+
+    with ZipFile(zip_path) as zf:
+        assert zf.testzip() is None
+        assert zf.read('data/x.data') == CONTENT
+        assert zf.read('after.txt') == b'after'
+
+    assert 0 < sum(copied) <= len(CONTENT)
+
+
+def test_zipfile_has_the_internals_deflate_data_is_copied_with(tmpdir):
+    with ZipFile(str(tmpdir.join('x.zip')), 'w', ZIP_DEFLATED) as zf:
+        assert [a for a in archives.ZIPFILE_INTERNALS if not hasattr(zf, a)] == []
+        assert zf._writecheck.__code__.co_argcount == 2
+
+
+def test_deflate_data_is_copied_as_is(packed):
+    i = compressed.info(packed)
+    zip_path = packed + '.zip'
+
+    with ZipFile(zip_path, 'w', ZIP_DEFLATED) as zf, open(packed, 'rb') as f:
+        f.seek(i.data_offset)
+        archives.write_deflated(zf, 'data/x.data', f, i.data_size, i.size, i.crc)
+
+    with ZipFile(zip_path) as zf:
+        assert zf.getinfo('data/x.data').compress_size == i.data_size
+
+
+def test_deflate_data_is_recompressed_without_the_internals(packed, monkeypatch):
+    monkeypatch.setattr(archives, 'ZIPFILE_INTERNALS',
+                        archives.ZIPFILE_INTERNALS + ('_missing',))
+    i = compressed.info(packed)
+    zip_path = packed + '.zip'
+    copied = []
+
+    with ZipFile(zip_path, 'w', ZIP_DEFLATED) as zf, open(packed, 'rb') as f:
+        zf.writestr('before.txt', b'before')
+        f.seek(i.data_offset)
+        archives.write_deflated(zf, 'data/x.data', f, i.data_size, i.size, i.crc,
+                                callback=copied.append)
+        zf.writestr('after.txt', b'after')
+
+    with ZipFile(zip_path) as zf:
+        assert zf.testzip() is None
+        assert zf.read('data/x.data') == CONTENT
+        assert zf.read('after.txt') == b'after'
+
+    assert sum(copied) == len(CONTENT)
+
+
+def test_recompressing_checks_the_crc(packed, monkeypatch):
+    monkeypatch.setattr(archives, 'ZIPFILE_INTERNALS', ('_missing',))
+    i = compressed.info(packed)
+
+    with ZipFile(packed + '.zip', 'w', ZIP_DEFLATED) as zf, open(packed, 'rb') as f:
+        f.seek(i.data_offset)
+        with pytest.raises(ValueError):
+            archives.write_deflated(zf, 'data/x.data', f, i.data_size, i.size, i.crc ^ 1)
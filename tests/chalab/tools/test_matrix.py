@@ -0,0 +1,142 @@
+from array import array
+from io import BytesIO
+
+import pytest
+
+from chalab.tools import matrix
+
+
+def profile(content, **kwargs):
+    return matrix.profile(BytesIO(content), **kwargs)
+
+
+class TestIterLines(object):
+    def test_joins_lines_across_chunks(self):
+        f = BytesIO(b'first line\nsecond line\nlast')
+        assert list(matrix.iter_lines(f, chunk_size=3)) == [b'first line', b'second line', b'last']
+
+    def test_final_newline_adds_no_line(self):
+        assert list(matrix.iter_lines(BytesIO(b'a\nb\n'))) == [b'a', b'b']
+
+
+class TestDenseProfile(object):
+    def test_counts_rows_and_cols(self):
+        p = profile(b'1 2 3\n4 5 6\n7 8 9\n')
+
+        assert (p.rows, p.cols) == (3, 3)
+        assert p.consistent
+        assert p.first_inconsistent_line is None
+
+    def test_reports_the_first_inconsistent_line(self):
+        p = profile(b'1 2 3\n4 5 6\n7 8\n1\n', chunk_size=4)
+
+        assert not p.consistent
+        assert p.first_inconsistent_line == 3
+
+    def test_blank_lines_are_rows_but_not_inconsistent(self):
+        p = profile(b'1 2\n\n3 4\n')
+
+        assert p.rows == 3
+        assert p.consistent
+
+    def test_counts_non_zero_values(self):
+        p = profile(b'0 1 0.0\n2 -0 3\r\n')
+
+        assert (p.values, p.nnz) == (6, 3)
+        assert p.sparsity == 0.5
+
+    def test_missing_values_are_not_counted_as_non_zero(self):
+        batched = profile(b'1 ? 0\n2 3 4\n')
+        streamed = profile(b'1 NaN 0\n2 3 4\n')
+
+        assert batched.nnz == streamed.nnz == 4
+
+    def test_empty_file(self):
+        p = profile(b'')
+
+        assert (p.rows, p.cols, p.sparsity) == (0, 0, 0.0)
+
+
+class TestSparseProfile(object):
+    def test_cols_is_the_largest_index(self):
+        p = profile(b'1:0.5 7:1\n3:2\n', sparse=True)
+
+        assert (p.rows, p.cols, p.nnz) == (2, 7, 3)
+        assert p.consistent
+
+    @pytest.mark.parametrize('row', [b'x:1', b'0:1', b'1', b'1.5:2'])
+    def test_rows_that_are_not_pairs_are_refused(self, row):
+        with pytest.raises(matrix.InvalidMatrixException) as e:
+            profile(b'1:1\n' + row + b' 2:1\n', sparse=True)
+
+        assert e.value.message.startswith('Row 2: ')
+
+    def test_nan_values_are_not_counted_as_non_zero(self):
+        p = profile(b'1:nan 2:1 3:0\n', sparse=True)
+
+        assert (p.values, p.nnz) == (3, 1)
+
+    def test_sparsity_counts_missing_entries(self):
+        p = profile(b'1:1 2:1\n3:1 4:1\n', sparse=True)
+
+        assert p.sparsity == 0.5
+
+
+class TestColumnsProfile(object):
+    def test_dense_min_max(self):
+        p = profile(b'1 -2 3\n4 5 -6\n')
+
+        assert p.mins == [1.0, -2.0, -6.0]
+        assert p.maxs == [4.0, 5.0, 3.0]
+        assert p.missing == [0, 0, 0]
+
+    def test_dense_missing_values(self):
+        p = profile(b'1 NaN 3\n? 5 6\n7 8\n')
+
+        assert p.mins == [1.0, 5.0, 3.0]
+        assert p.maxs == [7.0, 8.0, 6.0]
+        assert p.missing == [1, 1, 1]
+
+    def test_column_without_number(self):
+        p = profile(b'1 NaN\n2 NaN\n')
+
+        assert p.mins == [1.0, None]
+        assert p.missing == [0, 2]
+
+    def test_sparse_columns(self):
+        p = profile(b'1:0.5 3:2\n3:-1\n', sparse=True)
+
+        assert p.mins == [0.5, None, -1.0]
+        assert p.maxs == [0.5, None, 2.0]
+        assert p.missing == [0, 0, 0]
+
+
+class TestParallelProfile(object):
+    def test_matches_the_sequential_profile(self, tmpdir):
+        lines = [b'%d 0 %d' % (i, -i) for i in range(500)]
+        lines[321] = b'1 2'
+        content = b'\n'.join(lines) + b'\n'
+
+        p = tmpdir.join('x.data')
+        p.write_binary(content)
+
+        offsets = array('Q')
+        parallel = matrix.profile_path(str(p), offsets=offsets, workers=4, min_size=0)
+        sequential = matrix.profile(BytesIO(content))
+
+        assert parallel.rows == sequential.rows == 500
+        assert parallel.nnz == sequential.nnz
+        assert parallel.first_inconsistent_line == sequential.first_inconsistent_line == 322
+        assert parallel.columns == sequential.columns
+        assert len(offsets) == 500 and offsets[322] == content.index(lines[322] + b'\n')
+
+    def test_names_the_row_of_an_invalid_sparse_pair(self, tmpdir):
+        lines = [b'1:%d 2:1' % i for i in range(500)]
+        lines[321] = b'1:1 2'
+        p = tmpdir.join('x.data')
+        p.write_binary(b'\n'.join(lines) + b'\n')
+
+        with pytest.raises(matrix.InvalidMatrixException) as e:
+            matrix.profile_path(str(p), sparse=True, workers=4, min_size=0)
+
+        assert e.value.message.startswith('Row 322: ')
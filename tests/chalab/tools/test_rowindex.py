@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from chalab.tools import fs, rowindex
+
+
+@pytest.fixture
+def data():
+    with fs.tmp_dir() as d:
+        p = os.path.join(d, 'x.data')
+        with open(p, 'wb') as f:
+            f.write(b'1 2 3\n\n40 50 60\r\n7 8 9')
+        yield p
+
+
+def test_reads_any_row(data):
+    with rowindex.open_index(data) as idx, open(data, 'rb') as f:
+        assert len(idx) == 4
+        assert idx.read(f, 3) == b'7 8 9'
+        assert idx.read(f, 1) == b''
+        assert idx.read(f, 2) == b'40 50 60'
+        assert idx.span(0) == (0, 6)
+
+
+def test_out_of_range_row(data):
+    with rowindex.open_index(data) as idx:
+        with pytest.raises(IndexError):
+            idx.span(4)
+
+
+def test_index_is_stored_next_to_the_file(data):
+    rowindex.open_index(data).close()
+
+    assert os.path.exists(data + '.idx')
+    assert rowindex.is_current(data)
+
+
+def test_rebuilds_stale_index(data):
+    rowindex.open_index(data).close()
+
+    with open(data, 'ab') as f:
+        f.write(b'\n10 11 12\n')
+    assert not rowindex.is_current(data)
+
+    with rowindex.open_index(data) as idx, open(data, 'rb') as f:
+        assert len(idx) == 5
+        assert idx.read(f, 4) == b'10 11 12'
+
+
+def test_empty_file():
+    with fs.tmp_dir() as d:
+        p = os.path.join(d, 'empty.data')
+        open(p, 'wb').close()
+
+        with rowindex.open_index(p) as idx:
+            assert len(idx) == 0
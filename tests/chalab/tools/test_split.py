@@ -0,0 +1,43 @@
+import io
+import random
+
+from chalab.tools import split
+
+
+def test_assignment_respects_the_sizes():
+    labels = split.assignment(1000, 600, 250)
+
+    assert len(labels) == 1000
+    assert labels.count(split.TRAIN) == 600
+    assert labels.count(split.VALID) == 250
+    assert labels.count(split.TEST) == 150
+
+
+def test_assignment_is_shuffled():
+    labels = split.assignment(1000, 500, 0, rand=random.Random(42))
+
+    assert labels[:500] != bytearray([split.TRAIN]) * 500
+
+
+def test_assignment_rejects_too_large_splits():
+    try:
+        split.assignment(10, 8, 3)
+        assert False, "should fail"
+    except ValueError:
+        assert True
+
+
+def test_split_lines_keeps_input_and_target_aligned():
+    input = io.BytesIO(b''.join(b'x%d\n' % i for i in range(100)))
+    target = io.BytesIO(b''.join(b'y%d\n' % i for i in range(100)))
+
+    labels = split.assignment(100, 60, 20)
+    outputs = [(io.BytesIO(), io.BytesIO()) for _ in range(3)]
+
+    counts = split.split_lines(labels, input, target, outputs)
+
+    assert counts == [60, 20, 20]
+    for fi, ft in outputs:
+        xs = fi.getvalue().split()
+        ys = ft.getvalue().split()
+        assert [x[1:] for x in xs] == [y[1:] for y in ys]
@@ -0,0 +1,168 @@
+import hashlib
+import os
+from contextlib import contextmanager
+from io import BytesIO
+
+import pytest
+from django.core.files.base import ContentFile
+
+from chalab.tools import storage
+
+
+@pytest.fixture
+def partial(tmpdir):
+    p = tmpdir.join('upload.zip')
+    p.write_binary(b'abcdef')
+    return str(p)
+
+
+def test_write_chunk_writes_at_offset(partial):
+    n, digest = storage.write_chunk(partial, 3, BytesIO(b'XYZW'), limit=10)
+
+    assert n == 4
+    assert digest == hashlib.sha256(b'XYZW').hexdigest()
+    with open(partial, 'rb') as f:
+        assert f.read() == b'abcXYZW'
+
+
+def test_write_chunk_cuts_what_came_after(partial):
+    storage.write_chunk(partial, 2, BytesIO(b'X'), limit=10)
+
+    with open(partial, 'rb') as f:
+        assert f.read() == b'abX'
+
+
+def test_write_chunk_refuses_chunks_past_the_limit(partial):
+    with pytest.raises(storage.ChunkTooLargeException):
+        storage.write_chunk(partial, 3, BytesIO(b'XYZW'), limit=3)
+
+    with open(partial, 'rb') as f:
+        assert f.read() == b'abc'
+
+
+@pytest.fixture
+def cas(tmpdir):
+    return storage.ContentAddressedStorage(prefix='cas', location=str(tmpdir))
+
+
+def test_content_addressed_names_come_from_the_content(cas):
+    digest = hashlib.sha256(b'1 2 3\n').hexdigest()
+
+    name = cas.save('x/y/matrix.data', ContentFile(b'1 2 3\n'))
+
+    assert name == 'cas/%s/%s/%s.data' % (digest[:2], digest[2:4], digest)
+    assert cas.digest(name) == digest
+    assert cas.digest('data/raw/matrix.data') is None
+
+
+def test_content_addressed_content_is_stored_once(cas):
+    a = cas.save('a.data', ContentFile(b'1 2 3\n'))
+    mtime = os.path.getmtime(cas.path(a))
+
+    b = cas.save('b.data', ContentFile(b'1 2 3\n'))
+
+    assert a == b
+    assert os.path.getmtime(cas.path(a)) == mtime
+    assert os.listdir(cas.path('cas/tmp')) == []
+
+
+def test_content_addressed_files_are_named_once_written(cas):
+    class Field(object):
+        def generate_filename(self, instance, filename):
+            return filename
+
+    class FieldFile(object):
+        field, instance, storage = Field(), None, cas
+
+    f = FieldFile()
+    with storage.open_for_write(f, 'x.solution') as out:
+        out.write(b'1\n')
+
+    assert f.name == cas.content_name(hashlib.sha256(b'1\n').hexdigest(), 'x.solution')
+    with cas.open(f.name) as stored:
+        assert stored.read() == b'1\n'
+
+
+def test_content_addressed_files_can_be_compressed(tmpdir):
+    cas = storage.ContentAddressedStorage(prefix='cas', location=str(tmpdir), compress='gzip')
+    digest = hashlib.sha256(b'1 2 3\n').hexdigest()
+
+    name = cas.save('matrix.data', ContentFile(b'1 2 3\n'))
+
+    assert name == 'cas/%s/%s/%s.data.gz' % (digest[:2], digest[2:4], digest)
+    assert cas.digest(name) == digest
+    assert cas.size(name) == 6
+    with cas.open(name) as f:
+        assert f.read() == b'1 2 3\n'
+
+
+def test_files_are_replaced_once_written(tmpdir):
+    overwrite = storage.OverwriteStorage(location=str(tmpdir))
+
+    class Field(object):
+        max_length = None
+
+        def generate_filename(self, instance, filename):
+            return 'bundles/' + filename
+
+    class FieldFile(object):
+        field, instance, storage = Field(), None, overwrite
+
+    f = FieldFile()
+    with storage.open_for_write(f, 'bundle.zip') as out:
+        out.write(b'first')
+
+    with pytest.raises(ValueError):
+        with storage.open_for_write(f, 'bundle.zip') as out:
+            out.write(b'partial')
+            raise ValueError('cancelled')
+
+    assert os.listdir(str(tmpdir.join('bundles'))) == ['bundle.zip']
+    with open(overwrite.path(f.name), 'rb') as stored:
+        assert stored.read() == b'first'
+
+
+def test_content_addressed_files_are_looked_up_and_written_claimed(cas):
+    claimed = []
+
+    @contextmanager
+    def claim(name):
+        claimed.append((name, cas.exists(name)))
+        yield
+
+    cas.claim = claim
+    a = cas.save('a.data', ContentFile(b'1 2 3\n'))
+    b = cas.save('b.data', ContentFile(b'1 2 3\n'))
+
+    assert a == b
+    assert claimed == [(a, False), (a, False), (a, True)]
+
+
+def test_pending_contents_are_only_claimed_once_committed(cas):
+    class Field(object):
+        def generate_filename(self, instance, filename):
+            return filename
+
+    class FieldFile(object):
+        field, instance, storage = Field(), None, cas
+
+    claimed = []
+
+    @contextmanager
+    def claim(name):
+        claimed.append(name)
+        yield
+
+    cas.claim = claim
+    f = FieldFile()
+
+    content = storage.PendingContent(f, 'x.data')
+    content.write(b'1 2 3\n')
+    content.close()
+    assert claimed == []
+
+    content.commit()
+
+    assert claimed == [f.name]
+    assert f.name == cas.content_name(hashlib.sha256(b'1 2 3\n').hexdigest(), 'x.data')
+    assert os.listdir(cas.path('cas/tmp')) == []
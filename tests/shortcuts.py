@@ -46,6 +46,12 @@ class SClient(object):
     def post(self, view, data=None, **kwargs):
         return SResponse(self._client.post(reverse(view, kwargs=kwargs), data=data))
 
+    def post_raw(self, view, content, headers=None, **kwargs):
+        """Post `content' as the raw body, `headers' as the WSGI environ (HTTP_*) keys."""
+        return SResponse(self._client.post(reverse(view, kwargs=kwargs), data=content,
+                                           content_type='application/octet-stream',
+                                           **(headers or {})))
+
     def get(self, view, **kwargs):
         return SResponse(self._client.get(reverse(view, kwargs=kwargs)))
 
@@ -1,12 +1,22 @@
+import hashlib
+import os
+from datetime import timedelta
+from io import BytesIO
+from zipfile import ZipFile
+
 import pytest
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
 
+from chalab.tools import rowindex
 from tests.wizard.tools import (COLUMNS_5, COLUMNS_12, MATRIX_5_3, CHALEARN_SAMPLE,
                                 CHALEARN_SAMPLE_SPARSE,
                                 CHALEARN_SAMPLE_WITHOUT_FEAT_SPEC, CHALEARN_SAMPLE_WRONG_FEAT_SPEC,
                                 CHALEARN_SAMPLE_WRONG_ROWS)
-from wizard import models
+from wizard import models, tasks
 from .tools import create_with_file
 
 pytestmark = pytest.mark.django_db
@@ -63,6 +73,51 @@ class TestMatrixStorage:
         assert m.rows.count == 5
         assert m.cols.count == 3
 
+    def test_create_a_matrix_file_stores_its_profile(self):
+        m = create_with_file(models.MatrixModel, MATRIX_5_3)
+
+        assert m.nnz == 14
+        assert m.is_consistent
+        assert m.content_size == m.raw_content.size
+        assert m.columns_dict['min'] == [0.0, 0.2, 20.0]
+        assert m.columns_dict['max'] == [4.0, 1.0, 100.0]
+
+    def test_saving_an_unchanged_matrix_doesnt_scan_it(self, monkeypatch):
+        m = models.MatrixModel.objects.get(pk=create_with_file(models.MatrixModel, MATRIX_5_3).pk)
+
+        def fail(*args, **kwargs):
+            raise AssertionError('the matrix should not be scanned again')
+
+        monkeypatch.setattr(models.matrix, 'profile', fail)
+        monkeypatch.setattr(models, 'file_field_digest', fail)
+        m.save()
+
+        assert m.rows.count == 5
+
+    def test_matrix_with_the_same_content_reuses_the_profile(self, monkeypatch):
+        create_with_file(models.MatrixModel, MATRIX_5_3)
+
+        def fail(*args, **kwargs):
+            raise AssertionError('the profile should be reused')
+
+        monkeypatch.setattr(models.matrix, 'profile', fail)
+        m = create_with_file(models.MatrixModel, MATRIX_5_3)
+
+        assert (m.rows.count, m.cols.count, m.nnz) == (5, 3, 14)
+
+    def test_create_a_matrix_file_indexes_its_rows(self):
+        m = create_with_file(models.MatrixModel, MATRIX_5_3)
+
+        assert rowindex.is_current(m.raw_content.path)
+        assert list(m.read_rows([4, 0])) == [b'4 1 100', b'0 0.2 20']
+
+    def test_matrix_binary_copy(self):
+        m = create_with_file(models.MatrixModel, MATRIX_5_3)
+
+        with m.binary() as b:
+            assert (b.rows, b.cols) == (5, 3)
+            assert b.row(4).tolist() == [4.0, 1.0, 100.0]
+
     def test_matrix_with_invalid_columns_fails(self):
         c = create_with_file(models.ColumnarTypesDefinition, COLUMNS_12)
         a = models.AxisDescriptionModel.create(types=c)
@@ -84,6 +139,19 @@ class TestMatrixStorage:
         assert m.rows.count == 15
         assert m.cols.count == 61188
 
+    def test_sparse_matrix_with_an_invalid_pair_fails(self, tmpdir):
+        path = tmpdir.join('invalid.data')
+        path.write_binary(b'1:1 2:1\n1:1 x:2\n')
+
+        with pytest.raises(ValidationError) as e:
+            create_with_file(models.MatrixModel, str(path), is_sparse=True)
+        assert 'Row 2' in str(e.value)
+
+        with pytest.raises(ValidationError) as e:
+            models.MatrixModel.create_from_fileobj(BytesIO(b'1:1\n0:1\n'), 'invalid.data',
+                                                   is_sparse=True)
+        assert 'Row 2' in str(e.value)
+
 
 class TestDatasetModel:
     def test_create_a_public_empty_dataset(self):
@@ -150,3 +218,326 @@ class TestDatasetModel:
         t = models.DatasetModel.create_from_chalearn(CHALEARN_SAMPLE_SPARSE,
                                               'chalearn - sample sparse')
         assert t.is_ready
+
+
+def zip_of(files):
+    b = BytesIO()
+    with ZipFile(b, 'w') as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+    b.seek(0)
+    return b
+
+
+class TestArchiveUpload:
+    def test_automl_archive_is_streamed_to_the_storage(self):
+        d = models.DatasetModel.create('An empty dataset')
+
+        with open('tests/wizard/resources/uploadable/automl_dataset.zip', 'rb') as fp:
+            d.update_from_chalearn(fp, 'automl')
+
+        assert d.is_ready
+        assert d.name == 'automl_dataset'
+        assert d.input.is_profiled and d.target.is_profiled
+        assert d.input.rows.count == d.target.rows.count
+        assert rowindex.is_current(d.input.raw_content.path)
+
+    def test_members_are_checked_from_the_central_directory(self):
+        zf = ZipFile(zip_of({'x/x.data': '1 2\n', 'x/x.solution': '1\n', 'x/README': ''}))
+
+        name, found = models.automl_archive_members(zf)
+
+        assert name == 'x'
+        assert found['.data'].filename == 'x/x.data'
+        assert found['_feat.name'] is None
+
+    @pytest.mark.parametrize('files', [
+        {'x/x.data': '1 2\n', 'x/x.solution': '1\n', 'x/evil.sh': ''},
+        {'x/x.data': '1 2\n'},
+        {'x/x.data': '1 2\n', 'y/y.solution': '1\n'},
+        {'x.data': '1 2\n', 'x.solution': '1\n'},
+    ])
+    def test_invalid_archives_are_refused(self, files):
+        d = models.DatasetModel.create('An empty dataset')
+
+        with pytest.raises(models.InvalidAutomlFormatException):
+            d.update_from_chalearn(zip_of(files))
+
+        assert d.input is None
+
+    def test_libsvm_archive_is_split_in_input_and_target(self):
+        d = models.DatasetModel.create('An empty dataset')
+        fp = zip_of({'x/x.data': '1 2:0.5 7:1\n-1 1:3\n\n1 4:2 # comment\n'})
+
+        d.update_from_chalearn(fp, 'libsvm')
+
+        assert d.is_ready
+        assert d.input.is_sparse and not d.target.is_sparse
+        assert d.input.rows.count == d.target.rows.count == 3
+        assert d.input.cols.count == 7
+        assert d.input.nnz == 4
+        assert list(d.input.read_rows([0, 2])) == [b'2:0.5 7:1', b'4:2']
+        assert list(d.target.read_rows([0, 1, 2])) == [b'1', b'-1', b'1']
+
+    def test_libsvm_format_is_detected(self):
+        d = models.DatasetModel.create('An empty dataset')
+        fp = zip_of({'x/x.data': '1 2:0.5 7:1\n-1 1:3\n', 'x/x.solution': '1\n0\n'})
+
+        d.update_from_chalearn(fp, 'auto')
+
+        assert d.input.is_sparse and d.input.cols.count == 7
+        assert list(d.target.read_rows([0, 1])) == [b'1', b'0']
+
+    def test_arff_archive_loads_the_features(self):
+        d = models.DatasetModel.create('An empty dataset')
+        fp = zip_of({'x/x.data': '@relation x\n@attribute a numeric\n@attribute b {u, v}\n'
+                                 '@data\n1,u\n2,v\n',
+                     'x/x.solution': '1\n0\n'})
+
+        d.update_from_chalearn(fp, 'arff')
+
+        assert d.is_ready
+        assert d.input.cols.count == 2
+        assert d.input.cols.types.count == d.input.cols.names.count == 2
+        assert list(d.input.read_rows([0, 1])) == [b'1 0', b'2 1']
+
+    def test_files_that_are_not_archives_are_refused(self):
+        d = models.DatasetModel.create('An empty dataset')
+
+        with pytest.raises(models.InvalidAutomlFormatException):
+            d.update_from_chalearn(BytesIO(b'1 2 3\n'))
+
+
+class TestConcurrentLoading:
+    def test_results_keep_the_order_of_the_calls(self):
+        calls = [lambda i=i: i for i in range(5)]
+
+        assert models.concurrently(calls, workers=2) == list(range(5))
+        assert models.concurrently(calls, workers=1) == list(range(5))
+
+    def test_errors_are_raised_again(self):
+        def fail():
+            raise ValueError('failed')
+
+        with pytest.raises(ValueError):
+            models.concurrently([lambda: 1, fail], workers=2)
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_chalearn_dataset_is_the_same_whatever_the_concurrency(self, settings, workers):
+        settings.INGESTION_CONCURRENCY = workers
+
+        t = models.DatasetModel.create_from_chalearn(CHALEARN_SAMPLE, 'chalearn - sample')
+
+        assert t.is_ready
+        assert t.input.is_profiled and t.target.is_profiled
+        assert t.input.cols.types.count == t.input.cols.count
+        assert rowindex.is_current(t.target.raw_content.path)
+
+
+class TestIngestion:
+    def upload(self, path='tests/wizard/resources/uploadable/automl_dataset.zip'):
+        with open(path, 'rb') as f:
+            return SimpleUploadedFile(name='upload.zip', content=f.read(),
+                                      content_type='application/zip')
+
+    def test_ingest_loads_the_upload_in_the_dataset(self):
+        d = models.DatasetModel.create('An empty dataset')
+        job = models.IngestionJobModel.create(d, self.upload())
+
+        tasks.ingest(job)
+
+        job.refresh_from_db()
+        d.refresh_from_db()
+        assert job.state == job.FINISHED
+        assert job.progress == {'perc': 100, 'stage': 'load'}
+        assert job.closed is not None
+        assert not job.upload
+        assert d.is_ready
+
+    def test_ingest_records_invalid_archives(self):
+        d = models.DatasetModel.create('An empty dataset')
+        job = models.IngestionJobModel.create(d, self.upload(MATRIX_5_3))
+
+        tasks.ingest(job)
+
+        job.refresh_from_db()
+        d.refresh_from_db()
+        assert job.state == job.FAILED
+        assert job.error
+        assert not d.is_ready
+
+    def test_ingest_stops_once_the_job_is_cancelled(self):
+        d = models.DatasetModel.create('An empty dataset')
+        job = models.IngestionJobModel.create(d, self.upload())
+        upload, start_stage = job.upload.path, job.start_stage
+
+        def cancel_then_stage(stage):
+            models.IngestionJobModel.objects.get(pk=job.pk).cancel()
+            start_stage(stage)
+
+        job.start_stage = cancel_then_stage
+        tasks.ingest(job)
+
+        job.refresh_from_db()
+        d.refresh_from_db()
+        assert job.state == job.FAILED
+        assert job.error == 'The loading was cancelled.'
+        assert job.stage == ''
+        assert not os.path.exists(upload)
+        assert not d.is_ready
+
+    def test_jobs_running_for_too_long_are_given_up(self, settings):
+        d = models.DatasetModel.create('An empty dataset')
+        job = models.IngestionJobModel.create(d, self.upload())
+        job.state = job.STARTED
+        job.created = timezone.now() - timedelta(seconds=settings.INGESTION_TIMEOUT + 1)
+        job.save()
+
+        assert not models.IngestionJobModel.in_progress(d)
+
+        job.refresh_from_db()
+        assert job.state == job.FAILED
+        assert job.error
+        assert not job.upload
+
+    def test_ingest_only_saves_what_it_loaded(self):
+        d = models.DatasetModel.create('An empty dataset')
+        job = models.IngestionJobModel.create(d, self.upload())
+
+        # The editor saves the dataset while it is being loaded.
+        models.DatasetModel.objects.filter(pk=d.pk).update(license='CC0')
+        tasks.ingest(job)
+
+        d.refresh_from_db()
+        assert d.is_ready
+        assert d.license == 'CC0'
+
+
+class TestChunkedUpload:
+    def create(self, content=b'some archive content'):
+        d = models.DatasetModel.create('An empty dataset')
+        return models.ChunkedUploadModel.create(d, 'archive.zip', len(content))
+
+    def test_chunks_are_assembled_in_storage(self):
+        u = self.create()
+
+        for offset, chunk in [(0, b'some arch'), (9, b'ive content')]:
+            u.append(offset, BytesIO(chunk), hashlib.sha256(chunk).hexdigest(), limit=16)
+
+        u.refresh_from_db()
+        assert u.is_complete
+        assert u.offset == u.size
+        with open(u.content.path, 'rb') as f:
+            assert f.read() == b'some archive content'
+
+    def test_chunk_at_the_wrong_offset_is_refused(self):
+        u = self.create()
+
+        with pytest.raises(models.InvalidChunkException):
+            u.append(4, BytesIO(b'arch'), hashlib.sha256(b'arch').hexdigest(), limit=16)
+
+        u.refresh_from_db()
+        assert u.offset == 0
+
+    def test_chunk_with_a_wrong_checksum_is_refused(self):
+        u = self.create()
+
+        with pytest.raises(models.InvalidChunkException):
+            u.append(0, BytesIO(b'some'), hashlib.sha256(b'else').hexdigest(), limit=16)
+
+        u.refresh_from_db()
+        assert u.offset == 0
+        with open(u.content.path, 'rb') as f:
+            assert f.read() == b''
+
+    def test_chunk_past_the_size_is_refused(self):
+        u = self.create(b'short')
+
+        with pytest.raises(models.InvalidChunkException):
+            u.append(0, BytesIO(b'too long'), hashlib.sha256(b'too long').hexdigest(), limit=16)
+
+    def test_abandoned_uploads_expire_with_their_partial_file(self):
+        abandoned, going_on, complete = self.create(), self.create(), self.create(b'done')
+        complete.append(0, BytesIO(b'done'), hashlib.sha256(b'done').hexdigest(), limit=16)
+        path = abandoned.content.path
+
+        day_ago = timezone.now() - timedelta(days=1, minutes=1)
+        models.ChunkedUploadModel.objects.update(created=day_ago)
+        os.utime(path, (day_ago.timestamp(), day_ago.timestamp()))
+
+        assert models.ChunkedUploadModel.expire(age=timedelta(days=1)) == 2
+
+        assert not os.path.exists(path)
+        assert os.path.exists(complete.content.path)  # the ingestion job uses it.
+        assert list(models.ChunkedUploadModel.objects.all()) == [going_on]
+
+
+class TestContentAddressedStorage:
+    @pytest.fixture(autouse=True)
+    def media(self, settings, tmpdir):
+        # Collecting goes through the whole storage, not only the files of the test.
+        settings.MEDIA_ROOT = str(tmpdir)
+
+    def test_same_content_is_stored_once(self):
+        a = create_with_file(models.MatrixModel, MATRIX_5_3)
+        b = create_with_file(models.MatrixModel, MATRIX_5_3)
+
+        assert a.raw_content.name == b.raw_content.name
+        assert models.BlobModel.objects.get(name=a.raw_content.name).refs == 2
+
+    def test_files_are_collected_once_nothing_refers_to_them(self):
+        a = create_with_file(models.MatrixModel, MATRIX_5_3)
+        b = create_with_file(models.MatrixModel, MATRIX_5_3)
+        path = a.raw_content.path
+
+        a.delete()
+        assert models.BlobModel.collect(grace=timedelta(0)) == (0, 0)
+
+        b.delete()
+        files, freed = models.BlobModel.collect(grace=timedelta(0))
+
+        assert files == 1 and freed > 0
+        assert not os.path.exists(path)
+        assert not os.path.exists(rowindex.index_path(path))
+
+    def test_recently_released_files_are_kept(self):
+        a = create_with_file(models.MatrixModel, MATRIX_5_3)
+        a.delete()
+
+        assert models.BlobModel.collect() == (0, 0)
+        assert os.path.exists(a.raw_content.path)
+
+    def test_files_stored_for_unsaved_models_are_collected(self):
+        name = models.content_storage.save('x.data', ContentFile(b'never saved\n'))
+        path = models.content_storage.path(name)
+
+        assert models.BlobModel.collect() == (0, 0)
+        assert os.path.exists(path)
+
+        assert models.BlobModel.collect(grace=timedelta(0)) == (1, len(b'never saved\n'))
+        assert not os.path.exists(path)
+
+    def test_stored_files_nothing_tracks_are_collected(self):
+        name = models.content_storage.save('x.data', ContentFile(b'not tracked\n'))
+        path = models.content_storage.path(name)
+        models.BlobModel.objects.filter(name=name).delete()
+
+        assert models.BlobModel.collect() == (0, 0)
+        assert models.BlobModel.collect(grace=timedelta(0)) == (1, len(b'not tracked\n'))
+        assert not os.path.exists(path)
+
+    def test_splits_replaced_by_a_rebuild_are_collected(self):
+        d = models.DatasetModel.create_from_chalearn(CHALEARN_SAMPLE, 'chalearn - sample')
+        t = models.TaskModel.from_chalearn(d, CHALEARN_SAMPLE, 'chalearn - task sample')
+        old = [t.input_train, t.target_train, t.input_valid, t.target_valid,
+               t.input_test, t.target_test]
+        pks = [m.pk for m in old]
+
+        t.update_from_chalearn(CHALEARN_SAMPLE_SPARSE)
+
+        assert not models.MatrixModel.objects.filter(pk__in=pks).exists()
+
+        files, freed = models.BlobModel.collect(grace=timedelta(0))
+        assert files >= len({m.raw_content.name for m in old}) and freed > 0
+        assert not any(os.path.exists(m.raw_content.path) for m in old)
+        assert os.path.exists(t.input_train.raw_content.path)
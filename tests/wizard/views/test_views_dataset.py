@@ -1,5 +1,11 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+
 import pytest
 from django.urls import reverse
+from django.utils import timezone
 
 from tests.tools import make_request, assert_redirects, html, sreverse
 from tests.wizard.models.tools import make_samples_datasets
@@ -9,6 +15,21 @@ from wizard import views as wiz
 pytestmark = pytest.mark.django_db
 
 
+def chunk_headers(offset, chunk):
+    return {'HTTP_UPLOAD_OFFSET': str(offset),
+            'HTTP_UPLOAD_CHECKSUM': hashlib.sha256(chunk).hexdigest()}
+
+
+def wait_for_ingestion(client, timeout=10):
+    """Poll the status of the last upload until it is loaded."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        r = client.get('wizard:challenge:data.status_json', pk=client.pk)
+        if json.loads(r.content.decode('utf-8'))['state'] in {'finished', 'failed'}:
+            return
+        time.sleep(0.2)
+
+
 class TestDataPicker(object):
     def test_shows_public_dataset(self, random_challenge):
         pk = random_challenge.challenge.pk
@@ -144,11 +165,134 @@ class TestDataUpdate(object):
                                         'name': 'updated dataset',
                                         'automl_upload': fp
                                     })
+        wait_for_ingestion(cb_and_my_data)
+
         c = cb_and_my_data.challenge
         c.refresh_from_db()
         ds = c.dataset
         assert ds.is_ready
 
+    def test_upload_is_ingested_in_the_background(self, cb_and_my_data):
+        with open('tests/wizard/resources/uploadable/automl_dataset.zip', 'rb') as fp:
+            cb_and_my_data.post('wizard:challenge:data', pk=cb_and_my_data.pk,
+                                data={'name': 'updated dataset', 'automl_upload': fp})
+
+        r = cb_and_my_data.get('wizard:challenge:data.status_json', pk=cb_and_my_data.pk)
+        status = json.loads(r.content.decode('utf-8'))
+
+        assert status['state'] in {'scheduled', 'started', 'finished'}
+        assert status['error'] == ''
+
+    def test_cant_upload_while_an_upload_is_ingested(self, cb_and_my_data):
+        c = cb_and_my_data.challenge
+        c.refresh_from_db()
+        models.IngestionJobModel.objects.create(dataset=c.dataset,
+                                                state=models.IngestionJobModel.STARTED)
+
+        with open('tests/wizard/resources/uploadable/automl_dataset.zip', 'rb') as fp:
+            r = cb_and_my_data.post('wizard:challenge:data', pk=cb_and_my_data.pk,
+                                    data={'name': 'updated dataset', 'automl_upload': fp})
+
+        assert r.status_code == 400
+
+    def test_can_upload_once_an_ingestion_timed_out(self, cb_and_my_data, settings):
+        c = cb_and_my_data.challenge
+        c.refresh_from_db()
+        started = timezone.now() - timedelta(seconds=settings.INGESTION_TIMEOUT + 1)
+        job = models.IngestionJobModel.objects.create(dataset=c.dataset, created=started,
+                                                      state=models.IngestionJobModel.STARTED)
+
+        r = cb_and_my_data.post('wizard:challenge:data.upload', pk=cb_and_my_data.pk,
+                                data={'filename': 'archive.zip', 'size': 10})
+
+        assert r.status_code == 201
+        job.refresh_from_db()
+        assert job.state == job.FAILED
+
+    def test_cancel_gives_up_the_ingestion(self, cb_and_my_data):
+        c = cb_and_my_data.challenge
+        c.refresh_from_db()
+        job = models.IngestionJobModel.objects.create(dataset=c.dataset,
+                                                      state=models.IngestionJobModel.STARTED)
+
+        r = cb_and_my_data.post('wizard:challenge:data.cancel', pk=cb_and_my_data.pk)
+        assert_redirects(r, sreverse('wizard:challenge:data', pk=cb_and_my_data.pk))
+
+        job.refresh_from_db()
+        assert job.state == job.FAILED
+        assert job.closed is not None
+        assert not models.IngestionJobModel.in_progress(c.dataset)
+
+    def test_cant_cancel_without_ingestion(self, cb_and_my_data):
+        r = cb_and_my_data.post('wizard:challenge:data.cancel', pk=cb_and_my_data.pk)
+
+        assert r.status_code == 400
+        assert b'There is no archive being loaded to cancel' in r.content
+
+    def test_status_returns_404_without_upload(self, cb_and_my_data):
+        r = cb_and_my_data.get('wizard:challenge:data.status_json', pk=cb_and_my_data.pk)
+        assert r.status_code == 404
+
+    def test_chunked_upload_is_ingested(self, cb_and_my_data):
+        with open('tests/wizard/resources/uploadable/automl_dataset.zip', 'rb') as fp:
+            content = fp.read()
+
+        r = cb_and_my_data.post('wizard:challenge:data.upload', pk=cb_and_my_data.pk,
+                                data={'filename': 'automl_dataset.zip', 'size': len(content)})
+        assert r.status_code == 201
+        upload = json.loads(r.content.decode('utf-8'))
+
+        for offset in range(0, len(content), 4096):
+            chunk = content[offset:offset + 4096]
+            r = cb_and_my_data.post_raw('wizard:challenge:data.upload.chunk', chunk,
+                                        headers=chunk_headers(offset, chunk),
+                                        pk=cb_and_my_data.pk, upload_id=upload['id'])
+            assert r.status_code == 200
+
+        assert json.loads(r.content.decode('utf-8'))['complete']
+        wait_for_ingestion(cb_and_my_data)
+
+        c = cb_and_my_data.challenge
+        c.refresh_from_db()
+        assert c.dataset.is_ready
+
+    def test_chunked_upload_reports_the_offset_to_resume_from(self, cb_and_my_data):
+        r = cb_and_my_data.post('wizard:challenge:data.upload', pk=cb_and_my_data.pk,
+                                data={'filename': 'archive.zip', 'size': 10})
+        upload = json.loads(r.content.decode('utf-8'))
+
+        r = cb_and_my_data.post_raw('wizard:challenge:data.upload.chunk', b'01234',
+                                    headers=chunk_headers(5, b'01234'),
+                                    pk=cb_and_my_data.pk, upload_id=upload['id'])
+
+        assert r.status_code == 409
+        assert json.loads(r.content.decode('utf-8'))['offset'] == 0
+
+    def test_chunked_upload_resumes_from_the_last_chunk(self, cb_and_my_data):
+        r = cb_and_my_data.post('wizard:challenge:data.upload', pk=cb_and_my_data.pk,
+                                data={'filename': 'archive.zip', 'size': 10})
+        upload = json.loads(r.content.decode('utf-8'))
+        cb_and_my_data.post_raw('wizard:challenge:data.upload.chunk', b'01234',
+                                headers=chunk_headers(0, b'01234'),
+                                pk=cb_and_my_data.pk, upload_id=upload['id'])
+
+        r = cb_and_my_data.post('wizard:challenge:data.upload', pk=cb_and_my_data.pk,
+                                data={'resume': upload['id']})
+
+        assert r.status_code == 200
+        status = json.loads(r.content.decode('utf-8'))
+        assert (status['id'], status['offset']) == (upload['id'], 5)
+
+    def test_cant_resume_an_unknown_upload(self, cb_and_my_data):
+        r = cb_and_my_data.post('wizard:challenge:data.upload', pk=cb_and_my_data.pk,
+                                data={'resume': 1234})
+        assert r.status_code == 404
+
+    def test_cant_start_a_chunked_upload_on_public_datasets(self, cb_and_public_data):
+        r = cb_and_public_data.post('wizard:challenge:data.upload', pk=cb_and_public_data.pk,
+                                    data={'filename': 'archive.zip', 'size': 10})
+        assert r.status_code == 403
+
     def test_dataset_page_shows_picker_button(self, cb_and_public_data):
         r = cb_and_public_data.get('wizard:challenge:data', pk=cb_and_public_data.pk)
 
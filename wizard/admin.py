@@ -2,11 +2,12 @@ from django.contrib import admin
 
 from .models import (DatasetModel, TaskModel, MetricModel, ChallengeModel,
                      DocumentationModel, DocumentationPageModel, MatrixModel,
-                     AxisDescriptionModel)
+                     AxisDescriptionModel, IngestionJobModel)
 
 admin.site.register(AxisDescriptionModel)
 admin.site.register(MatrixModel)
 admin.site.register(DatasetModel)
+admin.site.register(IngestionJobModel)
 admin.site.register(TaskModel)
 admin.site.register(MetricModel)
 admin.site.register(ChallengeModel)
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from wizard.models import BlobModel, ChunkedUploadModel
+
+
+class Command(BaseCommand):
+    help = ('Remove the stored matrices and columns files nothing refers to anymore, '
+            'and the abandoned chunked uploads')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=float, default=1.0,
+                            help='hours a file stays once nothing refers to it')
+        parser.add_argument('--uploads', type=float, default=24.0,
+                            help='hours an upload stays once nothing was written to it')
+
+    def handle(self, *args, **options):
+        files, freed = BlobModel.collect(grace=timedelta(hours=options['grace']))
+        self.stdout.write('Removed %s files, %.1f MB' % (files, freed / 1024 ** 2))
+
+        uploads = ChunkedUploadModel.expire(age=timedelta(hours=options['uploads']))
+        self.stdout.write('Removed %s uploads' % uploads)
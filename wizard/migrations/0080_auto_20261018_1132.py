@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 11:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wizard', '0079_challengemodel_build_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matrixmodel',
+            name='columns',
+            field=models.TextField(default='{}'),
+        ),
+        migrations.AddField(
+            model_name='matrixmodel',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='matrixmodel',
+            name='content_size',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='matrixmodel',
+            name='first_inconsistent_line',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='matrixmodel',
+            name='is_consistent',
+            field=models.NullBooleanField(),
+        ),
+        migrations.AddField(
+            model_name='matrixmodel',
+            name='nnz',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 14:05
+from __future__ import unicode_literals
+
+import chalab.tools.storage
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wizard', '0080_auto_20261018_1132'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJobModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('scheduled', 'Scheduled'), ('started', 'Started'), ('finished', 'Finished'), ('failed', 'Failed')], max_length=10)),
+                ('stage', models.CharField(blank=True, default='', max_length=32)),
+                ('progress_perc', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('upload', models.FileField(null=True, upload_to=chalab.tools.storage.save_to_upload)),
+                ('data_format', models.CharField(default='auto', max_length=16)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('closed', models.DateTimeField(null=True)),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingestion_jobs', to='wizard.DatasetModel')),
+                ('owner', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
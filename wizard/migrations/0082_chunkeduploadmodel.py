@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 15:20
+from __future__ import unicode_literals
+
+import chalab.tools.storage
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wizard', '0081_ingestionjobmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUploadModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(max_length=256)),
+                ('size', models.BigIntegerField()),
+                ('offset', models.BigIntegerField(default=0)),
+                ('data_format', models.CharField(default='auto', max_length=16)),
+                ('content', models.FileField(null=True, upload_to=chalab.tools.storage.save_to_upload)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('completed', models.DateTimeField(null=True)),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunked_uploads', to='wizard.DatasetModel')),
+                ('owner', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
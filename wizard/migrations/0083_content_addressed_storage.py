@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 16:40
+from __future__ import unicode_literals
+
+import chalab.tools.storage
+from django.db import migrations, models
+import wizard.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wizard', '0082_chunkeduploadmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlobModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refs', models.IntegerField(default=0)),
+                ('released', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='columnardocdefinition',
+            name='raw_content',
+            field=models.FileField(storage=chalab.tools.storage.ContentAddressedStorage(prefix='data/cas'), upload_to=wizard.models.StorageNameFactory('data', 'raw', 'columns')),
+        ),
+        migrations.AlterField(
+            model_name='columnarnamesdefinition',
+            name='raw_content',
+            field=models.FileField(storage=chalab.tools.storage.ContentAddressedStorage(prefix='data/cas'), upload_to=wizard.models.StorageNameFactory('data', 'raw', 'columns')),
+        ),
+        migrations.AlterField(
+            model_name='columnartypesdefinition',
+            name='raw_content',
+            field=models.FileField(storage=chalab.tools.storage.ContentAddressedStorage(prefix='data/cas'), upload_to=wizard.models.StorageNameFactory('data', 'raw', 'columns')),
+        ),
+        migrations.AlterField(
+            model_name='matrixmodel',
+            name='raw_content',
+            field=models.FileField(storage=chalab.tools.storage.ContentAddressedStorage(prefix='data/cas'), upload_to=wizard.models.StorageNameFactory('data', 'raw', 'matrix')),
+        ),
+    ]
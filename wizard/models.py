@@ -1,22 +1,29 @@
+import json
 import logging
+from array import array
 import string
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
 from time import gmtime, strftime
+from zipfile import BadZipFile, ZipFile
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.core.exceptions import ValidationError
 from django.core.files.storage import DefaultStorage
 from django.core.validators import validate_slug
-from django.db import models
+from django.db import models, transaction
 from django.db.models import OneToOneField
 from django.db.models import Q
+from django.db.models.signals import post_delete
 from django.urls import reverse
 from django.utils.deconstruct import deconstructible
 from django.utils import timezone
 from tinymce.models import HTMLField
 
-from chalab.tools import archives, fs
+from chalab.tools import archives, binmatrix, chunks, compressed, fs, matrix, rowindex
 from chalab.tools.storage import *
 from . import docs
 
@@ -24,6 +31,9 @@ log = logging.getLogger('wizard/models')
 
 storage = DefaultStorage()
 
+# The matrices and their columns definitions are stored once per content.
+content_storage = ContentAddressedStorage(prefix='data/cas')
+
 
 def build_absolute_uri(path):
     site = Site.objects.get_current().domain
@@ -59,6 +69,11 @@ def lines_count(file_field):
     """
     Return the number of lines in a django Model FileField.
     """
+    path = plain_path(file_field)
+    if path is not None:
+        return chunks.count_lines(path, workers=settings.MATRIX_SCAN_WORKERS,
+                                  min_size=settings.MATRIX_SCAN_PARALLEL_SIZE)
+
     try:
         file_field.open('r')
         r = 0
@@ -69,34 +84,138 @@ def lines_count(file_field):
         file_field.close()
 
 
-def columns_count_first_line(file_field):
+class BlobModel(models.Model):
     """
-    Return the number of columns for the first line of a file
-    from a django Model FileField.
+    A file of the content-addressed storage, with the number of models
+    referring to it. Files no longer referred to are removed by `collect'.
     """
-    try:
-        file_field.open('r')
-        line = file_field.readline()
-        return len(line.split())
-    finally:
-        file_field.close()
+    name = models.CharField(max_length=255, unique=True)
+    refs = models.IntegerField(default=0, null=False)
+    released = models.DateTimeField(null=True)  # when refs last went down to 0
+
+    # Files derived from the content, stored next to it.
+    SIDECARS = (rowindex.SUFFIX, binmatrix.SUFFIX)
+
+    @classmethod
+    @contextmanager
+    def claim(cls, name):
+        """
+        Hold the row of `name' while the storage looks its file up and writes it,
+        so that `collect' can't remove the file meanwhile. Until a model acquires
+        it, the file is then kept for another grace period.
+        """
+        with transaction.atomic():
+            blob, _ = cls.objects.get_or_create(name=name, defaults={'released': timezone.now()})
+            blob = cls.objects.select_for_update().get(pk=blob.pk)
+            if blob.refs <= 0:
+                blob.released = timezone.now()
+                blob.save(update_fields=['released'])
+            yield
+
+    @classmethod
+    def acquire(cls, name):
+        with transaction.atomic():
+            blob, _ = cls.objects.select_for_update().get_or_create(name=name)
+            cls.objects.filter(pk=blob.pk).update(refs=models.F('refs') + 1, released=None)
+
+    @classmethod
+    def release(cls, name):
+        cls.objects.filter(name=name).update(refs=models.F('refs') - 1)
+        cls.objects.filter(name=name, refs__lte=0).update(released=timezone.now())
+
+    @classmethod
+    def track_stored(cls, before):
+        """
+        Add the rows missing for the stored files last written before `before',
+        such as contents saved for models that never were: `collect' removes them.
+        """
+        root = content_storage.path(content_storage.prefix)
+        known = set(cls.objects.values_list('name', flat=True))
+
+        for d, dirs, files in os.walk(root):
+            if d == root and 'tmp' in dirs:
+                dirs.remove('tmp')  # files being written
+
+            for x in files:
+                path = os.path.join(d, x)
+                name = '/'.join([content_storage.prefix, os.path.relpath(path, root)])
+                if name in known or x.endswith(cls.SIDECARS):
+                    continue
+
+                written = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+                if written < before:
+                    cls.objects.get_or_create(name=name, defaults={'released': written})
+
+    @classmethod
+    def collect(cls, grace=timedelta(hours=1)):
+        """
+        Remove the files nothing refers to since `grace', so that uploads in
+        progress can still pick them up. Return the number of files and bytes freed.
+        """
+        files, freed = 0, 0
+        before = timezone.now() - grace
+
+        cls.track_stored(before)
+
+        for pk in cls.objects.filter(refs__lte=0, released__lt=before).values_list('pk', flat=True):
+            with transaction.atomic():
+                # Only if it wasn't picked up in the meantime.
+                b = cls.objects.select_for_update() \
+                    .filter(pk=pk, refs__lte=0, released__lt=before).first()
+                if b is None:
+                    continue
+
+                for name in [b.name] + [b.name + x for x in cls.SIDECARS]:
+                    if content_storage.exists(name):
+                        freed += content_storage.size(name)
+                        content_storage.delete(name)
+                b.delete()
+            files += 1
+
+        return files, freed
+
+    def __str__(self):
+        return "<%s: %s, refs=%s>" % (type(self).__name__, self.name, self.refs)
+
+
+content_storage.claim = BlobModel.claim
+
 
+class ContentAddressedMixin(object):
+    """
+    Keep the reference counts of the content-addressed raw_content
+    of a model up to date, see BlobModel.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_name = dict(zip(field_names, values)).get('raw_content')
+        return instance
 
-def columns_all_the_same_count(file_field, cols):
-    file_field.open('r')
-    lines = file_field.readlines()
-    file_field.close()
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
 
-    for line in lines:
-        if line.strip and len(line.split()) != cols:
-            return False
-    return True
+        old, new = self.__dict__.get('_stored_name'), self.raw_content.name
+        if old != new:
+            if new:
+                BlobModel.acquire(new)
+            if old:
+                BlobModel.release(old)
+            self._stored_name = new
 
 
-class ColumnarFileModel(models.Model):
+def release_raw_content(sender, instance, **kwargs):
+    name = instance.__dict__.get('_stored_name', instance.raw_content.name)
+    if name:
+        BlobModel.release(name)
+
+
+class ColumnarFileModel(ContentAddressedMixin, models.Model):
     name = None
 
-    raw_content = models.FileField(upload_to=StorageNameFactory('data', 'raw', 'columns'))
+    raw_content = models.FileField(upload_to=StorageNameFactory('data', 'raw', 'columns'),
+                                   storage=content_storage)
     count = models.IntegerField()
 
     def save(self, *args, **kwargs):
@@ -228,10 +347,11 @@ def load_info_file(file):
             raise Exception("Problem loading: %s" % file) from e
 
 
-class MatrixModel(models.Model):
+class MatrixModel(ContentAddressedMixin, models.Model):
     name = 'matrix'
 
-    raw_content = models.FileField(upload_to=StorageNameFactory('data', 'raw', 'matrix'))
+    raw_content = models.FileField(upload_to=StorageNameFactory('data', 'raw', 'matrix'),
+                                   storage=content_storage)
     is_sparse = models.BooleanField(default=False, null=False)
 
     cols = OneToOneField(AxisDescriptionModel, null=True,
@@ -239,20 +359,89 @@ class MatrixModel(models.Model):
     rows = OneToOneField(AxisDescriptionModel, null=True,
                          on_delete=models.PROTECT, related_name='matrix_rows')
 
-    def clean(self):
-        super().clean()  # Called last since we set the default self.columns and self.rows before.
+    # The profile of raw_content, computed again only when its content changes.
+    content_hash = models.CharField(max_length=64, default='', blank=True, db_index=True)
+    content_size = models.BigIntegerField(null=True)
+    nnz = models.BigIntegerField(null=True)
+    is_consistent = models.NullBooleanField()
+    first_inconsistent_line = models.BigIntegerField(null=True)
+    # JSON: the min, max and count of missing values of each column.
+    columns = models.TextField(default='{}')
 
-        rows = lines_count(self.raw_content)
-        cols = columns_count_first_line(self.raw_content)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._profiled_name = dict(zip(field_names, values)).get('raw_content')
+        return instance
 
-        if not columns_all_the_same_count(self.raw_content, cols):
-            pass
-            # raise InvalidAutomlFormatException("Number of cols non coherent in %s" % self.raw_content)
+    @property
+    def columns_dict(self):
+        return json.loads(self.columns)
 
-        if self.cols is None:
-            self.cols = AxisDescriptionModel.objects.create()
-        if self.rows is None:
-            self.rows = AxisDescriptionModel.objects.create()
+    @property
+    def is_profiled(self):
+        """Whether the stored profile is the one of the current raw_content."""
+        return (self.content_hash != '' and
+                self.rows is not None and self.cols is not None and
+                self.raw_content.name == self.__dict__.get('_profiled_name') and
+                self.raw_content.size == self.content_size)
+
+    def profile(self):
+        """
+        Profile raw_content, copying the profile of a matrix with the same
+        content if there is one, scan the file otherwise.
+        """
+        size, h = self.raw_content.size, file_field_digest(self.raw_content)
+
+        same = (MatrixModel.objects
+                .filter(content_hash=h, content_size=size, is_sparse=self.is_sparse,
+                        rows__isnull=False, cols__isnull=False)
+                .exclude(pk=self.pk)
+                .select_related('rows', 'cols')
+                .first())
+
+        if same is not None:
+            rows, cols = same.rows.count, same.cols.count
+            self.nnz, self.is_consistent = same.nnz, same.is_consistent
+            self.first_inconsistent_line = same.first_inconsistent_line
+            self.columns = same.columns
+        else:
+            offsets = array('Q')
+            path = plain_path(self.raw_content)
+            try:
+                if path is not None:
+                    p = matrix.profile_path(path, sparse=self.is_sparse, offsets=offsets,
+                                            workers=settings.MATRIX_SCAN_WORKERS,
+                                            min_size=settings.MATRIX_SCAN_PARALLEL_SIZE)
+                else:
+                    try:
+                        self.raw_content.open('rb')
+                        p = matrix.profile(self.raw_content, sparse=self.is_sparse,
+                                           offsets=offsets)
+                    finally:
+                        self.raw_content.close()
+            except matrix.InvalidMatrixException as e:
+                raise ValidationError(e.message) from e
+
+            # The rows index comes for free with the scan.
+            if self.raw_content.storage.exists(self.raw_content.name):
+                rowindex.write(self.raw_content.path, offsets)
+
+            rows, cols = self._use_profile(p)
+
+        self._set_profile(h, size, rows, cols)
+
+    def _use_profile(self, p):
+        self.nnz, self.is_consistent = p.nnz, p.consistent
+        self.first_inconsistent_line = p.first_inconsistent_line
+        self.columns = json.dumps(p.columns)
+        return p.rows, p.cols
+
+    def _set_profile(self, h, size, rows, cols):
+        if not self.is_consistent:
+            # raise InvalidAutomlFormatException("Number of cols non coherent in %s" % self.raw_content)
+            log.warning("Number of cols non coherent in %s, first at line %s",
+                        self.raw_content, self.first_inconsistent_line)
 
         if not self.is_sparse:
             self.cols.count = cols
@@ -262,17 +451,155 @@ class MatrixModel(models.Model):
         self.cols.save()
         self.rows.save()
 
+        self.content_hash, self.content_size = h, size
+        self._profiled_name = self.raw_content.name
+
+    def write_content(self, fileobj, filename):
+        """
+        Write the binary `fileobj' for raw_content as `filename', the file is
+        profiled on the way: its content is only read once.
+
+        The database isn't used, so this can run in other threads: the content is
+        only stored, which claims it, by `use_written' with what this returns.
+        """
+        offsets = array('Q')
+        content = PendingContent(self.raw_content, filename)
+        try:
+            with content.file:
+                p = matrix.profile(TeeReader(fileobj, content.write),
+                                   sparse=self.is_sparse, offsets=offsets)
+        except matrix.InvalidMatrixException as e:
+            content.discard()
+            raise ValidationError(e.message) from e
+        except:
+            content.discard()
+            raise
+
+        return content, p, offsets
+
+    def use_written(self, written):
+        """Store the content written by `write_content', with its profile and rows index."""
+        content, p, offsets = written
+        content.commit()
+        rowindex.write(self.raw_content.path, offsets)
+
+        self.create_axes()
+
+        # The storage hashed the content to name it.
+        h = file_field_digest(self.raw_content)
+
+        rows, cols = self._use_profile(p)
+        self._set_profile(h, self.raw_content.size, rows, cols)
+
+    def store(self, fileobj, filename):
+        """Write and profile the binary `fileobj' as raw_content, see `write_content'."""
+        self.use_written(self.write_content(fileobj, filename))
+
+    @classmethod
+    def create_from_fileobj(cls, fileobj, filename, **kwargs):
+        m = cls(**kwargs)
+        m.store(fileobj, filename)
+        m.save()
+        return m
+
+    def row_index(self):
+        """
+        Open the index of the rows of raw_content, see `chalab.tools.rowindex'.
+        It is built again if it is missing or stale.
+        """
+        return rowindex.open_index(self.raw_content.path)
+
+    def read_rows(self, ids):
+        """Yield the rows `ids' of raw_content, without a scan of the file."""
+        with self.row_index() as idx, compressed.open_plain(self.raw_content.path) as f:
+            for i in ids:
+                yield idx.read(f, i)
+
+    def binary(self):
+        """
+        Open the binary copy of raw_content, see `chalab.tools.binmatrix'.
+        It is made on first use, and again whenever raw_content changes.
+        """
+        return binmatrix.open_binary(self.raw_content.path, sparse=self.is_sparse)
+
+    def create_axes(self):
+        if self.cols is None:
+            self.cols = AxisDescriptionModel.objects.create()
+        if self.rows is None:
+            self.rows = AxisDescriptionModel.objects.create()
+
+    def clean(self):
+        super().clean()  # Called last since we set the default self.columns and self.rows before.
+
+        self.create_axes()
+
+        if not self.is_profiled:
+            self.profile()
+
     def save(self, *args, **kwargs):
         self.clean()  # Force clean on save.
         super().save(*args, **kwargs)
 
 
+for clss in (ColumnarTypesDefinition, ColumnarNamesDefinition, ColumnarDocDefinition,
+             MatrixModel):
+    post_delete.connect(release_raw_content, sender=clss)
+
+
 class InvalidAutomlFormatException(Exception):
     def __init__(self, cause):
         self.cause = cause
         self.message = "Expected an Automl Format archive: " + str(cause)
 
 
+class IngestionCancelledException(Exception):
+    pass
+
+
+AUTOML_ARCHIVE_SUFFIXES = {'.data', '.solution', '_feat.name',
+                           '_info.m', '_label.name', '_sample.name'}
+AUTOML_ARCHIVE_READMES = {'README', 'README.txt', 'README.md'}
+
+
+def automl_archive_members(zf, solution=True):
+    """
+    Check the members of an uploaded AutoML archive from its central directory,
+    nothing is extracted. Return the name of the dataset and the members by suffix.
+
+    The archive holds a single `name' directory, with at least the .data file,
+    and the .solution file if `solution'.
+    """
+    infos = [i for i in archives.members(zf) if 'DS_Store' not in i.filename]
+
+    roots = set(i.filename.split('/')[0] for i in infos)
+    if len(roots) != 1 or any('/' not in i.filename for i in infos):
+        raise InvalidAutomlFormatException(
+            "Expected a single folder in the archive, got: %s" % sorted(roots))
+
+    name = roots.pop()
+    content = {i.filename[len(name) + 1:]: i for i in infos}
+
+    expected_files = set('%s%s' % (name, x) for x in AUTOML_ARCHIVE_SUFFIXES)
+    expected_files |= AUTOML_ARCHIVE_READMES
+
+    unexpected = set(content) - expected_files
+    required = ('.data', '.solution') if solution else ('.data',)
+    minimum = set('%s%s' % (name, x) for x in required) - set(content)
+
+    if len(unexpected) > 0:
+        raise InvalidAutomlFormatException("Unexpected files: %s" % unexpected)
+    if len(minimum) > 0:
+        raise InvalidAutomlFormatException("Missing files: %s" % minimum)
+
+    try:
+        archives.check_sizes(infos, max_size=settings.DATASET_ARCHIVE_MAX_SIZE,
+                             max_ratio=settings.DATASET_ARCHIVE_MAX_RATIO)
+    except archives.InvalidArchiveException as e:
+        raise InvalidAutomlFormatException(e.message) from e
+
+    return name, {x: content.get('%s%s' % (name, x)) for x in AUTOML_ARCHIVE_SUFFIXES}
+
+
 def default_metric(metric, task):
     suffixes = ['multiclass', 'multilabel', 'binary', 'regression']
 
@@ -335,54 +662,85 @@ class DatasetModel(models.Model):
     def template_doc(self):
         return {'dataset_name': ""}
 
-    def update_from_chalearn(self, fp_zip, data_format='auto'):
-        with archives.unzip_fp(fp_zip) as d:
-            if data_format == 'libsvm':
-                pass
-            else:
-                try:
-                    root = fs.sole_path(d)
-                    name = os.path.basename(root)
-
-                    content = set(x for x in os.listdir(root)
-                                  if not 'DS_Store' in x and not '__MACOS' in x)
-                    expected_suffixes = {'.data', '.solution', '_feat.name',
-                                         '_info.m', '_label.name', '_sample.name'}
-                    expected_files = set('%s%s' % (name, x) for x in expected_suffixes)
-                    expected_files |= {'README', 'README.txt', 'README.md'}
-
-                    convertible_suffixes = {'.data', '.solution'}
-                    convertible_files = set('%s%s' % (name, x) for x in convertible_suffixes)
-
-                    unexpected = content - expected_files
-
-                    minimum = convertible_files - content
-
-                    if len(unexpected) > 0 or len(minimum) > 0:
-                        raise InvalidAutomlFormatException("Unexpected files: %s" % unexpected)
-
-                except fs.InvalidDirectoryException as e:
-                    raise InvalidAutomlFormatException(e) from e
-
-            # TODO Depends of something, we must convert files before the load
-            # convert
-
-            from chalab.convert_to_automl import convert
-            newroot = root
-            for file in convertible_files:
-                newroot = convert(os.path.join(root, file), data_format)
-
-            input, target, metric, description = self.load_from_automl(newroot, any_prefix=True)
-
-            self.name = name
-            self.input = input
-            self.target = target
-            self.description = description
+    def update_from_chalearn(self, fp_zip, data_format='auto', stage=None):
+        """
+        Load the dataset from the archive `fp_zip', converting its files from `data_format'.
+        `stage' is called with the name of each stage as it starts, see IngestionJobModel.
 
-            if metric:
-                self.default_metric = metric
+        The archive is checked before anything is read. Files already in the AutoML
+        format, and libsvm files, go straight from the archive to the storage, the
+        others are extracted to be converted.
+        """
+        stage = stage or (lambda name: None)
 
-            self.save()
+        stage('unzip')
+        try:
+            zf = ZipFile(fp_zip)
+        except BadZipFile as e:
+            raise InvalidAutomlFormatException(e) from e
+
+        with zf:
+            # The labels of libsvm files make the solution, unless there is one.
+            name, found = automl_archive_members(zf, solution=data_format != 'libsvm')
+            metric = description = None
+
+            if data_format == 'automl':
+                stage('load')
+                written = concurrently([partial(written_matrix, partial(zf.open, found[x]),
+                                                name + x)
+                                        for x in ('.data', '.solution')])
+                input, target = saved_matrices(written)
+            elif data_format == 'libsvm':
+                stage('load')
+                has_solution = found['.solution'] is not None
+                with zf.open(found['.data']) as f:
+                    input, target = self.load_from_libsvm(f, name, labels=not has_solution)
+
+                if has_solution:
+                    with zf.open(found['.solution']) as f:
+                        target = MatrixModel.create_from_fileobj(f, name + '.solution')
+            else:
+                with fs.tmp_dir() as d:
+                    root = os.path.join(d, name)
+                    for x in ('.data', '.solution'):
+                        archives.extract_member(zf, found[x], os.path.join(root, name + x))
+
+                    stage('convert')
+                    from chalab.convert_to_automl import convert, detect
+                    data, solution = [os.path.join(root, name + x) for x in ('.data', '.solution')]
+
+                    if data_format == 'auto':
+                        data_format = detect(data).format
+
+                    if data_format == 'libsvm':
+                        stage('load')
+                        with open(data, 'rb') as f:
+                            input, _ = self.load_from_libsvm(f, name, labels=False)
+                        with open(solution, 'rb') as f:
+                            target = MatrixModel.create_from_fileobj(f, name + '.solution')
+                    else:
+                        newroot, solution_root = concurrently(
+                            [partial(convert, data, data_format),
+                             partial(convert, solution, data_format)])
+                        if solution_root != newroot:
+                            os.replace(os.path.join(solution_root, name + '.solution'),
+                                       os.path.join(newroot, name + '.solution'))
+
+                        stage('load')
+                        input, target, metric, description = \
+                            self.load_from_automl(newroot, any_prefix=True)
+
+        self.name = name
+        self.input = input
+        self.target = target
+        self.description = description
+
+        if metric:
+            self.default_metric = metric
+
+        # Only what was loaded, the editor saves the other fields meanwhile.
+        self.save(update_fields=['name', 'input', 'target', 'description', 'default_metric',
+                                 'is_ready', 'updated_at'])
 
     @classmethod
     def create_from_chalearn(cls, path, name, owner=None, is_public=True):
@@ -393,10 +751,37 @@ class DatasetModel(models.Model):
                           default_metric=metric,
                           input=input, target=target)
 
+    @classmethod
+    def load_from_libsvm(cls, fileobj, name, labels=True):
+        """
+        Load the libsvm binary `fileobj' as a sparse input, and its labels as the
+        target unless `labels' is False. The input is profiled as it is converted,
+        the file is only read once.
+        """
+        from chalab.convert_to_automl import InvalidLibsvmException, LibsvmReader
+
+        with tempfile.TemporaryFile() as f_labels:
+            reader = LibsvmReader(fileobj, f_labels if labels else None)
+            try:
+                input = MatrixModel.create_from_fileobj(reader, name + '.data', is_sparse=True)
+            except InvalidLibsvmException as e:
+                raise InvalidAutomlFormatException(e.message) from e
+
+            # The profile doesn't count the columns of sparse matrices.
+            input.cols.count = reader.max_index
+            input.cols.save()
+
+            target = None
+            if labels:
+                f_labels.seek(0)
+                target = MatrixModel.create_from_fileobj(f_labels, name + '.solution')
+
+        return input, target
+
     @classmethod
     def load_from_automl(cls, path, any_prefix=False):
         try:
-            i = load_info_file(chalearn_path(path, '_public.info'))
+            i = load_info_file(chalearn_path(path, '_public.info', any_prefix=any_prefix))
             is_sparse = i.getboolean('is_sparse')
             task, metric = i.get('task'), i.get('metric')
             metric = default_metric(metric, task)
@@ -409,18 +794,33 @@ class DatasetModel(models.Model):
         except:
             description = None
 
-        input = load_chalearn(path, '.data',
-                              is_sparse=is_sparse, any_prefix=any_prefix)
+        # The matrices are written and profiled at the same time, then saved.
+        data, solution = [chalearn_path(path, x, any_prefix=any_prefix)
+                          for x in ('.data', '.solution')]
+        (input, w_input), (target, w_target) = concurrently([
+            partial(written_matrix, partial(open, data, 'rb'), os.path.basename(data),
+                    is_sparse=is_sparse),
+            partial(written_matrix, partial(open, solution, 'rb'), os.path.basename(solution)),
+        ])
 
-        try:
-            cols_type = load_chalearn(path, '_feat.type',
-                                      clss=ColumnarTypesDefinition,
-                                      any_prefix=any_prefix)
-            input.cols.types = cols_type
-        except FileNotFoundError:
-            pass  # It's fine, feat specs are not mandatory.
+        input.use_written(w_input)
+        target.use_written(w_target)
+
+        if is_sparse:
+            try:
+                input.cols.count = i.getint('feat_num')
+            except KeyError:
+                pass  # The columns of the sparse matrix stay unknown.
+
+        for suffix, clss, field in (('_feat.type', ColumnarTypesDefinition, 'types'),
+                                    ('_feat.name', ColumnarNamesDefinition, 'names')):
+            try:
+                setattr(input.cols, field,
+                        load_chalearn(path, suffix, clss=clss, any_prefix=any_prefix))
+            except FileNotFoundError:
+                pass  # It's fine, feat specs are not mandatory.
 
-        target = load_chalearn(path, '.solution', any_prefix=any_prefix)
+        input.cols.save()  # Checks the feat specs against the columns.
 
         input.save()
         target.save()
@@ -463,6 +863,234 @@ class DatasetModel(models.Model):
         return "<%s: \"%s\"; ready=%s>" % (type(self).__name__, self.name, self.is_ready)
 
 
+class IngestionJobModel(models.Model):
+    """
+    The loading of an uploaded archive into a dataset, done by `wizard.tasks.ingest'.
+    The upload is kept until the job is over.
+    """
+    SCHEDULED = 'scheduled'
+    STARTED = 'started'
+    FAILED = 'failed'
+    FINISHED = 'finished'
+
+    STATE_CHOICES = (
+        (SCHEDULED, "Scheduled"),
+        (STARTED, "Started"),
+        (FINISHED, "Finished"),
+        (FAILED, 'Failed'),
+    )
+
+    # Stages of the ingestion, with the progress reached when they start.
+    STAGES = (('unzip', 0), ('convert', 20), ('load', 40))
+
+    dataset = models.ForeignKey(DatasetModel, null=False, related_name='ingestion_jobs')
+    owner = models.ForeignKey(User, null=True)
+
+    state = models.CharField(max_length=10, choices=STATE_CHOICES)
+    stage = models.CharField(max_length=32, default='', blank=True)
+    progress_perc = models.IntegerField(default=0, null=False)
+    error = models.TextField(default='', blank=True)
+
+    upload = models.FileField(null=True, upload_to=save_to_upload)
+    data_format = models.CharField(max_length=16, default='auto')
+
+    created = models.DateTimeField(default=timezone.now)
+    closed = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return "<%s: dataset=%s, state=%s>" \
+               % (type(self).__name__, self.dataset.name, self.get_state_display())
+
+    @classmethod
+    def create(cls, dataset, upload, data_format='auto', owner=None):
+        return cls.objects.create(dataset=dataset, owner=owner,
+                                  state=cls.SCHEDULED,
+                                  upload=upload,
+                                  data_format=data_format)
+
+    def save_unless_done(self, *fields):
+        """
+        Write `fields' unless the job was closed meanwhile, cancelled or timed out,
+        return whether they were. A full `save' would bring a closed job back.
+        """
+        running = type(self).objects.filter(pk=self.pk, state__in=[self.SCHEDULED, self.STARTED])
+        return bool(running.update(**{f: getattr(self, f) for f in fields}))
+
+    def start_stage(self, stage):
+        """
+        Record that the ingestion reached `stage', without saving the rest of the job.
+        Raise IngestionCancelledException if the job was closed meanwhile.
+        """
+        self.stage = stage
+        self.progress_perc = dict(self.STAGES)[stage]
+
+        if not self.save_unless_done('stage', 'progress_perc'):
+            raise IngestionCancelledException('The ingestion was closed during: %s' % stage)
+
+    def close(self, state, error=''):
+        """Close the job with `state' unless it already was, return whether it was."""
+        self.state = state
+        self.error = error
+        self.closed = timezone.now()
+        if state == self.FINISHED:
+            self.progress_perc = 100
+
+        closed = self.save_unless_done('state', 'error', 'closed', 'progress_perc')
+
+        # Whichever closes the job, the upload isn't needed anymore.
+        if self.upload:
+            self.upload.delete(save=False)
+            type(self).objects.filter(pk=self.pk).update(upload=None)
+        return closed
+
+    def cancel(self):
+        """Close the job if it is still scheduled or running, return whether it was."""
+        return self.close(self.FAILED, error='The loading was cancelled.')
+
+    @classmethod
+    def latest(cls, dataset):
+        """
+        The last job of `dataset', or None. A job still not over INGESTION_TIMEOUT
+        seconds after its creation is closed as failed, its worker likely died.
+        """
+        job = cls.objects.filter(dataset=dataset).first()
+
+        timeout = timezone.now() - timedelta(seconds=settings.INGESTION_TIMEOUT)
+        if job is not None and not job.done and job.created < timeout:
+            job.close(job.FAILED, error='The loading took too long, it was given up.')
+            job.refresh_from_db()
+        return job
+
+    @classmethod
+    def in_progress(cls, dataset):
+        """Whether an upload of `dataset' is still being loaded."""
+        job = cls.latest(dataset)
+        return job is not None and not job.done
+
+    @property
+    def progress(self):
+        return {'perc': self.progress_perc,
+                'stage': self.stage}
+
+    @property
+    def done(self):
+        return self.state in {self.FAILED, self.FINISHED}
+
+    class Meta:
+        ordering = ['-created']
+
+
+class InvalidChunkException(Exception):
+    def __init__(self, msg):
+        self.message = msg
+
+
+class ChunkedUploadModel(models.Model):
+    """
+    An archive uploaded chunk by chunk, written in place in the storage.
+
+    Chunks are appended at `offset', checked against their sha256,
+    an interrupted upload resumes from the last chunk received.
+    """
+    dataset = models.ForeignKey(DatasetModel, null=False, related_name='chunked_uploads')
+    owner = models.ForeignKey(User, null=True)
+
+    filename = models.CharField(max_length=256)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0, null=False)
+    data_format = models.CharField(max_length=16, default='auto')
+
+    content = models.FileField(null=True, upload_to=save_to_upload)
+
+    created = models.DateTimeField(default=timezone.now)
+    completed = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return "<%s: %s, %s/%s bytes>" \
+               % (type(self).__name__, self.filename, self.offset, self.size)
+
+    @classmethod
+    def create(cls, dataset, filename, size, data_format='auto', owner=None):
+        u = cls(dataset=dataset, owner=owner, filename=filename, size=size,
+                data_format=data_format)
+
+        with open_for_write(u.content, os.path.basename(filename)):
+            pass  # The chunks are written in place, the file only has to exist.
+
+        u.save()
+        return u
+
+    @property
+    def is_complete(self):
+        return self.completed is not None
+
+    @classmethod
+    def expire(cls, age=timedelta(days=1)):
+        """
+        Remove the uploads started and last written to more than `age' ago, return
+        how many. The partial file of the incomplete ones goes with them, the file
+        of the complete ones belongs to their IngestionJobModel.
+        """
+        before = timezone.now() - age
+        removed = 0
+
+        for u in cls.objects.filter(created__lt=before):
+            if not u.is_complete and u.content and u.content.storage.exists(u.content.name):
+                written = datetime.fromtimestamp(os.path.getmtime(u.content.path), timezone.utc)
+                if written >= before:
+                    continue  # still going on.
+                u.content.delete(save=False)
+
+            u.delete()
+            removed += 1
+
+        return removed
+
+    def append(self, offset, fileobj, sha256, limit):
+        """
+        Write the chunk read from `fileobj' at `offset', at most `limit' bytes.
+        Raise InvalidChunkException if the offset or the checksum do not match.
+        """
+        if self.is_complete:
+            raise InvalidChunkException("The upload is already complete")
+        if offset != self.offset:
+            raise InvalidChunkException("Expected a chunk at offset %s, got %s"
+                                        % (self.offset, offset))
+
+        limit = min(limit, self.size - offset)
+        try:
+            n, digest = write_chunk(self.content.path, offset, fileobj, limit)
+        except ChunkTooLargeException as e:
+            raise InvalidChunkException(e.message) from e
+
+        if digest != sha256.lower():
+            os.truncate(self.content.path, offset)
+            raise InvalidChunkException("The checksum of the chunk does not match")
+
+        # Two requests could write the same chunk, only one of them moves the offset.
+        moved = (type(self).objects
+                 .filter(pk=self.pk, offset=offset, completed__isnull=True)
+                 .update(offset=offset + n))
+        if not moved:
+            raise InvalidChunkException("The chunk at offset %s was already received" % offset)
+
+        self.offset = offset + n
+        if self.offset == self.size:
+            self.completed = timezone.now()
+            self.save(update_fields=['completed'])
+
+    @property
+    def status(self):
+        return {'id': self.pk,
+                'filename': self.filename,
+                'size': self.size,
+                'offset': self.offset,
+                'complete': self.is_complete}
+
+    class Meta:
+        ordering = ['-created']
+
+
 def create_with_file(clss, file_path, **kwargs):
     """
     Helper class to test ColumXXXX and MatrixXXX classes,
@@ -473,8 +1101,8 @@ def create_with_file(clss, file_path, **kwargs):
     try:
         c = clss(**kwargs)
         base_name = os.path.basename(file_path)
-        with open(file_path, 'r') as f:
-            c.raw_content.save(base_name, f)
+        with open(file_path, 'rb') as f:
+            c.raw_content.save(base_name, f, save=False)
             c.save()
         return c
     except Exception as e:
@@ -482,6 +1110,42 @@ def create_with_file(clss, file_path, **kwargs):
         raise e
 
 
+def concurrently(calls, workers=None):
+    """
+    Return the results of the functions `calls', run by at most `workers' threads,
+    INGESTION_CONCURRENCY by default. The first exception raised is raised again.
+
+    The calls must not use the database: each thread would get its own connection,
+    out of the transaction of the caller.
+    """
+    workers = workers or settings.INGESTION_CONCURRENCY
+    if workers <= 1 or len(calls) <= 1:
+        return [fn() for fn in calls]
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(calls))) as pool:
+        futures = [pool.submit(fn) for fn in calls]
+        return [f.result() for f in futures]
+
+
+def written_matrix(open_content, filename, **kwargs):
+    """
+    Write a new MatrixModel from the binary file `open_content()' returns, without
+    storing or saving it: return the model and what `write_content' returned, see
+    `saved_matrices'. The database isn't used, see `concurrently'.
+    """
+    m = MatrixModel(**kwargs)
+    with open_content() as f:
+        return m, m.write_content(f, filename)
+
+
+def saved_matrices(written):
+    """Store and save the matrices `written_matrix' wrote, return the models."""
+    for m, w in written:
+        m.use_written(w)
+        m.save()
+    return [m for m, _ in written]
+
+
 def chalearn_path(path, suffix, any_prefix=False):
     if any_prefix:
         l = fs.ls(path, '*%s' % suffix, glob=True)
@@ -583,10 +1247,17 @@ class TaskModel(models.Model):
 
     def update_from_chalearn(self, path):
         loaded = self.load_from_chalearn(path)
+        replaced = [getattr(self, k) for k in loaded]
+
         for k, v in loaded.items():
             setattr(self, k, v)
         self.save()
 
+        # Deleting the previous splits releases their files, see BlobModel.
+        for m in replaced:
+            if m is not None:
+                m.delete()
+
     @classmethod
     def load_from_chalearn(cls, path):
         train = load_chalearn(path, '_train.data')
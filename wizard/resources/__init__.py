@@ -1,7 +1,34 @@
+import hashlib
 import os
 
 from chalab.tools import fs
 
+_scoring_version = None
+
+
+def scoring_version():
+    """
+    Return a digest of the default scoring program template,
+    it changes whenever one of its files does.
+    """
+    global _scoring_version
+
+    if _scoring_version is None:
+        root = fs.here(__file__, 'default_scoring')
+        h = hashlib.sha256()
+
+        for current, dirs, files in os.walk(root):
+            dirs.sort()
+            for name in sorted(files):
+                p = os.path.join(current, name)
+                h.update(os.path.relpath(p, root).encode('utf-8'))
+                with open(p, 'rb') as f:
+                    h.update(hashlib.sha256(f.read()).digest())
+
+        _scoring_version = h.hexdigest()
+
+    return _scoring_version
+
 
 def build_default_scoring(metric, dest):
     p = fs.here(__file__, 'default_scoring')
@@ -1,6 +1,45 @@
+import logging
+import traceback
+
 from celery import shared_task
+from django.core.exceptions import ValidationError
+
+from .models import IngestionCancelledException, InvalidAutomlFormatException
+
+log = logging.getLogger('wizard.tasks')
 
 
 @shared_task
 def smoke(x):
     return x
+
+
+@shared_task
+def ingest(job):
+    """
+    Load the upload of the IngestionJobModel `job' into its dataset. A job closed
+    meanwhile, cancelled or timed out, stops at the next stage.
+    """
+    job.state = job.STARTED
+    if not job.save_unless_done('state'):
+        log.info('Ingestion of %s closed before it started', job.dataset)
+        return
+
+    try:
+        try:
+            job.upload.open('rb')
+            job.dataset.update_from_chalearn(job.upload, job.data_format, stage=job.start_stage)
+        finally:
+            job.upload.close()
+    except IngestionCancelledException as e:
+        log.info('%s', e)
+        job.close(job.FAILED)
+    except InvalidAutomlFormatException as e:
+        job.close(job.FAILED, error=str(e))
+    except ValidationError as e:
+        job.close(job.FAILED, error=' '.join(e.messages))
+    except Exception as e:
+        log.error('Ingestion of %s failed:\n%s', job.dataset, traceback.format_exc())
+        job.close(job.FAILED, error='Exception: %r' % e)
+    else:
+        job.close(job.FINISHED)
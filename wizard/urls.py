@@ -10,6 +10,10 @@ challenge_wizard = [
 
     url(r'^data/pick$', views.data_picker, name='data.pick'),
     url(r'^data/$', views.ChallengeDataEdit.as_view(), name='data'),
+    url(r'^data/status\.json$', views.data_status_json, name='data.status_json'),
+    url(r'^data/cancel$', views.data_cancel, name='data.cancel'),
+    url(r'^data/uploads$', views.data_upload, name='data.upload'),
+    url(r'^data/uploads/(?P<upload_id>\d+)$', views.data_upload_chunk, name='data.upload.chunk'),
 
     url(r'^task/$', views.ChallengeTaskUpdate.as_view(), name='task'),
 
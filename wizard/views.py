@@ -1,12 +1,16 @@
 import logging
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import ProtectedError
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
+from django.utils.html import escape
+from django.views.decorators.http import require_POST
 from django.views.generic import CreateView
 from django.views.generic import DetailView
 from django.views.generic import UpdateView
@@ -17,8 +21,10 @@ from . import models, flow
 from .flow import FlowOperationMixin
 from .forms import ProtocolForm, DataUpdateAndUploadForm, DataUpdateForm
 from .models import ChallengeModel, DatasetModel, TaskModel, MetricModel, ProtocolModel, \
-    DocumentationModel, DocumentationPageModel, BaselineModel, InvalidAutomlFormatException
+    DocumentationModel, DocumentationPageModel, BaselineModel, IngestionJobModel, \
+    ChunkedUploadModel, InvalidChunkException
 from .models import challenge_to_mappings, challenge_to_mappings_doc
+from .tasks import ingest
 
 log = logging.getLogger('wizard.views')
 log.setLevel(logging.INFO)
@@ -124,6 +130,26 @@ class ChallengeBaselineEdit(FlowOperationMixin, LoginRequiredMixin, UpdateView):
         return baseline
 
 
+def dataset_is_locked(dataset, user):
+    """Whether `user' can't edit `dataset': not theirs, or ready and used by other challenges."""
+    dataset_users = len(ChallengeModel.objects.filter(dataset=dataset))
+    return dataset.owner != user or (dataset.is_ready and dataset_users > 1)
+
+
+def data_form(form_class, disabled, **kwargs):
+    """The form editing a dataset, with all its fields `disabled' but the name always."""
+    form = form_class(**kwargs)
+
+    for f in form.fields.keys():
+        form.fields[f].disabled = disabled
+    form.disabled = disabled
+
+    if 'name' in form.fields:
+        form.fields['name'].disabled = True
+
+    return form
+
+
 class ChallengeDataEdit(FlowOperationMixin, LoginRequiredMixin, UpdateView):
     template_name = 'wizard/data/editor.html'
     model = DatasetModel
@@ -133,23 +159,15 @@ class ChallengeDataEdit(FlowOperationMixin, LoginRequiredMixin, UpdateView):
 
     @property
     def disabled(self):
-        dataset_users = len(ChallengeModel.objects.filter(dataset=self.object))
-        return self.object.owner != self.request.user or (self.object.is_ready and dataset_users > 1)
+        return dataset_is_locked(self.object, self.request.user)
 
     def get_form(self, form_class=None):
         if self.object.is_public:
-            form = super().get_form(form_class=DataUpdateForm)
+            form_class = DataUpdateForm
         else:
-            form = super().get_form(form_class=form_class)
+            form_class = form_class or self.get_form_class()
 
-        for f in form.fields.keys():
-            form.fields[f].disabled = self.disabled
-        form.disabled = self.disabled
-
-        if 'name' in form.fields:
-            form.fields['name'].disabled = True
-
-        return form
+        return data_form(form_class, self.disabled, **self.get_form_kwargs())
 
     def form_valid(self, form):
         if self.disabled:
@@ -157,24 +175,22 @@ class ChallengeDataEdit(FlowOperationMixin, LoginRequiredMixin, UpdateView):
                                           "Forbidden edit on a dataset",
                                           """You can't edit a dataset that you do not own.""")
         else:
+            u = self.request.FILES.get('automl_upload', None)
 
-            if not self.disabled and self.request.FILES:
-                u = self.request.FILES.get('automl_upload', None)
-
-                if 'data_format' in self.request.POST:
-                    data_format = self.request.POST['data_format']
-                else:
-                    data_format = 'auto'
-
-                try:
-                    self.object.update_from_chalearn(u, data_format)
-                except InvalidAutomlFormatException as e:
-                    raise errors.HTTP400Exception('wizard/challenge/error.html',
-                                                  "Invalid Automl archive",
-                                                  AUTOML_ERROR % (e,))
+            if u is not None and IngestionJobModel.in_progress(self.object):
+                raise errors.HTTP400Exception('wizard/challenge/error.html',
+                                              "Dataset upload in progress",
+                                              """The previous archive is still being loaded.""")
 
+            # Saved first: the ingestion task updates the dataset concurrently.
             r = super().form_valid(form)
 
+            if u is not None:
+                data_format = self.request.POST.get('data_format', 'auto')
+                job = IngestionJobModel.create(self.object, u, data_format,
+                                               owner=self.request.user)
+                ingest.delay(job)
+
             return r
 
     def get_success_url(self):
@@ -187,6 +203,11 @@ class ChallengeDataEdit(FlowOperationMixin, LoginRequiredMixin, UpdateView):
         context = super().get_context_data(challenge=c, **kwargs)
         context['challenge'] = c
         context['is_ready'] = self.object.is_ready
+
+        job = IngestionJobModel.latest(self.object)
+        context['ingestion'] = job
+        if job is not None and job.state == job.FAILED:
+            context['ingestion_error'] = AUTOML_ERROR % (escape(job.error),)
         return context
 
     def get_object(self, **kwargs):
@@ -328,6 +349,122 @@ def data_picker(request, pk, cant_delete=False):
         return render(request, 'wizard/data/picker.html', context=context)
 
 
+@login_required
+@require_POST
+def data_upload(request, pk):
+    """
+    Start the chunked upload of a dataset archive, from the `filename', `size'
+    and `data_format' fields. The chunks then go to `data_upload_chunk'.
+
+    The other fields of the dataset editor come along, they are saved as by
+    a regular post of the form. With `resume', the id of an upload that isn't
+    complete, that upload goes on instead of a new one.
+    """
+    c = get_object_or_404(ChallengeModel, id=pk, created_by=request.user)
+
+    if c.dataset is None or dataset_is_locked(c.dataset, request.user):
+        return JsonResponse({'error': "You can't edit this dataset."}, status=403)
+    if IngestionJobModel.in_progress(c.dataset):
+        return JsonResponse({'error': "The previous archive is still being loaded."}, status=409)
+
+    form = data_form(DataUpdateAndUploadForm, False, data=request.POST, instance=c.dataset)
+    if not form.is_valid():
+        errors = ['%s: %s' % (k, ' '.join(v)) for k, v in sorted(form.errors.items())]
+        return JsonResponse({'error': ' '.join(errors)}, status=400)
+
+    if 'resume' in request.POST:
+        u = get_object_or_404(ChunkedUploadModel, id=request.POST['resume'], dataset=c.dataset,
+                              owner=request.user, completed__isnull=True)
+        form.save()
+        return JsonResponse(dict(u.status, chunk_size=settings.UPLOAD_CHUNK_SIZE))
+
+    try:
+        filename, size = request.POST['filename'], int(request.POST['size'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': "The filename and size of the archive are required."},
+                            status=400)
+
+    if size <= 0:
+        return JsonResponse({'error': "The archive is empty."}, status=400)
+
+    form.save()
+    u = ChunkedUploadModel.create(c.dataset, filename, size,
+                                  data_format=request.POST.get('data_format', 'auto'),
+                                  owner=request.user)
+
+    return JsonResponse(dict(u.status, chunk_size=settings.UPLOAD_CHUNK_SIZE), status=201)
+
+
+@login_required
+def data_upload_chunk(request, pk, upload_id):
+    """
+    GET the offset an upload is at, or POST the raw chunk starting at this offset.
+
+    The chunk comes with the `Upload-Offset' and `Upload-Checksum' (sha256, hex)
+    headers. The archive is loaded in the dataset once the last chunk is received.
+    """
+    c = get_object_or_404(ChallengeModel, id=pk, created_by=request.user)
+    u = get_object_or_404(ChunkedUploadModel, id=upload_id, dataset=c.dataset,
+                          owner=request.user)
+
+    if request.method == 'GET':
+        return JsonResponse(u.status)
+    elif request.method != 'POST':
+        return HttpResponseNotAllowed(['GET', 'POST'])
+
+    try:
+        offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+        sha256 = request.META['HTTP_UPLOAD_CHECKSUM']
+    except (KeyError, ValueError):
+        return JsonResponse(dict(u.status, error="The Upload-Offset and Upload-Checksum "
+                                                 "headers are required."), status=400)
+
+    try:
+        # The body is streamed to the storage, Django doesn't buffer it.
+        u.append(offset, request, sha256, settings.UPLOAD_CHUNK_SIZE)
+    except InvalidChunkException as e:
+        u.refresh_from_db(fields=['offset', 'completed'])
+        status = 409 if offset != u.offset else 400
+        return JsonResponse(dict(u.status, error=e.message), status=status)
+
+    if u.is_complete:
+        job = IngestionJobModel.create(c.dataset, u.content.name, u.data_format,
+                                       owner=request.user)
+        ingest.delay(job)
+
+    return JsonResponse(u.status)
+
+
+@login_required
+@require_POST
+def data_cancel(request, pk):
+    """Give up the loading of the last upload, the worker stops at its next stage."""
+    c = get_object_or_404(ChallengeModel, id=pk, created_by=request.user)
+    job = IngestionJobModel.latest(c.dataset)
+
+    if job is None or not job.cancel():
+        raise errors.HTTP400Exception('wizard/challenge/error.html', 'no upload in progress',
+                                      """There is no archive being loaded to cancel.""",
+                                      challenge=c)
+
+    return redirect(reverse('wizard:challenge:data', kwargs={'pk': pk}))
+
+
+@login_required
+def data_status_json(request, pk):
+    c = get_object_or_404(ChallengeModel, id=pk, created_by=request.user)
+    job = IngestionJobModel.latest(c.dataset)
+
+    if job is None:
+        raise Http404('No dataset upload for this challenge')
+
+    return JsonResponse({'state': job.state,
+                         'created': job.created,
+                         'closed': job.closed,
+                         'progress': job.progress,
+                         'error': job.error})
+
+
 def metric(request, pk):
     c = get_object_or_404(ChallengeModel, id=pk, created_by=request.user)
 